@@ -6,12 +6,19 @@ Creates the "ceda_all_datasets.ini" file that lists
 all "/data" directories under "/badc" and "/neodc"
 and other directories such as /edc.
 
+Also writes a snapshot of the spot mapping next to it
+("ceda_all_datasets.ini.snapshot") which scan jobs load
+rather than downloading the mapping themselves. The
+snapshot leaves out the spots which SpotMapping does
+not use to find the spot of a file.
+
 """
 
-import requests
 import os
 import sys
 
+from fbs.proc.common_util.spot_mapping import SpotMapping, snapshot_path
+
 
 def use_data_dir(path):
     """
@@ -32,19 +39,16 @@ def use_data_dir(path):
 OUTPUT_FILE = sys.argv[1]
 
 # Download the spot mappings from the cedaarchiveapp
-url = "http://cedaarchiveapp.ceda.ac.uk/cedaarchiveapp/fileset/download_conf/"
-print( "Downloading spotlist from %s" % url)
-response = requests.get(url)
-log_mapping = response.text.split('\n')
+print( "Downloading spotlist from %s" % SpotMapping.url)
+spots = SpotMapping(exclude=())
 
 # Create output list as a set to make sure each entry is unique
 output_list = set()
 
 print( "Creating output list")
-for line in log_mapping:
-    if not line.strip(): continue
-    spot, directory = line.strip().split()
-    
+for spot in spots:
+    directory = spots.get_archive_root(spot)
+
     # Only add path to output list if it is a real directory
     if os.path.exists(directory):    
         # path = use_data_dir(directory)
@@ -57,6 +61,10 @@ with open(OUTPUT_FILE,'w') as output:
     outputlist = map(lambda x: x+"\n", sorted(output_list))
     output.writelines(outputlist)
 
+print( "Writing snapshot")
+path2spot = {spots.get_archive_root(spot): spot for spot in spots if spot not in SpotMapping.EXCLUDED_SPOTS}
+SpotMapping(path2spot=path2spot).write_snapshot(snapshot_path(os.path.abspath(OUTPUT_FILE)))
+
 
 
 
@@ -24,7 +24,8 @@ Options:
   --host=<hostname>                          The name of the host where
                                              the script will run.
 
-  --followlinks                              Follow symlinks in the os walk
+  --followlinks                              Follow symlinks to directories when
+                                             walking the datasets.
  """
 
 import os
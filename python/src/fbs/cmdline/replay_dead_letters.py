@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+Usage:
+  replay_dead_letters.py -h | --help
+  replay_dead_letters.py --version
+  replay_dead_letters.py (-f <filename> | --filename <filename>)
+                         [-i <index> | --index <index>]
+                         [-c <path_to_config_dir> | --config <path_to_config_dir>]
+
+Options:
+  -h --help                           Show this screen.
+
+  --version                           Show version.
+
+  -f --filename=<filename>            NDJSON dead-letter file written by
+                                      scan_dataset.py.
+
+  -i --index=<index>                  Send the documents to this index
+                                      instead of the original one.
+
+  -c --config=<path_to_config_dir>    Specify the main configuration directory.
+ """
+
+import os
+import shutil
+
+from docopt import docopt
+
+import fbs.proc.common_util.util as util
+from cmdline import __version__  # Grab version from package __init__.py
+from es_iface.factory import ElasticsearchClientFactory
+from es_iface.bulk import BulkSender, DeadLetterFile
+import datetime
+
+
+def get_config(com_args):
+    """
+    Read the configuration file and apply the command line arguments.
+    """
+
+    # Searches for the configuration file.
+    if 'config' not in com_args or not com_args["config"]:
+        direc = os.path.dirname(__file__)
+        conf_path = os.path.join(direc, "../../../config/ceda_fbs.ini")
+        com_args["config"] = conf_path
+
+    return util.get_settings(com_args["config"], com_args)
+
+
+def read_actions(filename, index=None):
+    """
+    Read the actions from the dead-letter file, optionally
+    changing the index they are sent to.
+    """
+
+    for action in DeadLetterFile.read(filename):
+        if index:
+            action['_index'] = index
+        yield action
+
+
+def prepare_replay_file(dead_letter_file, replay_file):
+    """
+    Move the dead-letter file out of the way so that any failures can be
+    written back to the original path. A replay file left by an earlier
+    replay which did not finish still holds documents which may not have
+    been sent, so the new dead letters are added to it rather than
+    replacing it.
+
+    :return: True if there are documents to replay
+    """
+
+    if not os.path.exists(replay_file):
+        if not os.path.exists(dead_letter_file):
+            return False
+
+        os.rename(dead_letter_file, replay_file)
+        return True
+
+    print("Resuming the unfinished replay in: %s" % replay_file)
+
+    if os.path.exists(dead_letter_file):
+        with open(dead_letter_file) as reader, open(replay_file, "a") as writer:
+            shutil.copyfileobj(reader, writer)
+
+        os.remove(dead_letter_file)
+
+    return True
+
+
+def replay(config):
+    """
+    Send the documents in the dead-letter file to Elasticsearch.
+    Documents which fail again are written back to the same file.
+    """
+
+    dead_letter_file = config["filename"]
+    replay_file = dead_letter_file + ".replaying"
+    es_conf = config["es-configuration"]
+
+    if not prepare_replay_file(dead_letter_file, replay_file):
+        print("No dead-letter file found at: %s" % dead_letter_file)
+        return
+
+    es = ElasticsearchClientFactory().get_client(config)
+
+    sender = BulkSender(
+        es,
+        senders=int(es_conf.get("bulk-senders") or 1),
+        max_retries=int(es_conf.get("bulk-max-retries") or 5),
+        initial_backoff=float(es_conf.get("bulk-initial-backoff") or 2),
+        max_backoff=float(es_conf.get("bulk-max-backoff") or 600),
+        dead_letter_file=dead_letter_file
+    )
+
+    # If the sender fails the replay file is kept and the next replay
+    # carries on from it.
+    with sender:
+        sender.send_all(read_actions(replay_file, config.get("index")))
+
+    # Every document has now been indexed or written back to the dead-letter file
+    os.remove(replay_file)
+
+    print("Documents indexed: %s, failed: %s" % (sender.succeeded, sender.failed))
+    if sender.failed:
+        print("Failed documents written to: %s" % dead_letter_file)
+
+
+def main():
+
+    start = datetime.datetime.now()
+    print("Script started at: %s" % start)
+
+    # Get command line arguments.
+    com_args = util.sanitise_args(docopt(__doc__, version=__version__))
+    config = get_config(com_args)
+
+    replay(config)
+
+    end = datetime.datetime.now()
+    print("Script ended at : %s it ran for : %s" % (end, end - start))
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""
+Runs one command from a manifest written by LotusRunner. Submitted as a
+Slurm array job, each task runs the line given by its SLURM_ARRAY_TASK_ID.
+
+Usage:
+  run_array_task.py --help
+  run_array_task.py --version
+  run_array_task.py <manifest> [<offset>] [--task-id <task_id>]
+
+Options:
+  --help                                     Show this screen.
+  --version                                  Show version.
+  <manifest>                                 File holding one command per line.
+  <offset>                                   Line of the manifest run by array
+                                             task 0 (defaults to 0).
+  --task-id=<task_id>                        Task to run, instead of the
+                                             SLURM_ARRAY_TASK_ID variable.
+"""
+
+import os
+import sys
+
+from docopt import docopt
+import fbs.proc.common_util.util as util
+from cmdline import __version__  # Grab version from package __init__.py
+
+
+def get_command(manifest, offset, task_id):
+    """
+    Returns the command on line offset + task_id of the manifest.
+    """
+
+    line = int(offset) + int(task_id)
+
+    for command in util.read_list_slice(manifest, line, 1):
+        return command
+
+    raise IndexError("No line %s in manifest %s" % (line, manifest))
+
+
+def main():
+
+    com_args = util.sanitise_args(docopt(__doc__, version=__version__))
+
+    task_id = com_args.get("task-id") or os.environ.get("SLURM_ARRAY_TASK_ID")
+    if task_id is None:
+        sys.exit("SLURM_ARRAY_TASK_ID is not set, give --task-id")
+
+    command = get_command(com_args["manifest"], com_args.get("offset") or 0, task_id)
+    print("Running task %s: %s" % (task_id, command))
+    sys.stdout.flush()
+
+    # Replace this process so that signals from the scheduler reach the command.
+    os.execv("/bin/sh", ["/bin/sh", "-c", command])
+
+
+if __name__ == '__main__':
+
+    main()
@@ -5,6 +5,8 @@ Usage:
   run_commands_in_lotus.py --help
   run_commands_in_lotus.py --version
   run_commands_in_lotus.py (-f <filename> | --filename <filename>)
+                           [-N <max_concurrent> | --max-concurrent <max_concurrent>]
+                           [--array-size <array_size>]
 
 Options:
   --help                                     Show this screen.
@@ -12,6 +14,10 @@ Options:
   -f --filename=<filename>                   File from where the dataset
                                              will be read
                                              [default: datasets.ini].
+  -N --max-concurrent=<max_concurrent>       Most commands to run at once in
+                                             each array job [default: 128].
+  --array-size=<array_size>                  Most commands in one array job
+                                             [default: 10000].
 """
 
 from docopt import docopt
@@ -30,7 +36,9 @@ def main():
     com_args = util.sanitise_args(docopt(__doc__, version=__version__))
     commands_file = com_args["filename"]
 
-    lotus_runner = util.LotusRunner(queue='short-serial')
+    lotus_runner = util.LotusRunner(queue='short-serial',
+                                    max_concurrent=int(com_args["max-concurrent"]),
+                                    max_array_size=int(com_args["array-size"]))
     lotus_runner.run_tasks_file_in_lotus(commands_file)
 
     end = datetime.datetime.now()
@@ -9,11 +9,15 @@ Usage:
                   (-l <level> | --level <level>)
                   (-h <hostname> | --host <hostname>)
                   [-c <path_to_config_dir> | --config <path_to_config_dir>]
+                  [-j <jobs> | --jobs <jobs>] [--retries <retries>]
  scan_archive.py  (-f <file_paths_dir> | --file-paths-dir <file_paths_dir>)
                   (-l <level> | --level <level>)
                   (-h <hostname> | --host <hostname>)
                   [-n <n_files> | --num-files <n_files>]
                   [-c <path_to_config_dir> | --config <path_to_config_dir>]
+                  [-t <hours> | --target-hours <hours>]
+                  [-j <jobs> | --jobs <jobs>] [--retries <retries>]
+                  [-q <queue_dir> | --queue <queue_dir>]
 
 Options:
   --help                                     Show this screen.
@@ -31,11 +35,23 @@ Options:
                                              configuration directory.
   -n --num-files=<n_files>                   Number of files to scan.
   -h --host=<hostname>                       The name of the host where
-                                             the script will run.
+                                             the script will run: lotus,
+                                             localhost or queue. With queue the
+                                             slices are added to the --queue
+                                             directory for scan_worker.py.
+  -t --target-hours=<hours>                  Plan jobs which are each expected
+                                             to take this long, using the
+                                             throughput of earlier scans. Jobs
+                                             hold at most --num-files files.
+  -j --jobs=<jobs>                           Number of commands to run at once
+                                             with --host localhost [default: 1].
+  --retries=<retries>                        Times to rerun a command which fails
+                                             with --host localhost [default: 2].
+  -q --queue=<queue_dir>                     Queue directory used with --host queue
+                                             [default: scan_queue].
  """
 
 import os
-import six
 from docopt import docopt
 
 import fbs.proc.common_util.util as util
@@ -44,6 +60,9 @@ from cmdline import __version__  # Grab version from package __init__.py
 import datetime
 import subprocess
 import fbs.proc.constants.constants as constants
+import fbs.proc.planner as planner
+from fbs.proc.throughput import ThroughputStats
+from fbs.proc.chunk_queue import ChunkQueue
 from tqdm import tqdm
 
 SCRIPT_DIR = os.path.realpath(os.path.dirname(__file__))
@@ -80,6 +99,8 @@ def get_stat_and_defs(com_args):
         status_and_defaults.append(constants.Script_status.RUN_SCRIPT_IN_LOTUS)
     elif ("host" in config) and config["host"] == "localhost":
         status_and_defaults.append(constants.Script_status.RUN_SCRIPT_IN_LOCALHOST)
+    elif ("host" in config) and config["host"] == "queue":
+        status_and_defaults.append(constants.Script_status.RUN_SCRIPT_IN_QUEUE)
     else:
         status_and_defaults.append(constants.Script_status.STAY_IDLE)
 
@@ -135,55 +156,100 @@ def read_and_scan_datasets_sub_in_lotus(config):
         subprocess.call(command, shell=True)
 
 
-def read_datasets_from_files_and_scan_in_lotus(config):
+def _list_files(file_paths_dir):
+    """
+    Returns the file lists in the directory, leaving out their offset indexes.
+    """
+    return [filename for filename in util.build_file_list(file_paths_dir)
+            if not filename.endswith((util.LIST_INDEX_SUFFIX, util.LIST_SIZES_SUFFIX))]
 
+
+def _list_slices(config):
     """
-    basic algorithm:
+    Cut each file list in the directory into the slices scanned by one
+    scan_dataset.py command.
 
-    1. Go to the directory containing the files.
-    2. Create a file list.
-    3. Scan each file and determine the number of lines contained.
-    4. create the appropriate commands.
-    5. Store commands in a list.
-    6. Go to the next file.
-    7. Submit all commands in lotus.
+    :return: Generator of (file list, start, number of files)
     """
 
     #Get basic options.
     file_paths_dir = config["file-paths-dir"]
     level = config["level"]
-    num_files = config["num-files"]
-    start = config["start"]
-
+    step = int(config["num-files"])
 
     # Go to directory and create the file list.
-    list_of_cache_files = sorted(util.build_file_list(file_paths_dir))
-    commands = []
-    step = int(num_files)
+    list_of_cache_files = sorted(_list_files(file_paths_dir))
+
+    # Jobs are planned to take the target time when it is given.
+    target_hours = config.get("target-hours")
+    if target_hours:
+        model = _cost_model(config, level)
 
     for filename in tqdm(list_of_cache_files):
-        num_of_lines = util.find_num_lines_in_file(filename)
+
+        if target_hours:
+            for start, count, _ in planner.plan_slices(filename, level, float(target_hours) * 3600, step, model):
+                yield filename, start, count
+            continue
+
+        num_of_lines = util.count_list_lines(filename)
 
         if num_of_lines == 0:
             continue
 
         # Calculate number of jobs.
-        number_of_jobs = num_of_lines / int(num_files)
-        remainder = num_of_lines % int(num_files)
+        number_of_jobs = num_of_lines // step
+        remainder = num_of_lines % step
 
         start = 0
-        for i in range(int(number_of_jobs)):
-            _add_scan_cmd_to_list(filename, step, start, level, commands)
+        for i in range(number_of_jobs):
+            yield filename, start, step
             start += step
 
         # Include remaining files
         if remainder > 0:
-            _add_scan_cmd_to_list(filename, remainder, start, level, commands)
+            yield filename, start, remainder
+
+
+def read_datasets_from_files_and_scan_in_lotus(config):
+
+    """
+    basic algorithm:
+
+    1. Go to the directory containing the files.
+    2. Create a file list.
+    3. Scan each file and determine the number of lines contained.
+    4. create the appropriate commands.
+    5. Store commands in a list.
+    6. Go to the next file.
+    7. Submit all commands in lotus.
+    """
+
+    level = config["level"]
+    commands = []
+
+    for filename, start, num_files in _list_slices(config):
+        _add_scan_cmd_to_list(filename, num_files, start, level, commands)
 
     # Write each command to a file - which can then be issued to LOTUS
     util.write_list_to_file(commands, "lotus_commands.txt")
 
 
+def _cost_model(config, level):
+    """
+    Cost model built from the throughput recorded by earlier scans.
+    Without any records the lists are cut into --num-files slices.
+    """
+    stats_dir = os.path.join(config["core"]["log-path"], "throughput")
+    model = ThroughputStats.load_dir(stats_dir).model(level)
+
+    if model is None:
+        print("No throughput recorded in %s for level %s, using slices of %s files."
+              % (stats_dir, level, config["num-files"]))
+
+    return model
+
+
 def _add_scan_cmd_to_list(filename, num_files, start, level, commands_list):
 
     command = f"{SCRIPT_DIR}/scan_dataset.py -f {filename} --num-files {num_files} --start {start} -l {level}" \
@@ -207,47 +273,26 @@ def scan_datasets_in_lotus(config, scan_status):
     elif scan_status == constants.Script_status.READ_DATASET_FROM_FILE_AND_SCAN:
         read_datasets_from_files_and_scan_in_lotus(config)
 
+def _local_runner(config):
+    """
+    Runner for the commands on this host.
+    """
+    return util.LocalRunner(max_concurrent=int(config["jobs"]), retries=int(config["retries"]))
+
+
 def read_datasets_from_files_and_scan_in_localhost(config):
 
-    #Get basic options.
-    file_paths_dir = config["file-paths-dir"]
     level = config["level"]
-    num_files = config["num-files"]
-    start = config["start"]
-
-    #Go to directory and create the file list.
-    list_of_cache_files = util.build_file_list(file_paths_dir)
     commands = []
-    step = int(num_files)
-
-    for filename in list_of_cache_files:
-
-        num_of_lines = util.find_num_lines_in_file(filename)
-
-        if num_of_lines == 0: continue
-
-        #calculate number of jobs.
-        number_of_tasks = num_of_lines  / int(num_files)
-        remainder = num_of_lines  % int(num_files)
 
-        start = 0
-        for i in range(0, number_of_tasks):
-            command = " python %s/scan_dataset.py -f %s --num-files %s  --start %d  -l %s" \
-                        % (SCRIPT_DIR, filename, num_files, start, level)
-            start += step
-            commands.append(command)
+    for filename, start, num_files in _list_slices(config):
+        command = "python %s/scan_dataset.py -f %s --num-files %d --start %d -l %s -c %s" \
+                  % (SCRIPT_DIR, filename, num_files, start, level, config["config"])
+        commands.append(command)
 
-        #include remaining files
-        if remainder > 0:
-            command = "python %s/scan_dataset.py -f %s --num-files %d  --start %d -l %s" \
-                      % (SCRIPT_DIR, filename, remainder, start, level)
-            commands.append(command)
+    # Run the commands in localhost.
+    _local_runner(config).run_tasks(commands)
 
-    # Run each command in localhost.
-    number_of_commands = len(commands)
-    for i in range(0, number_of_commands):
-        print( "Executing command : %s" %(commands[i]))
-        subprocess.call(commands[i], shell=True)
 
 def scan_datasets_in_localhost(config, scan_status):
 
@@ -260,38 +305,44 @@ def scan_datasets_in_localhost(config, scan_status):
     level = config["level"]
 
     # Manage the options given.
+    if scan_status == constants.Script_status.READ_DATASET_FROM_FILE_AND_SCAN:
+        read_datasets_from_files_and_scan_in_localhost(config)
+        return
+
     if scan_status == constants.Script_status.READ_AND_SCAN_DATASETS_SUB:
-        dataset_id = config["dataset"]
-        if ',' in dataset_id:
-            dataset_ids_list = dataset_id.split(",")
-            for dataset_id_item in dataset_ids_list:
-                command = "python %s/scan_dataset.py -f %s -d %s -l %s"\
-                          % (SCRIPT_DIR, filename, dataset_id_item, level)
+        dataset_ids = config["dataset"].split(",")
 
+    elif scan_status == constants.Script_status.READ_AND_SCAN_DATASETS:
+        dataset_ids = list(util.find_dataset(file_paths_dir, "all"))
 
-                print( "executng : %s" %(command))
-                subprocess.call(command, shell=True)
-        else:
-            command = "python %s/scan_dataset.py -f %s -d %s -l %s" \
-                      % (SCRIPT_DIR, filename, dataset_id, level)
+    else:
+        return
 
+    commands = ["python %s/scan_dataset.py -f %s -d %s -l %s -c %s"
+                % (SCRIPT_DIR, file_paths_dir, dataset_id, level, config["config"])
+                for dataset_id in dataset_ids]
 
-            print( "executng : %s"  %(command))
-            subprocess.call(command, shell=True)
+    _local_runner(config).run_tasks(commands)
 
-    elif scan_status == constants.Script_status.READ_AND_SCAN_DATASETS:
-        dataset_ids = util.find_dataset(file_paths_dir, "all")
 
-        for key, value in six.iteritems(dataset_ids):
-            dataset_id = key
-            command = "python %s/scan_dataset.py -f %s -d  %s -l %s"\
-                        % (SCRIPT_DIR, filename, dataset_id, level)
+def read_datasets_from_files_and_queue(config, scan_status):
 
-            print( "executng : %s" %(command))
-            subprocess.call(command, shell=True)
+    """
+    Adds the list slices to a queue read by scan_worker.py.
+    """
 
-    elif scan_status == constants.Script_status.READ_DATASET_FROM_FILE_AND_SCAN:
-        read_datasets_from_files_and_scan_in_localhost(config)
+    if scan_status != constants.Script_status.READ_DATASET_FROM_FILE_AND_SCAN:
+        print( "Only scans of file lists can be queued.")
+        return
+
+    queue = ChunkQueue(config["queue"])
+    queued = 0
+
+    for filename, start, num_files in _list_slices(config):
+        queue.put(filename, start, num_files, config["level"])
+        queued += 1
+
+    print( "Added %s slices to queue %s." % (queued, config["queue"]))
 
 
 def main():
@@ -318,6 +369,9 @@ def main():
     elif run_status == constants.Script_status.RUN_SCRIPT_IN_LOCALHOST:
         scan_datasets_in_localhost(config_file, scan_status)
 
+    elif run_status == constants.Script_status.RUN_SCRIPT_IN_QUEUE:
+        read_datasets_from_files_and_queue(config_file, scan_status)
+
     else:
         print( "Some options could not be recognized.\n")
 
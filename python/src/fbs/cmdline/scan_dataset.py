@@ -8,16 +8,26 @@ Usage:
                   (-d <dataset_id> | --dataset <dataset_id> )
                   (-l <level> | --level <level>)
                   [-c <path_to_config_dir> | --config <path_to_config_dir>]
+                  [--followlinks]
+                  [-p <processes> | --processes <processes>]
+                  [--max-in-flight <max_in_flight>]
+                  [--sandbox [--file-timeout <seconds>] [--memory-limit <MB>] [--worker-max-files <n>]]
+                  [--incremental]
   scan_dataset.py (-f <filename> | --filename <filename>)
                   (-d <dataset_id> | --dataset <dataset_id>)
                   (-m <location> | --make-list <location>)
                   [-c <path_to_config_dir> | --config <path_to_config_dir>]
+                  [--followlinks]
   scan_dataset.py (-f <filename> | --filename <filename>)
                   [-n <n_files> | --num-files <n_files>]
                   [-s <start_number> | --start <start_number>]
                   (-l <level> | --level <level>)
                   [-i <index> | --index <index>]
                   [-c <path_to_config_dir> | --config <path_to_config_dir>]
+                  [-p <processes> | --processes <processes>]
+                  [--max-in-flight <max_in_flight>]
+                  [--sandbox [--file-timeout <seconds>] [--memory-limit <MB>] [--worker-max-files <n>]]
+                  [--incremental]
                   [--calculate_md5 ]
 
 Options:
@@ -48,6 +58,35 @@ Options:
 
   -i --index=<index>                  The index to update
 
+  --followlinks                       Descend into symbolic links to
+                                      directories when walking the dataset.
+
+  -p --processes=<processes>          Number of worker processes used to
+                                      extract metadata.
+
+  --max-in-flight=<max_in_flight>     Maximum number of files submitted to
+                                      the worker processes at any one time
+                                      (defaults to 4 x processes).
+
+  --sandbox                           Run the file handlers in recyclable
+                                      worker processes. A file which crashes
+                                      or hangs its handler is indexed at
+                                      level 1 and the scan carries on.
+
+  --file-timeout=<seconds>            Seconds a sandboxed handler may take
+                                      to read one file.
+
+  --memory-limit=<MB>                 Address space limit of each sandbox
+                                      worker in megabytes.
+
+  --worker-max-files=<n>              Number of files each sandbox worker
+                                      reads before it is replaced.
+
+  --incremental                       Only extract and index files which
+                                      are new, have changed since they were
+                                      indexed, or were indexed at a lower
+                                      level.
+
   --calculate-md5                     Calculate md5 checksums on scan
  """
 
@@ -57,7 +96,7 @@ from docopt import docopt
 
 import fbs.proc.common_util.util as util
 from cmdline import __version__  # Grab version from package __init__.py
-from fbs.proc.extract import ExtractSeq
+from fbs.proc.extract import ExtractSeq, get_extractor, set_scan_defaults
 import datetime
 import fbs.proc.constants.constants as constants
 import signal, getpass, pwd
@@ -115,8 +154,12 @@ def read_and_scan_dataset(conf, status):
     Reads files from a specific directory in filesystem
     and outputs metadata to elastic search database.
     """
-    extract = ExtractSeq(conf)
-    extract.read_and_scan_dataset()
+    extract = get_extractor(conf)
+
+    try:
+        extract.read_and_scan_dataset()
+    finally:
+        extract.close()
 
 def store_dataset_to_file(conf, status):
 
@@ -135,8 +178,12 @@ def read_dataset_from_file_and_scan(conf, status):
     for each file and posts results to elastic search.
     """
 
-    extract = ExtractSeq(conf)
-    extract.read_dataset_from_file_and_scan()
+    extract = get_extractor(conf)
+
+    try:
+        extract.read_dataset_from_file_and_scan()
+    finally:
+        extract.close()
 
 def get_stat_and_defs(com_args):
 
@@ -155,13 +202,7 @@ def get_stat_and_defs(com_args):
     # where loaded from the defaults file.
     config = util.get_settings(com_args["config"], com_args)
 
-
-    # Set defaults if not supplied by user.
-    if "start" not in config or not config["start"]:
-        config["start"] = config["scanning"]["start"]
-
-    if "num-files" not in config or not config["num-files"]:
-        config["num-files"] = config["scanning"]["num-files"]
+    set_scan_defaults(config)
 
     status_and_defaults.append(config)
 
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+Long running scan worker. Takes file list slices from a queue written by
+scan_archive.py --host queue and scans them one after another in the same
+process, so the file handlers, the LDAP and Elasticsearch connections and
+the spot mapping are only set up once per node rather than once per slice.
+
+Usage:
+  scan_worker.py --help
+  scan_worker.py --version
+  scan_worker.py (-q <queue_dir> | --queue <queue_dir>)
+                 [-c <path_to_config_dir> | --config <path_to_config_dir>]
+                 [-i <index> | --index <index>]
+                 [-p <processes> | --processes <processes>]
+                 [--max-in-flight <max_in_flight>]
+                 [--sandbox [--file-timeout <seconds>] [--memory-limit <MB>] [--worker-max-files <n>]]
+                 [--incremental]
+                 [--calculate_md5 ]
+                 [--wait <seconds>]
+                 [--max-chunks <n>]
+
+Options:
+  --help                              Show this screen.
+
+  --version                           Show version.
+
+  -q --queue=<queue_dir>              Directory holding the queue of slices
+                                      to scan.
+
+  -c --config=<path_to_config_dir>    Specify the main configuration directory.
+
+  -i --index=<index>                  The index to update
+
+  -p --processes=<processes>          Number of worker processes used to
+                                      extract metadata.
+
+  --max-in-flight=<max_in_flight>     Maximum number of files submitted to
+                                      the worker processes at any one time
+                                      (defaults to 4 x processes).
+
+  --sandbox                           Run the file handlers in recyclable
+                                      worker processes.
+
+  --file-timeout=<seconds>            Seconds a sandboxed handler may take
+                                      to read one file.
+
+  --memory-limit=<MB>                 Address space limit of each sandbox
+                                      worker in megabytes.
+
+  --worker-max-files=<n>              Number of files each sandbox worker
+                                      reads before it is replaced.
+
+  --incremental                       Only extract and index files which
+                                      have changed since they were indexed.
+
+  --calculate-md5                     Calculate md5 checksums on scan
+
+  --wait=<seconds>                    Seconds to wait for more slices once
+                                      the queue is empty [default: 0].
+
+  --max-chunks=<n>                    Stop after scanning this many slices
+                                      [default: 0].
+ """
+
+import datetime
+import os
+
+from docopt import docopt
+
+import fbs.proc.common_util.util as util
+from cmdline import __version__  # Grab version from package __init__.py
+from fbs.proc.chunk_queue import ChunkQueue, run_worker
+from fbs.proc.extract import get_extractor, set_scan_defaults
+
+
+def get_config(com_args):
+
+    """
+    Reads the configuration file and fills in the defaults.
+    """
+
+    if "config" not in com_args or not com_args["config"]:
+        direc = os.path.dirname(__file__)
+        conf_path = os.path.join(direc, "../../../config/ceda_fbs.ini")
+        com_args["config"] = conf_path
+
+    config = util.get_settings(com_args["config"], com_args)
+    set_scan_defaults(config)
+
+    if "index" in com_args and com_args["index"]:
+        config["es-configuration"]["es-index"] = com_args["index"]
+
+    return config
+
+
+def main():
+
+    com_args = util.sanitise_args(docopt(__doc__, version=__version__))
+    config = get_config(com_args)
+
+    start = datetime.datetime.now()
+    print("Worker started at: %s" % (str(start)))
+
+    queue = ChunkQueue(config["queue"])
+
+    requeued = queue.requeue_abandoned()
+    if requeued:
+        print("Put back %s slices left by stopped workers on this host." % requeued)
+
+    extract = get_extractor(config)
+
+    try:
+        scanned = run_worker(queue, extract, float(config["wait"]), int(config["max-chunks"]))
+    finally:
+        extract.close()
+
+    end = datetime.datetime.now()
+    print("Worker ended at : %s it scanned %s slices in : %s" % (str(end), scanned, str(end - start)))
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,534 @@
+"""
+Background sending of bulk actions to Elasticsearch.
+
+Extraction puts actions onto a bounded queue and one or more sender
+threads drain the queue into bulk requests. This allows file reading
+and the bulk HTTP requests to overlap.
+
+The result of every action is counted. Actions rejected because the
+cluster is overloaded (429 / es_rejected_execution) are retried with
+exponential backoff and actions which still fail are written to an
+NDJSON dead-letter file so they can be replayed later.
+
+Chunks are cut by serialised size as well as by number of actions. The
+target size adapts to the latency and rejection rate of recent bulk
+responses.
+"""
+
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from elasticsearch.helpers import streaming_bulk, expand_action
+
+logger = logging.getLogger(__name__)
+
+# Placed on the queue once per sender thread to mark the end of the actions.
+_END_OF_QUEUE = object()
+
+
+class DeadLetterFile(object):
+    """
+    NDJSON file of actions which could not be indexed. Each line holds
+    the original action and the error returned by Elasticsearch.
+    The file is only created when the first failure is written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def write(self, action, error):
+        """
+        Append a failed action to the file.
+
+        :param action: The original bulk action
+        :param error: The error information returned by the bulk helper
+        """
+        error = {key: value for key, value in error.items() if key not in ('exception', 'data')}
+        line = json.dumps({'action': action, 'error': error}, default=str)
+
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            with open(self.path, 'a') as writer:
+                writer.write(line + "\n")
+
+            self.count += 1
+
+    @staticmethod
+    def read(path):
+        """
+        Read the actions from a dead-letter file.
+
+        :param path: Path to the dead-letter file
+        :return: Generator of bulk actions
+        """
+        with open(path) as reader:
+            for line in reader:
+                if line.strip():
+                    yield json.loads(line)['action']
+
+
+class ChunkSizer(object):
+    """
+    Chooses the target size, in bytes, of the bulk requests.
+
+    The target is halved when a request has documents rejected because
+    the cluster is overloaded, reduced when a request is slower than the
+    target latency and grown when a request is well within it.
+    The size of every chunk sent is recorded for the run summary.
+    """
+
+    def __init__(self, initial_bytes=5 * 1024 * 1024, min_bytes=256 * 1024,
+                 max_bytes=50 * 1024 * 1024, target_latency=5.0):
+        """
+        :param initial_bytes: Starting target size of a request
+        :param min_bytes: Smallest target size
+        :param max_bytes: Largest target size
+        :param target_latency: Seconds a bulk request should take
+        """
+        self.target_bytes = initial_bytes
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+
+        self.lock = threading.Lock()
+        self.chunks = 0
+        self.total_bytes = 0
+        self.total_actions = 0
+        self.smallest = None
+        self.largest = None
+
+    def record(self, num_actions, num_bytes, latency, rejected):
+        """
+        Record the result of a bulk request and adjust the target size.
+
+        :param num_actions: Number of actions in the request
+        :param num_bytes: Serialised size of the request
+        :param latency: Seconds taken by the request
+        :param rejected: Number of actions rejected with a 429
+        """
+        with self.lock:
+            self.chunks += 1
+            self.total_bytes += num_bytes
+            self.total_actions += num_actions
+            self.smallest = num_bytes if self.smallest is None else min(self.smallest, num_bytes)
+            self.largest = num_bytes if self.largest is None else max(self.largest, num_bytes)
+
+            if rejected:
+                target = self.target_bytes * 0.5
+            elif latency > self.target_latency:
+                target = self.target_bytes * 0.75
+            elif latency < self.target_latency / 2 and num_bytes >= self.target_bytes * 0.9:
+                # Only grow when the requests are actually reaching the target.
+                target = self.target_bytes * 1.25
+            else:
+                target = self.target_bytes
+
+            self.target_bytes = int(min(self.max_bytes, max(self.min_bytes, target)))
+
+    def summary(self):
+        """
+        :return: String describing the chunk sizes chosen
+        """
+        if not self.chunks:
+            return "chunks : 0"
+
+        return "chunks : {}, mean actions per chunk : {:.1f}, chunk bytes min/mean/max : {}/{}/{}, " \
+               "final target bytes : {}".format(
+                   self.chunks, self.total_actions / self.chunks,
+                   self.smallest, self.total_bytes // self.chunks, self.largest, self.target_bytes)
+
+
+class BulkSender(object):
+    """
+    Sends actions to Elasticsearch using background threads.
+
+    Time is recorded for each stage of the pipeline:
+        extract = time spent by the producer creating actions
+        queue_full_wait = time the producer waited for space on the queue (senders are the bottleneck)
+        queue_empty_wait = time the senders waited for actions (extraction is the bottleneck)
+        prepare = time the senders spent in prepare_chunk
+        serialise = time the senders spent serialising actions
+        send = time the senders spent sending bulk requests, including retries
+
+    The number of actions which succeeded and failed are recorded in
+    ``succeeded`` and ``failed``.
+    """
+
+    def __init__(self, es, queue_size=1000, senders=1, chunk_size=500,
+                 max_retries=5, initial_backoff=2, max_backoff=600,
+                 dead_letter_file=None, on_error=None, sizer=None, on_chunk_done=None,
+                 prepare_chunk=None):
+        """
+        :param es: Elasticsearch client
+        :param queue_size: Maximum number of actions waiting to be sent
+        :param senders: Number of sender threads
+        :param chunk_size: Maximum number of actions per bulk request
+        :param max_retries: Number of times to retry actions rejected with a 429
+        :param initial_backoff: Seconds to wait before the first retry, doubled for each retry
+        :param max_backoff: Maximum number of seconds to wait between retries
+        :param dead_letter_file: Path of the NDJSON file to write failed actions to
+        :param on_error: Callable run with (action, error) for each failed action
+        :param sizer: ChunkSizer which chooses the size of the requests in bytes
+        :param on_chunk_done: Callable run with a list of (action, ok) once every
+                              action in a chunk has succeeded or been recorded as failed
+        :param prepare_chunk: Callable run on the sender thread with each list of up
+                              to chunk_size actions before they are serialised. It may
+                              change the sources, for example to fill in looked up values.
+        """
+        self.es = es
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.senders = senders
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.on_error = on_error
+        self.on_chunk_done = on_chunk_done
+        self.prepare_chunk = prepare_chunk
+        self.sizer = sizer or ChunkSizer()
+        self.serializer = es.transport.serializer
+
+        self.dead_letters = DeadLetterFile(dead_letter_file) if dead_letter_file else None
+
+        self.threads = []
+        self.exceptions = []
+
+        self.lock = threading.Lock()
+        self.timings = {
+            'extract': 0.0,
+            'queue_full_wait': 0.0,
+            'queue_empty_wait': 0.0,
+            'prepare': 0.0,
+            'serialise': 0.0,
+            'send': 0.0,
+        }
+        self.succeeded = 0
+        self.failed = 0
+
+    def _add_time(self, stage, elapsed):
+        with self.lock:
+            self.timings[stage] += elapsed
+
+    def _drain(self, state):
+        """
+        Generator which takes actions from the queue until the end marker
+        is found.
+
+        :param state: Dict for the calling thread, marked finished when the end marker is reached.
+                      Actions are kept in its pending dict until they succeed or fail.
+        """
+        while True:
+            start = time.monotonic()
+            action = self.queue.get()
+            self._add_time('queue_empty_wait', time.monotonic() - start)
+
+            if action is _END_OF_QUEUE:
+                state['finished'] = True
+                return
+
+            state['pending'][id(action)] = action
+            yield action
+
+    def _batches(self, state):
+        """
+        Take up to chunk_size actions at a time from the queue and pass them
+        to prepare_chunk.
+
+        :param state: Dict for the calling thread
+        :return: Generator of lists of actions
+        """
+        actions = self._drain(state)
+
+        while True:
+            batch = list(itertools.islice(actions, self.chunk_size))
+            if not batch:
+                return
+
+            if self.prepare_chunk is not None:
+                start = time.monotonic()
+                self.prepare_chunk(batch)
+                self._add_time('prepare', time.monotonic() - start)
+
+            yield batch
+
+    def _chunks(self, state):
+        """
+        Group the actions from the queue into chunks. A chunk is complete
+        when it holds chunk_size actions or reaches the target size in bytes.
+
+        :param state: Dict for the calling thread
+        :return: Generator of (chunk, size in bytes). Each chunk is a list of
+                 (action, action line, serialised source) tuples.
+        """
+        chunk = []
+        chunk_bytes = 0
+
+        for action in itertools.chain.from_iterable(self._batches(state)):
+            start = time.monotonic()
+
+            # The source is serialised once here and passed through the bulk helper as a string
+            action_line, data = expand_action(action)
+            data = self.serializer.dumps(data)
+
+            # +2 for the new lines in the bulk body
+            chunk_bytes += len(self.serializer.dumps(action_line).encode('utf-8')) + len(data.encode('utf-8')) + 2
+            chunk.append((action, action_line, data))
+
+            self._add_time('serialise', time.monotonic() - start)
+
+            if len(chunk) >= self.chunk_size or chunk_bytes >= self.sizer.target_bytes:
+                yield chunk, chunk_bytes
+                chunk = []
+                chunk_bytes = 0
+
+        if chunk:
+            yield chunk, chunk_bytes
+
+    def _bulk_request(self, chunk):
+        """
+        Send a chunk as a single bulk request.
+
+        :param chunk: List of (action, action line, serialised source) tuples
+        :return: List of (action, ok, info) for each action in the chunk
+        """
+        results = streaming_bulk(
+            self.es,
+            [(action_line, data) for _, action_line, data in chunk],
+            chunk_size=len(chunk),
+            max_chunk_bytes=sys.maxsize,
+            expand_action_callback=lambda item: item,
+            raise_on_error=False,
+            raise_on_exception=False
+        )
+
+        return [(item[0], ok, info.popitem()[1]) for item, (ok, info) in zip(chunk, results)]
+
+    def _send_chunk(self, chunk, chunk_bytes, pending=None):
+        """
+        Send a chunk, retrying the actions rejected with a 429 using
+        exponential backoff. Adjusts the target chunk size from the
+        latency and rejection rate of the first request.
+
+        :param chunk: List of (action, action line, serialised source) tuples
+        :param chunk_bytes: Serialised size of the chunk
+        :param pending: Dict of the actions taken from the queue, each is removed once it succeeds or fails
+        """
+        pending = pending if pending is not None else {}
+        start = time.monotonic()
+        outcomes = []
+
+        # Results collected so far are reported even if a retry raises, the
+        # actions not yet sent stay pending for the caller to fail
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    time.sleep(min(self.max_backoff, self.initial_backoff * 2 ** (attempt - 1)))
+
+                request_start = time.monotonic()
+                results = self._bulk_request(chunk)
+
+                retry = []
+                for item, (action, ok, info) in zip(chunk, results):
+                    if ok:
+                        with self.lock:
+                            self.succeeded += 1
+                        outcomes.append((action, True))
+                        pending.pop(id(action), None)
+
+                    elif info.get('status') == 429 and attempt < self.max_retries:
+                        retry.append(item)
+
+                    else:
+                        self._record_failure(action, info)
+                        outcomes.append((action, False))
+                        pending.pop(id(action), None)
+
+                if not attempt:
+                    rejected = len([1 for _, ok, info in results if not ok and info.get('status') == 429])
+                    self.sizer.record(len(chunk), chunk_bytes, time.monotonic() - request_start, rejected)
+
+                if not retry:
+                    break
+
+                chunk = retry
+
+        finally:
+            self._add_time('send', time.monotonic() - start)
+
+            if self.on_chunk_done is not None and outcomes:
+                self.on_chunk_done(outcomes)
+
+    def _fail_unsent(self, actions, error):
+        """
+        Record actions which were never sent because a sender failed, in
+        the same way as actions which failed to index.
+
+        :param actions: List of bulk actions
+        :param error: The exception which stopped the sender
+        """
+        outcomes = []
+
+        for action in actions:
+            self._record_failure(action, {
+                '_id': action.get('_id'),
+                'status': None,
+                'error': 'Not sent because the bulk sender failed: {}'.format(error)
+            })
+            outcomes.append((action, False))
+
+        if outcomes and self.on_chunk_done is not None:
+            self.on_chunk_done(outcomes)
+
+    def _discard(self, error):
+        """
+        Empty the queue after a failure so the producer is not blocked.
+        Each action taken from the queue is recorded as failed.
+
+        :param error: The exception which stopped the sender
+        """
+        batch = []
+
+        while True:
+            action = self.queue.get()
+
+            if action is _END_OF_QUEUE:
+                break
+
+            batch.append(action)
+
+            if len(batch) >= self.chunk_size:
+                self._fail_unsent(batch, error)
+                batch = []
+
+        self._fail_unsent(batch, error)
+
+    def _run(self):
+        """
+        Sender thread. Drains the queue into bulk requests.
+        """
+        state = {'finished': False, 'pending': {}}
+
+        try:
+            for chunk, chunk_bytes in self._chunks(state):
+                self._send_chunk(chunk, chunk_bytes, state['pending'])
+
+        except Exception as ex:
+            logger.error("Bulk sender failed: {}".format(ex))
+            with self.lock:
+                self.exceptions.append(ex)
+
+            # Actions taken from the queue which were not sent
+            self._fail_unsent(list(state['pending'].values()), ex)
+
+            if not state['finished']:
+                self._discard(ex)
+
+    def _record_failure(self, action, error):
+        """
+        Count a failed action and write it to the dead-letter file.
+
+        :param action: The original bulk action
+        :param error: The error information returned by the bulk helper
+        """
+        with self.lock:
+            self.failed += 1
+
+        logger.error("Failed to index document {}: {} {}".format(
+            error.get('_id'), error.get('status'), error.get('error')))
+
+        if action is not None:
+            if self.dead_letters is not None:
+                self.dead_letters.write(action, error)
+
+            if self.on_error is not None:
+                self.on_error(action, error)
+
+    def start(self):
+        """
+        Start the sender threads.
+        """
+        for i in range(self.senders):
+            thread = threading.Thread(target=self._run, name='bulk-sender-{}'.format(i), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, action, extract_time=0.0):
+        """
+        Add an action to the queue, waiting for space if the queue is full.
+        Once a sender has failed the action is recorded as failed instead.
+
+        :param action: Elasticsearch bulk action
+        :param extract_time: Time taken to create the action
+        """
+        self._add_time('extract', extract_time)
+
+        if self.exceptions:
+            self._fail_unsent([action], self.exceptions[0])
+            return
+
+        start = time.monotonic()
+        self.queue.put(action)
+        self._add_time('queue_full_wait', time.monotonic() - start)
+
+    def send_all(self, actions):
+        """
+        Put all the actions from an iterable onto the queue, recording
+        the time taken to create each one. Stops taking actions from the
+        iterable once a sender has failed, the error is raised by close.
+
+        :param actions: Iterable of Elasticsearch bulk actions
+        """
+        actions = iter(actions)
+
+        while not self.exceptions:
+            start = time.monotonic()
+            try:
+                action = next(actions)
+            except StopIteration:
+                return
+
+            self.put(action, time.monotonic() - start)
+
+    def close(self):
+        """
+        Wait for the queue to be sent and stop the sender threads.
+        Re-raises the first error from the sender threads.
+        """
+        for _ in self.threads:
+            self.queue.put(_END_OF_QUEUE)
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+
+        if self.exceptions:
+            raise self.exceptions[0]
+
+    def summary(self):
+        """
+        :return: String describing the time spent in each stage
+        """
+        return ", ".join(
+            ["succeeded : {}".format(self.succeeded), "failed : {}".format(self.failed)] +
+            ["{} : {:.2f}s".format(stage, elapsed) for stage, elapsed in self.timings.items()] +
+            [self.sizer.summary()]
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
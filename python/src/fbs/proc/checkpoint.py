@@ -0,0 +1,173 @@
+"""
+'Checkpoint' module - records how far a scan of a file list has got.
+
+A scan of a slice of a file list records the list offset below which
+every file has been dealt with: indexed and acknowledged by Elasticsearch,
+written to the dead-letter file, skipped as unchanged or failed to read.
+The checkpoint is written after each acknowledged bulk chunk so a job
+which is killed can be restarted with the same arguments and carry on
+from the last confirmed offset.
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Outcome of each file, named after the counters in ExtractSeq.
+INDEXED = "files_indexed"
+INDEX_ERROR = "database_errors"
+PROPERTIES_ERROR = "files_properties_errors"
+UNCHANGED = "files_unchanged"
+
+OUTCOMES = (INDEXED, INDEX_ERROR, PROPERTIES_ERROR, UNCHANGED)
+
+
+class ScanCheckpoint(object):
+    """
+    Tracks the files of a list slice as they are completed and writes the
+    contiguous offset reached, with the counters up to that offset, to a
+    JSON file. Files may complete in any order.
+    """
+
+    def __init__(self, path, filename, start, num_files, level):
+        """
+        :param path: Path of the checkpoint file
+        :param filename: File list being scanned
+        :param start: First line of the slice
+        :param num_files: Number of lines in the slice
+        :param level: Level of the scan
+        """
+        self.path = path
+        self.job = {
+            "filename": os.path.abspath(filename),
+            "start": int(start),
+            "num-files": int(num_files),
+            "level": str(level)
+        }
+
+        # A list rewritten since the checkpoint was saved is a different job
+        try:
+            stat = os.stat(filename)
+            self.job.update({"size": stat.st_size, "mtime": stat.st_mtime_ns})
+        except (IOError, OSError):
+            self.job.update({"size": None, "mtime": None})
+
+        self.lock = threading.Lock()
+        self.offset = int(start)
+        self.counters = dict.fromkeys(OUTCOMES, 0)
+
+        # File path -> list offsets not yet complete
+        self.positions = collections.defaultdict(collections.deque)
+        # Document id -> file path for actions waiting to be acknowledged
+        self.sent_ids = collections.defaultdict(collections.deque)
+        # List offset -> outcome for files complete beyond the offset
+        self.completed = {}
+
+    def resume(self):
+        """
+        Load the checkpoint left by an earlier run of the same job.
+
+        :return: The list offset to carry on from
+        """
+        try:
+            with open(self.path) as reader:
+                saved = json.load(reader)
+        except (IOError, OSError, ValueError):
+            return self.offset
+
+        if saved.get("job") != self.job:
+            logger.warning("Ignoring checkpoint {} written for a different job.".format(self.path))
+            return self.offset
+
+        self.offset = int(saved["offset"])
+        self.counters.update(saved["counters"])
+
+        return self.offset
+
+    def expect(self, files, first_offset):
+        """
+        Record the list offset of each file to be scanned.
+
+        :param files: Paths in list order
+        :param first_offset: List offset of the first path
+        """
+        for offset, file in enumerate(files, first_offset):
+            self.positions[file].append(offset)
+
+    def sent(self, es_id, file):
+        """
+        Record that the action for a file has been passed to the bulk sender.
+        """
+        with self.lock:
+            self.sent_ids[es_id].append(file)
+
+    def done(self, file, outcome):
+        """
+        Record the outcome of a file which will not be sent to Elasticsearch.
+        """
+        with self.lock:
+            self._complete(file, outcome)
+
+    def chunk_done(self, results):
+        """
+        Record the outcome of an acknowledged bulk chunk and save the
+        checkpoint. Used as the on_chunk_done callback of the BulkSender.
+
+        :param results: List of (action, ok) tuples
+        """
+        with self.lock:
+            for action, ok in results:
+                files = self.sent_ids.get(action["_id"])
+                if not files:
+                    continue
+
+                self._complete(files.popleft(), INDEXED if ok else INDEX_ERROR)
+
+                if not files:
+                    del self.sent_ids[action["_id"]]
+
+            self._save()
+
+    def _complete(self, file, outcome):
+        """
+        Mark a file complete and move the offset past every contiguous
+        complete file. Call with the lock held.
+        """
+        offsets = self.positions.get(file)
+        if not offsets:
+            return
+
+        self.completed[offsets.popleft()] = outcome
+
+        if not offsets:
+            del self.positions[file]
+
+        while self.offset in self.completed:
+            self.counters[self.completed.pop(self.offset)] += 1
+            self.offset += 1
+
+    def _save(self):
+        """
+        Write the checkpoint. Written to a temporary file first so a job
+        killed part way through never leaves a broken checkpoint.
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as writer:
+            json.dump({"job": self.job, "offset": self.offset, "counters": self.counters}, writer)
+
+        os.rename(tmp_path, self.path)
+
+    def remove(self):
+        """
+        Remove the checkpoint once the job has finished.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
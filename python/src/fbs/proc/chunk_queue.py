@@ -0,0 +1,229 @@
+"""
+'Chunk queue' module - a queue of scan jobs held in a shared directory.
+
+Each job is a slice of a file list (list file, start, number of files and
+level) written as a small JSON file. Long running scan workers take jobs
+from the queue by renaming them, which is atomic on POSIX file systems, so
+any number of workers on any number of nodes can share one queue without
+a lock or a server.
+
+    <queue>/pending/   jobs waiting for a worker
+    <queue>/running/   jobs claimed by a worker, named after its host and pid
+    <queue>/done/      jobs which finished
+    <queue>/failed/    jobs which raised an error
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+STATES = (PENDING, RUNNING, DONE, FAILED)
+
+# Seconds between looks at an empty queue.
+POLL_INTERVAL = 10
+
+
+class Chunk(object):
+    """
+    A job claimed from the queue.
+    """
+
+    def __init__(self, name, path, spec):
+        """
+        :param name: Name of the job in the pending directory
+        :param path: Path of the claimed job in the running directory
+        :param spec: Dict with filename, start, num-files and level
+        """
+        self.name = name
+        self.path = path
+        self.spec = spec
+
+
+class ChunkQueue(object):
+    """
+    Directory based queue of list slices to scan.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Directory holding the queue, created if it does not exist
+        """
+        self.directory = directory
+
+        for state in STATES:
+            path = os.path.join(directory, state)
+            if not os.path.exists(path):
+                os.makedirs(path, exist_ok=True)
+
+        self.owner = "{}.{}".format(socket.gethostname(), os.getpid())
+
+    def _path(self, state, name=""):
+        return os.path.join(self.directory, state, name)
+
+    def put(self, filename, start, num_files, level):
+        """
+        Add a job to the queue.
+
+        :param filename: File list
+        :param start: First line of the slice
+        :param num_files: Number of lines in the slice
+        :param level: Level of the scan
+        :return: Name of the job
+        """
+        spec = {
+            "filename": os.path.abspath(filename),
+            "start": int(start),
+            "num-files": int(num_files),
+            "level": str(level)
+        }
+
+        # Lists with the same name in different directories are told apart
+        # by a hash of the absolute path
+        name = "{}_{}_{:010d}_{}.json".format(
+            os.path.basename(spec["filename"]),
+            hashlib.sha1(spec["filename"].encode("utf-8")).hexdigest()[:8],
+            spec["start"],
+            spec["num-files"]
+        )
+
+        # Written under another name first so a worker never reads half a job
+        tmp_path = self._path(PENDING, "." + name + ".tmp")
+        with open(tmp_path, "w") as writer:
+            json.dump(spec, writer)
+
+        os.rename(tmp_path, self._path(PENDING, name))
+
+        return name
+
+    def pending(self):
+        """
+        :return: Names of the jobs waiting for a worker, in the order they are claimed
+        """
+        return sorted(name for name in os.listdir(self._path(PENDING)) if not name.startswith("."))
+
+    def claim(self):
+        """
+        Take the next job from the queue. When several workers race for the
+        same job only one rename succeeds and the others try the next job.
+
+        :return: Chunk or None if the queue is empty
+        """
+        for name in self.pending():
+            path = self._path(RUNNING, "{}.{}".format(name, self.owner))
+
+            try:
+                os.rename(self._path(PENDING, name), path)
+            except OSError:
+                # Claimed by another worker
+                continue
+
+            try:
+                with open(path) as reader:
+                    return Chunk(name, path, json.load(reader))
+
+            except ValueError as ex:
+                logger.error("Could not read job {}: {}".format(name, ex))
+                os.rename(path, self._path(FAILED, name))
+
+        return None
+
+    def finish(self, chunk, failed=False):
+        """
+        Move a claimed job to the done or failed directory.
+        """
+        os.rename(chunk.path, self._path(FAILED if failed else DONE, chunk.name))
+
+    def requeue_abandoned(self):
+        """
+        Put back the jobs claimed by workers on this host which are no longer
+        running, for example because the node job was killed. The scan of a
+        requeued job carries on from its checkpoint.
+
+        :return: Number of jobs put back
+        """
+        host = socket.gethostname()
+        requeued = 0
+
+        for claimed in os.listdir(self._path(RUNNING)):
+            name, _, owner = claimed.rpartition(".json.")
+            claim_host, _, pid = owner.rpartition(".")
+
+            if claim_host != host or not pid.isdigit() or _is_running(int(pid)):
+                continue
+
+            try:
+                os.rename(self._path(RUNNING, claimed), self._path(PENDING, name + ".json"))
+                requeued += 1
+            except OSError:
+                pass
+
+        return requeued
+
+
+def run_worker(queue, extract, wait=0, max_chunks=0):
+
+    """
+    Scan slices from the queue until it has been empty for wait seconds.
+
+    :param queue: ChunkQueue
+    :param extract: Extractor used for every slice
+    :param wait: Seconds to wait for more slices once the queue is empty
+    :param max_chunks: Stop after this many slices, 0 for no limit
+    :return: Number of slices scanned
+    """
+
+    scanned = 0
+    idle_since = time.monotonic()
+
+    while not max_chunks or scanned < max_chunks:
+
+        chunk = queue.claim()
+
+        if chunk is None:
+            if time.monotonic() - idle_since >= wait:
+                break
+
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        spec = chunk.spec
+        print("Scanning %s from line %s, %s files, level %s." % (
+            spec["filename"], spec["start"], spec["num-files"], spec["level"]))
+
+        try:
+            extract.scan_chunk(spec["filename"], spec["start"], spec["num-files"], spec["level"])
+        except Exception as ex:
+            # The slice keeps its checkpoint, so a later run carries on from it.
+            print("Scan of %s failed: %s" % (chunk.name, ex))
+            queue.finish(chunk, failed=True)
+        else:
+            queue.finish(chunk)
+
+        scanned += 1
+        idle_since = time.monotonic()
+
+    return scanned
+
+
+def _is_running(pid):
+    """
+    :return: True if a process with the pid exists on this host
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
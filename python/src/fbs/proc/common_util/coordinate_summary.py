@@ -0,0 +1,173 @@
+"""
+'Coordinate summary' module - the extent of large coordinate variables.
+
+The envelope of a file is built from the smallest and largest latitude and
+from the largest gap between longitudes. These are found by reading each
+coordinate variable in slabs lined up with its chunks and keeping only
+running values, so a curvilinear grid or a long swath is never held in
+memory at once. A 1D latitude variable is monotonic, so only its first
+and last values are read. The gap between longitudes cannot be found from
+the ends, so a 1D longitude variable is read in full.
+"""
+
+import numpy as np
+import numpy.ma as ma
+
+from fbs.proc.common_util.geojson import GeoJSONGenerator
+
+# Bytes of a coordinate variable read at a time
+MEMORY_BUDGET = 32 * 1024 * 1024
+
+# Number of longitude bins, each 0.1 degrees wide
+LONGITUDE_BINS = 3600
+
+
+class LatitudeSummary(object):
+    """
+    Running minimum and maximum of the latitudes between -90 and 90.
+    """
+
+    # The ends of a monotonic variable bound all of its values
+    bounded_by_ends = True
+
+    def __init__(self):
+        self.count = 0
+        self.low = None
+        self.high = None
+
+    @staticmethod
+    def valid(values):
+        values = ma.compressed(values)
+        return values[(values >= -90) & (values <= 90)]
+
+    def add(self, values):
+        values = self.valid(values)
+
+        if values.size == 0:
+            return
+
+        low, high = values.min(), values.max()
+
+        self.low = low if self.low is None else min(self.low, low)
+        self.high = high if self.high is None else max(self.high, high)
+        self.count += values.size
+
+    def values(self):
+        """
+        :return: Array of the latitudes which bound the ones added
+        """
+        if self.count == 0:
+            return np.array([])
+
+        if self.count == 1:
+            return np.array([self.low])
+
+        return np.array([self.low, self.high])
+
+
+class LongitudeSummary(object):
+    """
+    The longitudes between -180 and 180, kept as the smallest and largest
+    value in each of a fixed number of bins. The largest gap between the
+    longitudes, which the envelope goes around, lies between two occupied
+    bins unless the longitudes cover the globe more finely than one bin.
+    """
+
+    # Every value is needed to find the largest gap
+    bounded_by_ends = False
+
+    def __init__(self, bins=LONGITUDE_BINS):
+        self.bins = bins
+        self.count = 0
+        self.low = np.full(bins, np.inf)
+        self.high = np.full(bins, -np.inf)
+        self.first = None
+
+    @staticmethod
+    def valid(values):
+        values = ma.compressed(values)
+        return values[(values >= -180) & (values <= 180)]
+
+    def add(self, values):
+        values = self.valid(values).astype(np.float64)
+
+        if values.size == 0:
+            return
+
+        if self.first is None:
+            self.first = values[0]
+
+        index = np.minimum(((values + 180) * (self.bins / 360.0)).astype(np.intp), self.bins - 1)
+        np.minimum.at(self.low, index, values)
+        np.maximum.at(self.high, index, values)
+        self.count += values.size
+
+    def values(self):
+        """
+        :return: Array of the two longitudes bounding the ones added, west
+                 then east, or of the only longitude
+        """
+        if self.count == 0:
+            return np.array([])
+
+        if self.count == 1:
+            return np.array([self.first])
+
+        occupied = self.low <= self.high
+        edges = np.sort(np.concatenate((self.low[occupied], self.high[occupied])))
+
+        return np.array(GeoJSONGenerator._get_bounds(edges, wrapped_coords=True))
+
+
+def _is_monotonic(variable):
+    """
+    :return: True if the variable is a 1D coordinate variable, which is
+             monotonic by the CF conventions
+    """
+    return len(variable.dimensions) == 1 and variable.dimensions[0] == variable.name
+
+
+def _slabs(variable, memory_budget):
+    """
+    Yields the variable in slabs along its first dimension, each within the
+    memory budget and made of whole chunks where a chunk fits in it.
+    """
+    shape = variable.shape
+
+    if not shape:
+        yield variable[...]
+        return
+
+    row_bytes = np.dtype(variable.dtype).itemsize * int(np.prod(shape[1:], dtype=np.int64))
+    rows = max(1, memory_budget // max(row_bytes, 1))
+
+    chunking = variable.chunking()
+    if chunking != 'contiguous' and chunking and rows >= chunking[0]:
+        rows -= rows % chunking[0]
+
+    for start in range(0, shape[0], rows):
+        yield variable[start:start + rows]
+
+
+def summarise(variable, summary, memory_budget=MEMORY_BUDGET):
+    """
+    Add the values of a netCDF4 variable to a summary.
+
+    :param variable: netCDF4.Variable holding latitudes or longitudes
+    :param summary: LatitudeSummary or LongitudeSummary
+    :param memory_budget: Bytes of the variable to read at a time
+    :return: The summary
+    """
+    if summary.bounded_by_ends and _is_monotonic(variable) and variable.size > 1:
+        ends = ma.array([variable[0], variable[-1]])
+
+        # The ends bound the variable if they are both valid
+        if summary.valid(ends).size == 2:
+            summary.add(ends)
+            summary.count = variable.size
+            return summary
+
+    for slab in _slabs(variable, memory_budget):
+        summary.add(slab)
+
+    return summary
@@ -0,0 +1,92 @@
+"""
+'File header' module - the first bytes of a file, read once.
+
+Picking a handler and parsing a file both look at the start of the file:
+the picker checks signatures such as the BADC-CSV conventions line and
+the handlers read header lines. The header is read once, in binary, on
+first use and shared by the picker and the handler. When the whole file
+fits in the header the handlers parse it from memory, so a small file is
+only opened once.
+"""
+
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes read from the start of each file
+HEADER_SIZE = 8192
+
+
+class FileHeader(object):
+    """
+    The first size bytes of a file, read at most once.
+    """
+
+    def __init__(self, path, size=HEADER_SIZE, file_stat=None):
+        """
+        :param path: Path of the file
+        :param size: Number of bytes to read
+        :param file_stat: FileStat snapshot for the file, if already taken
+        """
+        self.path = path
+        self.size = size
+        self.file_stat = file_stat
+
+        self._data = None
+        self._read = False
+
+    @property
+    def data(self):
+        """
+        :return: Up to size bytes from the start of the file, or None if
+                 the file could not be read
+        """
+        if not self._read:
+            try:
+                with open(self.path, "rb") as reader:
+                    self._data = reader.read(self.size)
+            except (IOError, OSError) as ex:
+                logger.debug("Could not read the header of {}: {}".format(self.path, ex))
+                self._data = None
+
+            self._read = True
+
+        return self._data
+
+    @property
+    def complete(self):
+        """
+        :return: True if the header holds the whole file
+        """
+        return self.data is not None and len(self.data) < self.size
+
+    def startswith(self, prefix):
+        """
+        :param prefix: Bytes to look for at the start of the file
+        :return: True if the file starts with the bytes
+        """
+        return self.data is not None and self.data.startswith(prefix)
+
+    def first_line(self):
+        """
+        :return: The first line of the file without the line ending, or
+                 None if the file could not be read
+        """
+        if self.data is None:
+            return None
+
+        return self.data.split(b"\n", 1)[0].rstrip(b"\r").decode("utf-8", "ignore")
+
+    def text(self):
+        """
+        Open the file as UTF-8 text, ignoring undecodable bytes. A file which
+        fits in the header is read from memory rather than opened again, with
+        the same newline translation as open().
+
+        :return: Text stream to be used as a context manager
+        """
+        if self.complete:
+            return io.TextIOWrapper(io.BytesIO(self.data), encoding="utf-8", errors="ignore")
+
+        return open(self.path, encoding="utf-8", errors="ignore")
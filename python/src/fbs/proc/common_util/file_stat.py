@@ -0,0 +1,87 @@
+"""
+'File stat' module - a snapshot of the file system metadata of a path.
+
+On a parallel file system each metadata call is a round trip to a
+metadata server. The snapshot is taken once, from the os.scandir entry
+when the file was found by a directory walk or lazily on first use,
+and shared by everything which needs it while the file is scanned.
+"""
+
+import os
+import stat
+
+
+class FileStat(object):
+    """
+    The lstat of a path, and the stat of its target if it is a symbolic
+    link. Each is fetched at most once. For a path which is not a link
+    the stat is the lstat so only one call is made.
+    """
+
+    def __init__(self, path, lstat=None, stat_result=None):
+        """
+        :param path: Path of the file
+        :param lstat: os.lstat result for the path, if already known
+        :param stat_result: os.stat result for the path, if already known
+        """
+        self.path = path
+        self._lstat = lstat
+        self._stat = stat_result
+        self._stat_fetched = stat_result is not None
+
+    @classmethod
+    def from_dir_entry(cls, entry):
+        """
+        Make a snapshot from an os.scandir entry, reusing the result
+        the entry has cached.
+
+        :param entry: os.DirEntry
+        :return: FileStat
+        """
+        return cls(entry.path, lstat=entry.stat(follow_symlinks=False))
+
+    @property
+    def lstat(self):
+        """
+        :return: os.lstat result, or None if the path does not exist
+        """
+        if self._lstat is None:
+            try:
+                self._lstat = os.lstat(self.path)
+            except OSError:
+                return None
+
+        return self._lstat
+
+    @property
+    def stat(self):
+        """
+        :return: os.stat result following links, or None if the path or
+                 the link target does not exist
+        """
+        if not self._stat_fetched:
+            if self.lstat is not None and not stat.S_ISLNK(self.lstat.st_mode):
+                self._stat = self.lstat
+            else:
+                try:
+                    self._stat = os.stat(self.path)
+                except OSError:
+                    self._stat = None
+
+            self._stat_fetched = True
+
+        return self._stat
+
+    @property
+    def is_link(self):
+        """
+        :return: True if the path is a symbolic link
+        """
+        return self.lstat is not None and stat.S_ISLNK(self.lstat.st_mode)
+
+    @property
+    def is_file(self):
+        """
+        :return: True if the path is a regular file or a link to one
+        """
+        return self.stat is not None and stat.S_ISREG(self.stat.st_mode)
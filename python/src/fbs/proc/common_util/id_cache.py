@@ -0,0 +1,159 @@
+"""
+'Id cache' module - a persistent cache of user and group names.
+
+The names of the owners of the files scanned are looked up in LDAP. The
+names found are kept in a SQLite database on the shared workspace so
+that every scan job can use them, rather than each job starting with an
+empty cache. Ids with no name in LDAP are kept too, so they are not
+looked up again until the entry expires.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+GROUP = "group"
+
+# Returned by IdNameCache.get when the id is not in the cache or has expired
+MISSING = object()
+
+
+class IdNameCache(object):
+    """
+    SQLite cache of uid and gid names with a time to live. A name of None
+    records that the id has no name.
+    """
+
+    def __init__(self, path, ttl=86400, timeout=30):
+        """
+        :param path: Path of the SQLite database, created if it does not exist
+        :param ttl: Seconds before a cached name is looked up again
+        :param timeout: Seconds to wait for another process to release the database
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS names "
+                            "(kind TEXT, id INTEGER, name TEXT, updated REAL, PRIMARY KEY (kind, id))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS prefills (kind TEXT PRIMARY KEY, started REAL, finished REAL)")
+
+    def get(self, kind, id_number):
+        """
+        :param kind: USER or GROUP
+        :param id_number: uid or gid
+        :return: The cached name, None if the id has no name, or MISSING
+        """
+        with self.lock:
+            row = self.db.execute("SELECT name, updated FROM names WHERE kind = ? AND id = ?",
+                                  (kind, int(id_number))).fetchone()
+
+        if row is None or time.time() - row[1] > self.ttl:
+            return MISSING
+
+        return row[0]
+
+    def get_many(self, kind, ids):
+        """
+        :param kind: USER or GROUP
+        :param ids: uids or gids
+        :return: Dict of id to name, or None, for the ids in the cache
+        """
+        ids = [int(id_number) for id_number in ids]
+        oldest = time.time() - self.ttl
+        names = {}
+
+        with self.lock:
+            # Keep well inside the SQLite limit on query parameters
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                rows = self.db.execute(
+                    "SELECT id, name FROM names WHERE kind = ? AND updated >= ? AND id IN ({})".format(
+                        ",".join("?" * len(batch))),
+                    [kind, oldest] + batch)
+
+                names.update(rows.fetchall())
+
+        return names
+
+    def put(self, kind, id_number, name):
+        """
+        Cache the name of an id, or None if it has no name.
+        """
+        self.put_many(kind, [(id_number, name)])
+
+    def put_many(self, kind, names):
+        """
+        :param kind: USER or GROUP
+        :param names: Iterable of (id, name) tuples
+        """
+        now = time.time()
+
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO names (kind, id, name, updated) VALUES (?, ?, ?, ?)",
+                                ((kind, int(id_number), name, now) for id_number, name in names))
+
+    def claim_prefill(self, kind, lease=600):
+        """
+        Decide whether this process should fill the cache with every name.
+        The cache is filled once per ttl. Only one process may fill it at a
+        time, so a job which starts while another is filling it carries on
+        with single lookups.
+
+        :param kind: USER or GROUP
+        :param lease: Seconds after which a fill which did not finish may be started again
+        :return: True if this process should fill the cache
+        """
+        now = time.time()
+
+        with self.lock:
+            # Take the write lock before reading, so the check and the claim
+            # are one step and two jobs starting together cannot both claim
+            self.db.execute("BEGIN IMMEDIATE")
+
+            try:
+                row = self.db.execute("SELECT started, finished FROM prefills WHERE kind = ?", (kind,)).fetchone()
+
+                if row is not None:
+                    started, finished = row
+
+                    if finished is not None and finished >= started and now - finished < self.ttl:
+                        self.db.rollback()
+                        return False
+
+                    if (finished is None or finished < started) and now - started < lease:
+                        self.db.rollback()
+                        return False
+
+                self.db.execute("INSERT OR REPLACE INTO prefills (kind, started, finished) VALUES (?, ?, ?)",
+                                (kind, now, row[1] if row is not None else None))
+
+            except Exception:
+                self.db.rollback()
+                raise
+
+            self.db.commit()
+
+        return True
+
+    def finish_prefill(self, kind):
+        """
+        Record that the cache has been filled.
+        """
+        with self.lock, self.db:
+            self.db.execute("UPDATE prefills SET finished = ? WHERE kind = ?", (time.time(), kind))
+
+    def close(self):
+        self.db.close()
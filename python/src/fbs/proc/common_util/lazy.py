@@ -0,0 +1,92 @@
+"""
+'Lazy' module - resources built on first use.
+
+Connections to LDAP, Elasticsearch and the spot mapping service take time
+to set up and are not needed by every run. A LazyResource builds its
+resource the first time it is asked for, or in a background thread when
+it is prefetched so the set up overlaps with reading the file list.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyResource(object):
+    """
+    Builds a resource once, on first use, from a factory. Threads asking
+    for the resource while it is being built wait for it.
+
+    If the factory fails the error is raised to every caller until
+    retry_after seconds have passed, so an unreachable server costs one
+    connect timeout rather than one per file.
+    """
+
+    def __init__(self, name, factory, retry_after=60):
+        """
+        :param name: Name of the resource for log messages
+        :param factory: Callable with no arguments which builds the resource
+        :param retry_after: Seconds before building a failed resource again
+        """
+        self.name = name
+        self.factory = factory
+        self.retry_after = retry_after
+
+        self.lock = threading.Lock()
+        self._resource = None
+        self._error = None
+        self._failed_at = None
+
+    @property
+    def ready(self):
+        """
+        :return: True if the resource has been built
+        """
+        return self._resource is not None
+
+    def get(self):
+        """
+        :return: The resource, built if this is the first use
+        """
+        if self._resource is not None:
+            return self._resource
+
+        with self.lock:
+            if self._resource is not None:
+                return self._resource
+
+            if self._error is not None and time.monotonic() - self._failed_at < self.retry_after:
+                raise self._error
+
+            start = time.monotonic()
+
+            try:
+                self._resource = self.factory()
+            except Exception as ex:
+                logger.error("Could not set up the {}: {}".format(self.name, ex))
+                self._error = ex
+                self._failed_at = time.monotonic()
+                raise
+
+            self._error = None
+            logger.debug("Set up the {} in {:.2f} s.".format(self.name, time.monotonic() - start))
+
+            return self._resource
+
+    def prefetch(self):
+        """
+        Start building the resource in a background thread. Errors are
+        kept and raised by the next call to get.
+        """
+        if self._resource is not None:
+            return
+
+        def build():
+            try:
+                self.get()
+            except Exception:
+                pass
+
+        threading.Thread(target=build, name="prefetch-{}".format(self.name), daemon=True).start()
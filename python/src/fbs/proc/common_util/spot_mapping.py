@@ -1,5 +1,130 @@
-import requests
+import functools
+import logging
 import os
+import pickle
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Version of the snapshot file layout, changed when the layout changes
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot"
+
+# Key holding the spot in a SpotTrie node. Path components are strings so it
+# cannot clash with a child.
+_SPOT = None
+
+
+class SpotTrie(object):
+    """
+    Trie of path components used to find the spot with the longest path
+    which is a prefix of a file path.
+    """
+
+    def __init__(self, path2spot=None, root=None):
+        """
+        :param path2spot: Dict of spot path to spot name
+        :param root: Root node of a trie built before, e.g. read from a snapshot
+        """
+        self.root = root if root is not None else {}
+
+        for path, spot in (path2spot or {}).items():
+            self.add(path, spot)
+
+    @staticmethod
+    def components(path):
+        return [component for component in path.split('/') if component]
+
+    def add(self, path, spot):
+        node = self.root
+
+        for component in self.components(path):
+            node = node.setdefault(component, {})
+
+        node[_SPOT] = spot
+
+    def walk(self, path):
+        """
+        Follow a path down the trie.
+
+        :param path: Directory or file path
+        :return: (spot of the longest prefix found, node for the whole path
+                 or None if the path leaves the trie)
+        """
+        node = self.root
+        spot = None
+
+        for component in self.components(path):
+            node = node.get(component)
+
+            if node is None:
+                return spot, None
+
+            spot = node.get(_SPOT, spot)
+
+        return spot, node
+
+    def longest_prefix(self, path):
+        """
+        :param path: Directory or file path
+        :return: The spot of the longest spot path containing the path, or None
+        """
+        return self.walk(path)[0]
+
+    def has_spots_below(self, path):
+        """
+        :param path: Directory path
+        :return: True if a spot path lies below the directory
+        """
+        node = self.walk(path)[1]
+        return node is not None and any(key is not _SPOT for key in node)
+
+
+class SpotLookup(object):
+    """
+    Finds the spot of each file from a SpotTrie, remembering the result for
+    the most recently used directories so the files in a directory cost one
+    dict probe each after the first.
+    """
+
+    def __init__(self, path2spot=None, memo_size=10000, trie=None):
+        """
+        :param path2spot: Dict of spot path to spot name
+        :param memo_size: Number of directories to remember
+        :param trie: SpotTrie to use rather than building one from path2spot
+        """
+        self.trie = trie if trie is not None else SpotTrie(path2spot)
+        self._directory = functools.lru_cache(maxsize=memo_size)(self.trie.walk)
+
+    def get_spot(self, key):
+        """
+        :param key: Provide a filename or directory
+        :return: Returns the spot which encompasses that file or directory.
+        """
+        key = key.rstrip('/')
+        spot, node = self._directory(os.path.dirname(key))
+
+        # The path itself may be a spot
+        if node is not None:
+            child = node.get(os.path.basename(key))
+            if child is not None:
+                spot = child.get(_SPOT, spot)
+
+        return spot
+
+    def has_spots_below(self, path):
+        return self.trie.has_spots_below(path)
+
+
+def snapshot_path(spot_file):
+    """
+    :param spot_file: Path of the spot ini file
+    :return: Path of the snapshot written next to it
+    """
+    return spot_file + SNAPSHOT_SUFFIX
+
 
 class SpotMapping(object):
     """
@@ -9,12 +134,22 @@ class SpotMapping(object):
         path2spotmapping = provide a file path and the spot will be returned
     """
     url = "http://cedaarchiveapp.ceda.ac.uk/cedaarchiveapp/fileset/download_conf/"
-    spot2pathmapping = {}
-    path2spotmapping = {}
 
-    def __init__(self, test=False, from_file=False, spot_file=None):
+    # Spots downloaded but not used to find the spot of a file
+    EXCLUDED_SPOTS = ("spot-2502-backup-test",)
+
+    def __init__(self, test=False, from_file=False, spot_file=None, path2spot=None, exclude=EXCLUDED_SPOTS):
+
+        self.spot2pathmapping = {}
+        self.path2spotmapping = {}
+        self._lookup = None
+
+        if path2spot is not None:
+            for path, spot in path2spot.items():
+                self.spot2pathmapping[spot] = path
+                self.path2spotmapping[path] = spot
 
-        if test:
+        elif test:
             self.spot2pathmapping['spot-1400-accacia'] = "/badc/accacia"
             self.spot2pathmapping['abacus'] = "/badc/abacus"
 
@@ -33,7 +168,7 @@ class SpotMapping(object):
             for line in log_mapping:
                 if not line.strip(): continue
                 spot, path = line.strip().split()
-                if spot in ("spot-2502-backup-test",): continue
+                if spot in exclude: continue
                 self.spot2pathmapping[spot] = path
                 self.path2spotmapping[path] = spot
 
@@ -55,20 +190,75 @@ class SpotMapping(object):
         """
         The directory stored in elasticsearch is the basename for the specific file. The directory stored on the spots
         page is further up the directory structure but there is no common cut off point as it depends on how many files there
-        are in each dataset. This function recursively starts at the end of the directory stored in elasticsearch
-        and gradually moves back up the file structure until it finds a match in the path2spot dict.
+        are in each dataset. This function finds the longest spot path which contains the directory stored in
+        elasticsearch, using a trie of the spot paths.
 
         :param key: Provide a filename or directory
         :return: Returns the spot which encompasses that file or directory.
         """
 
-        while (key not in self.path2spotmapping) and (key != '/'):
-            key = os.path.dirname(key)
+        return self.lookup.get_spot(key)
+
+    @property
+    def lookup(self):
+        if self._lookup is None:
+            self._lookup = SpotLookup(self.path2spotmapping)
+
+        return self._lookup
+
+    def has_spots_below(self, path):
+        return self.lookup.has_spots_below(path)
+
+    def write_snapshot(self, filename):
+        """
+        Write the mapping and its trie to a snapshot file which scan jobs can
+        load without downloading and parsing the mapping.
+
+        :param filename: Path of the snapshot file
+        """
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "created": time.time(),
+            "path2spot": self.path2spotmapping,
+            "trie": self.lookup.trie.root
+        }
+
+        # Written under another name first so a job never reads half a snapshot
+        tmp_file = "{}.{}.tmp".format(filename, os.getpid())
+
+        with open(tmp_file, "wb") as writer:
+            pickle.dump(snapshot, writer, protocol=pickle.HIGHEST_PROTOCOL)
 
-        if key == '/':
+        os.rename(tmp_file, filename)
+
+    @classmethod
+    def from_snapshot(cls, filename, max_age=None):
+        """
+        Load a mapping written by write_snapshot.
+
+        :param filename: Path of the snapshot file
+        :param max_age: Seconds after which the snapshot is out of date, None for no limit
+        :return: SpotMapping or None if there is no snapshot or it is out of date
+        """
+        try:
+            with open(filename, "rb") as reader:
+                snapshot = pickle.load(reader)
+        except (IOError, OSError, pickle.UnpicklingError, EOFError) as ex:
+            logger.warning("Could not read spot snapshot {}: {}".format(filename, ex))
             return None
 
-        return self.path2spotmapping[key]
+        if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+            logger.warning("Ignoring spot snapshot {} written by another version.".format(filename))
+            return None
+
+        if max_age is not None and time.time() - snapshot["created"] > max_age:
+            logger.warning("Ignoring out of date spot snapshot {}.".format(filename))
+            return None
+
+        mapping = cls(path2spot=snapshot["path2spot"])
+        mapping._lookup = SpotLookup(trie=SpotTrie(root=snapshot["trie"]))
+
+        return mapping
 
     def get_spot_from_storage_path(self, path):
         """
@@ -10,15 +10,20 @@ import json
 import six
 import re
 import io
+import itertools
 import datetime
 from dateutil import parser
 import hashlib
+import threading
 import logging
 import ldap3
 from ldap3.core.exceptions import LDAPSessionTerminatedByServerError
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Union, List
 from pwd import getpwuid
 from grp import getgrgid
+from fbs.proc.common_util.walker import walk_files
+import fbs.proc.common_util.id_cache as id_cache
 
 # Python 2/3 compatibility
 if sys.version_info.major > 2:
@@ -90,24 +95,87 @@ class FileFormatError(Exception):
 
 class LotusRunner:
     """
-    Class to handle running of tasks using the LOTUS scheduler
+    Class to handle running of tasks using the LOTUS scheduler.
+
+    The tasks are written to a manifest file, one command per line, and
+    submitted as Slurm array jobs. Each array task runs the command on the
+    line given by its SLURM_ARRAY_TASK_ID, using run_array_task.py.
     """
-    def __init__(self, queue='par-single'):
+
+    ARRAY_TASK_SCRIPT = os.path.realpath(
+        os.path.join(os.path.dirname(__file__), "../../cmdline/run_array_task.py"))
+
+    def __init__(self, queue='par-single', max_concurrent=128, max_array_size=10000,
+                 manifest_dir='lotus_manifests'):
+        """
+        :param queue: LOTUS queue (Slurm partition) to submit to
+        :param max_concurrent: Most tasks of each array to run at once (the %N throttle)
+        :param max_array_size: Most tasks in one array job, see MaxArraySize in slurm.conf
+        :param manifest_dir: Directory to write the manifests to. They must
+                             stay in place until the tasks have run.
+        """
         self.queue = queue
+        self.max_concurrent = max_concurrent
+        self.max_array_size = max_array_size
+        self.manifest_dir = manifest_dir
         self.task_list = []
 
-    def _run_tasks_in_lotus(self) -> None:
+    def _run_tasks_in_lotus(self, task_file: Optional[str] = None) -> None:
+        """
+        Write the task list to a manifest and submit it as array jobs
+        :param task_file: File the tasks were read from. It is cut down to the
+                          tasks not yet submitted after each array, so a rerun
+                          after a failed submission carries on from there.
+        """
+
+        if not self.task_list:
+            return
+
+        manifest = self._write_manifest()
+
+        for offset in range(0, len(self.task_list), self.max_array_size):
+            size = min(self.max_array_size, len(self.task_list) - offset)
+            self._submit_array(manifest, offset, size)
+
+            if task_file is not None:
+                self._write_remaining_tasks(task_file, offset + size)
+
+    def _write_remaining_tasks(self, filename: str, submitted: int) -> None:
         """
-        Submit all tasks in task list
+        Replace the task file with the tasks not yet submitted
+        :param filename: Path to the task file
+        :param submitted: Number of tasks submitted so far
         """
 
-        for task in self.task_list:
-            self._submit_job(task)
+        # Written under another name first so the file is never left half written
+        tmp_path = filename + '.tmp'
+        write_list_to_file(self.task_list[submitted:], tmp_path)
+        os.rename(tmp_path, filename)
 
-    def _submit_job(self, task: str) -> None:
+    def _write_manifest(self) -> str:
         """
-        Submit the job to LOTUS
-        :param task: Task to submit
+        Write the task list to a new manifest file
+        :return: Absolute path to the manifest
+        """
+
+        if not os.path.exists(self.manifest_dir):
+            os.makedirs(self.manifest_dir)
+
+        name = 'tasks_{}_{}.txt'.format(datetime.datetime.now().strftime('%Y%m%dT%H%M%S'), os.getpid())
+        manifest = os.path.abspath(os.path.join(self.manifest_dir, name))
+
+        write_list_to_file(self.task_list, manifest)
+        write_list_index(manifest)
+
+        return manifest
+
+    def _submit_array(self, manifest: str, offset: int, size: int) -> None:
+        """
+        Submit an array job running lines offset to offset + size - 1 of the manifest
+        :param manifest: Path to the manifest
+        :param offset: Line of the manifest run by array task 0
+        :param size: Number of tasks in the array
+        :raises subprocess.CalledProcessError: sbatch failed
         """
 
         if self.queue == 'short-serial':
@@ -115,11 +183,21 @@ class LotusRunner:
         else:
             wall_time = '48:00:00'
 
-        command = f'sbatch -p {self.queue} -t {wall_time} -e lotus_errors/%j.err {task}'
+        array = f'0-{size - 1}'
+        if self.max_concurrent:
+            array += f'%{self.max_concurrent}'
+
+        command = ['sbatch', '-p', self.queue, '-t', wall_time, f'--array={array}',
+                   '-e', 'lotus_errors/%A_%a.err', self.ARRAY_TASK_SCRIPT, manifest, str(offset)]
+
+        print(f'Executing command: {" ".join(command)}')
 
-        print(f'Executing command: {command}')
+        status = subprocess.call(command)
 
-        subprocess.call(command, shell=True)
+        if status != 0:
+            logger.error(f'sbatch exited with status {status}. Lines {offset} onwards of {manifest} '
+                         f'were not submitted.')
+            raise subprocess.CalledProcessError(status, command)
 
     def read_task_file(self, filename: str) -> None:
         """
@@ -127,12 +205,12 @@ class LotusRunner:
         :param filename: Path to file containing list of tasks
         """
         with open(filename) as reader:
-            self.task_list = reader.read().splitlines()
+            self.task_list = [line for line in reader.read().splitlines() if line.strip()]
 
     @staticmethod
     def remove_task_file(filename: str) -> None:
         """
-        Delete the task file once the jobs have been submitted
+        Delete the task file once every job has been submitted
 
         :param filename: File to remove
         """
@@ -152,44 +230,141 @@ class LotusRunner:
     def run_tasks_file_in_lotus(self, filename: str) -> None:
         """
         Load the tasks from file and run in lotus
-        scheduler
+        scheduler. If a submission fails the file is kept, holding only
+        the tasks not yet submitted.
 
         :param filename: Path to file containing list of tasks
+        :raises subprocess.CalledProcessError: sbatch failed
         """
 
         self.read_task_file(filename)
 
-        self._run_tasks_in_lotus()
+        self._run_tasks_in_lotus(filename)
 
         self.remove_task_file(filename)
 
 
+class LocalRunner:
+    """
+    Class to handle running of tasks on this host.
+
+    Up to max_concurrent commands run at once, each in its own shell. A
+    command which exits with a non-zero status is run again, up to retries
+    more times, and the progress of the whole run is printed as each
+    command finishes.
+    """
+
+    def __init__(self, max_concurrent=1, retries=0):
+        """
+        :param max_concurrent: Most commands to run at once
+        :param retries: Times to rerun a command which fails
+        """
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.retries = max(0, int(retries))
+        self.lock = threading.Lock()
+        self.finished = 0
+        self.failed = 0
+
+    def _run_task(self, task: str, total: int) -> int:
+        """
+        Run one command, retrying it if it fails
+        :param task: Shell command
+        :param total: Number of commands in the run, for the progress
+        :return: Exit status of the last attempt
+        """
+
+        for attempt in range(self.retries + 1):
+            status = subprocess.call(task, shell=True)
+
+            if status == 0:
+                break
+
+            if attempt < self.retries:
+                print(f'Command exited with status {status}, retrying ({attempt + 1}/{self.retries}): {task}')
+
+        with self.lock:
+            self.finished += 1
+            if status != 0:
+                self.failed += 1
+
+            print(f'[{self.finished}/{total}] {"Failed" if status else "Done"} (status {status}): {task}')
+
+        return status
+
+    def run_tasks(self, task_list: list) -> List[int]:
+        """
+        Run the tasks on this host
+
+        :param task_list: List of tasks to run
+        :return: Exit status of each task, in the order given
+        """
+
+        self.finished = 0
+        self.failed = 0
+        total = len(task_list)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+            statuses = list(executor.map(lambda task: self._run_task(task, total), task_list))
+
+        print(f'Ran {total} commands: {total - self.failed} succeeded, {self.failed} failed.')
+
+        return statuses
+
+
 class LDAPIdentifier:
     """
     Provides interface to interact with LDAP and get user names
     and group names. The results are cached, as this information
     doesn't change, to reduce load on LDAP.
+
+    Names are looked up in this order: the in-memory cache, the shared
+    IdNameCache if one is given, the local passwd and group databases and
+    finally LDAP. The connection to LDAP is only made when it is needed.
     """
-    def __init__(self, **kwargs):
+
+    USER_BASE = 'ou=jasmin,ou=People,o=hpc,dc=rl,dc=ac,dc=uk'
+    GROUP_BASE = 'ou=ceda,ou=Groups,o=hpc,dc=rl,dc=ac,dc=uk'
+
+    # Most ids looked up by one search
+    OR_FILTER_SIZE = 200
+
+    def __init__(self, cache=None, **kwargs):
         """
+        :param cache: IdNameCache shared between jobs, or None
         :param kwargs: ldap3 Connection kwargs
         """
-        self.conn = ldap3.Connection(**kwargs)
+        self.connection_kwargs = kwargs
+        self._conn = None
+        self.cache = cache
         self.users = {}
         self.groups = {}
+        self.lock = threading.Lock()
 
-    def _process_result(self, key: str) -> Optional[str]:
+    @classmethod
+    def connect(cls, hosts: List[str], timeout: float = 10, cache=None, **kwargs) -> 'LDAPIdentifier':
         """
-        Process LDAP response object and return the first value for the
-        given key.
+        Connect to the first LDAP server which answers within the timeout
+
+        :param hosts: LDAP host names
+        :param timeout: Seconds to wait for each server to accept the connection
+                        and for each response
+        :param cache: IdNameCache shared between jobs, or None
+        :param kwargs: Other ldap3 Connection kwargs
+        :return: LDAPIdentifier
+        """
+        servers = [ldap3.Server(host, connect_timeout=timeout) for host in hosts]
+
+        return cls(cache=cache, server=servers, receive_timeout=timeout, **kwargs)
 
-        :param result: LDAP response object
-        :param key: key to return
-        :return: value
+    @property
+    def conn(self) -> ldap3.Connection:
+        """
+        The LDAP connection, made on first use
         """
-        if self.conn.entries:
-            entry = self.conn.entries[0]
-            return getattr(entry, key).value
+        if self._conn is None:
+            self._conn = ldap3.Connection(**self.connection_kwargs)
+
+        return self._conn
 
     def _ldap_query(self, *args, **kwargs) -> None:
         """
@@ -207,58 +382,95 @@ class LDAPIdentifier:
             self.conn.bind()
             self.conn.search(*args, **kwargs)
 
-    def _get_ldap_user(self, uid: Union[str, int]) -> Union[str, int]:
+    def _search_names(self, ids: List[int], base: str, object_class: str,
+                      id_attribute: str, name_attribute: str) -> dict:
         """
-        Get the user listed in LDAP with the given UID
+        Look up the names of several ids with one search per OR_FILTER_SIZE ids
 
-        :param uid: UID to search for
-        :return: Username related to UID or UID
+        :return: Dict of id to name for the ids found
         """
-        result = uid
+        names = {}
 
-        try:
-            result = getpwuid(uid).pw_name
+        for i in range(0, len(ids), self.OR_FILTER_SIZE):
+            terms = ''.join(f'({id_attribute}={id_number})' for id_number in ids[i:i + self.OR_FILTER_SIZE])
 
-        except KeyError:
             self._ldap_query(
-                'ou=jasmin,ou=People,o=hpc,dc=rl,dc=ac,dc=uk',
-                f'(&(objectClass=posixAccount)(uidNumber={uid}))',
-                attributes='uid',
-                size_limit=1
+                base,
+                f'(&(objectClass={object_class})(|{terms}))',
+                attributes=[id_attribute, name_attribute]
             )
 
-            result = self._process_result('uid')
+            for entry in self.conn.entries:
+                id_number = self._first_value(getattr(entry, id_attribute).value)
+                name = self._first_value(getattr(entry, name_attribute).value)
 
-        finally:
-            self.users[uid] = result
+                if id_number is not None and name:
+                    names[int(id_number)] = name
 
-        return result
+        return names
 
-    def _get_ldap_group(self, gid: Union[str, int]) -> Union[str, int]:
+    def _lookup_many(self, kind: str, ids, memory: dict, system_lookup, base: str,
+                     object_class: str, id_attribute: str, name_attribute: str) -> dict:
         """
-        Get the group name linked to the given GID
-        :param gid: The GID to search for
-        :return: Common Name for given GID or GID
+        Look up the names of several ids in the caches, then the system, then
+        LDAP. Ids without a name are cached as well as those with one.
+
+        :return: Dict of id to name, or None for ids without a name
         """
-        result = gid
+        ids = [int(id_number) for id_number in ids]
 
-        try:
-            result = getgrgid(gid).gr_name
+        with self.lock:
+            unknown = [id_number for id_number in set(ids) if id_number not in memory]
 
-        except KeyError:
-            self._ldap_query(
-                'ou=ceda,ou=Groups,o=hpc,dc=rl,dc=ac,dc=uk',
-                f'(&(objectClass=posixGroup)(gidNumber={gid}))',
-                attributes='cn',
-                size_limit=1
-            )
+            if unknown and self.cache is not None:
+                for id_number, name in self.cache.get_many(kind, unknown).items():
+                    memory[id_number] = name
+
+                unknown = [id_number for id_number in unknown if id_number not in memory]
+
+            if unknown:
+                found = {}
+                not_local = []
+
+                for id_number in unknown:
+                    try:
+                        found[id_number] = system_lookup(id_number)
+                    except KeyError:
+                        not_local.append(id_number)
 
-            result = self._process_result('cn')
+                if not_local:
+                    ldap_names = self._search_names(sorted(not_local), base, object_class,
+                                                    id_attribute, name_attribute)
 
-        finally:
-            self.users[gid] = result
+                    for id_number in not_local:
+                        found[id_number] = ldap_names.get(id_number)
 
-        return result
+                memory.update(found)
+
+                if self.cache is not None:
+                    self.cache.put_many(kind, found.items())
+
+            return {id_number: memory[id_number] for id_number in ids}
+
+    def get_users(self, uids) -> dict:
+        """
+        Look up the user names for several UIDs with at most one LDAP search
+
+        :param uids: user IDs
+        :return: Dict of UID to username, or None if it has none
+        """
+        return self._lookup_many(id_cache.USER, uids, self.users, lambda uid: getpwuid(uid).pw_name,
+                                 self.USER_BASE, 'posixAccount', 'uidNumber', 'uid')
+
+    def get_groups(self, gids) -> dict:
+        """
+        Look up the group names for several GIDs with at most one LDAP search
+
+        :param gids: group IDs
+        :return: Dict of GID to group name, or None if it has none
+        """
+        return self._lookup_many(id_cache.GROUP, gids, self.groups, lambda gid: getgrgid(gid).gr_name,
+                                 self.GROUP_BASE, 'posixGroup', 'gidNumber', 'cn')
 
     def get_user(self, uid: Union[str, int]) -> Union[str, int]:
         """
@@ -266,15 +478,8 @@ class LDAPIdentifier:
         :param uid: user ID
         :return: Username with UID or UID
         """
-
-        # Try the cache to see if the user ID is stored
-        if self.users.get(uid):
-            return self.users.get(uid)
-
-        # Try to get the username from the filesystem
-        # If the names are not mounted for the uids then
-        # query LDAP directly
-        return self._get_ldap_user(uid)
+        name = self.get_users([uid])[int(uid)]
+        return uid if name is None else name
 
     def get_group(self, gid: Union[str, int]) -> Union[str, int]:
         """
@@ -283,14 +488,74 @@ class LDAPIdentifier:
         :param gid: group ID
         :return: Groupname with GID or GID
         """
+        name = self.get_groups([gid])[int(gid)]
+        return gid if name is None else name
+
+    @staticmethod
+    def _first_value(value):
+        """
+        Attributes may be returned as a list of values
+        """
+        if isinstance(value, (list, tuple)):
+            return value[0] if value else None
+        return value
+
+    def _paged_names(self, base: str, object_class: str, id_attribute: str,
+                     name_attribute: str, page_size: int):
+        """
+        Page through every entry of a class in LDAP
+
+        :return: Generator of (id, name) tuples
+        """
+        entries = self.conn.extend.standard.paged_search(
+            base,
+            f'(objectClass={object_class})',
+            attributes=[id_attribute, name_attribute],
+            paged_size=page_size,
+            generator=True
+        )
+
+        for entry in entries:
+            if entry.get('type') != 'searchResEntry':
+                continue
+
+            attributes = entry['attributes']
+            id_number = self._first_value(attributes.get(id_attribute))
+            name = self._first_value(attributes.get(name_attribute))
+
+            if id_number is not None and name:
+                yield int(id_number), name
+
+    def prefill(self, page_size: int = 1000) -> int:
+        """
+        Fill the shared cache with every user and group in LDAP, using paged
+        searches. Only one job fills the cache in each ttl period, the others
+        return straight away.
+
+        :param page_size: Number of entries in each page of results
+        :return: Number of names cached
+        """
+        if self.cache is None:
+            return 0
+
+        cached = 0
+        searches = (
+            (id_cache.USER, self.USER_BASE, 'posixAccount', 'uidNumber', 'uid'),
+            (id_cache.GROUP, self.GROUP_BASE, 'posixGroup', 'gidNumber', 'cn')
+        )
 
-        # Try the cache
-        if self.groups.get(gid):
-            return self.users.get(gid)
+        for kind, base, object_class, id_attribute, name_attribute in searches:
+            if not self.cache.claim_prefill(kind):
+                continue
 
-        # Try to get the group name from file system.
-        # If names not mounted, query LDAP direct
-        return self._get_ldap_group(gid)
+            names = list(self._paged_names(base, object_class, id_attribute, name_attribute, page_size))
+            self.cache.put_many(kind, names)
+            self.cache.finish_prefill(kind)
+
+            logger.info(f'Cached {len(names)} {kind} names from LDAP')
+            cached += len(names)
+
+        return cached
 
 
 def delete_folder(folder):
@@ -317,6 +582,20 @@ def sanitise_args(config):
     return sane_conf
 
 
+def cfg_bool(value):
+    """
+    Interpret a boolean option which may come from the command line
+    (a bool) or from the configuration file (a string).
+
+    :param value: The option value
+    :returns: bool
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "on", "1")
+
+    return bool(value)
+
+
 def read_conf(conf_path):
     """
     Reads configuration file into a dictionary.
@@ -392,30 +671,30 @@ def get_settings(conf_path, args):
     return defaults
 
 
-def build_file_list(path):
+def build_file_list(path, threads=8, follow_symlinks=False):
     """
     :param path : A file path
+    :param threads : Number of threads listing directories
+    :param follow_symlinks : Descend into symbolic links to directories
     :return: List of files contained within the specified directory.
     """
-    
-    file_list = []
-    for root, _, files in os.walk(path):
-        for each_file in files:
-            if each_file[0] == ".": continue
-            if os.path.islink(each_file): continue
-
-            file_list.append(os.path.join(root, each_file))
-
-    return file_list
+    return list(walk_files(path, threads=threads, follow_symlinks=follow_symlinks))
 
 
 def write_list_to_file(task_list, filename):
+    """
+    :param task_list : Iterable of lines to write
+    :param filename : The file to write to
+    :returns: The number of lines written
+    """
+    num_lines = 0
+
     with open(filename, 'w') as writer:
-        writer.writelines(
-            map(lambda x: x + "\n", task_list)
-        )
+        for line in task_list:
+            writer.write(line + "\n")
+            num_lines += 1
 
-    return len(task_list)
+    return num_lines
 
 
 def read_file_into_list(filename):
@@ -502,6 +781,188 @@ def find_num_lines_in_file(filename):
     return num_lines
 
 
+LIST_INDEX_SUFFIX = ".idx"
+LIST_INDEX_VERSION = 1
+LIST_INDEX_STRIDE = 1000
+
+
+def list_index_path(filename):
+    """
+    :param filename : Name of a file list.
+    :returns: Path of the offset index for the file list.
+    """
+    return filename + LIST_INDEX_SUFFIX
+
+
+def write_list_index(filename, stride=LIST_INDEX_STRIDE, extra=None):
+    """
+    Writes a sidecar offset index for a file list. The first line of the
+    index is a JSON header holding the number of lines in the list and the
+    size and modification time of the list when the index was made. Each
+    following line holds the byte offset of every stride-th line of the list.
+
+    :param filename : Name of the file list.
+    :param stride : Number of list lines between recorded offsets.
+    :param extra : Dict of further values about the list to keep in the header.
+    :returns: The number of lines in the file list.
+    """
+    offsets = []
+    num_lines = 0
+    offset = 0
+
+    with open(filename, "rb") as fd:
+        for line in fd:
+            if num_lines % stride == 0:
+                offsets.append(offset)
+            offset += len(line)
+            num_lines += 1
+
+        stat = os.fstat(fd.fileno())
+
+    header = dict(extra or {})
+    header.update({
+        "version": LIST_INDEX_VERSION,
+        "lines": num_lines,
+        "stride": stride,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns
+    })
+
+    # Write to a temporary file first so that a job never reads
+    # a partly written index.
+    index_file = list_index_path(filename)
+    tmp_file = "{}.{}.tmp".format(index_file, os.getpid())
+
+    with open(tmp_file, "w") as writer:
+        writer.write(json.dumps(header) + "\n")
+        writer.writelines("{}\n".format(o) for o in offsets)
+
+    os.rename(tmp_file, index_file)
+
+    return num_lines
+
+
+def read_list_index(filename):
+    """
+    Reads the offset index for a file list.
+
+    :param filename : Name of the file list.
+    :returns: (header dict, list of offsets) or None if there is no index
+              or the list has changed since the index was written.
+    """
+    try:
+        with open(list_index_path(filename)) as fd:
+            header = json.loads(fd.readline())
+            offsets = [int(line) for line in fd]
+
+        stat = os.stat(filename)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if header.get("version") != LIST_INDEX_VERSION \
+            or header.get("size") != stat.st_size \
+            or header.get("mtime") != stat.st_mtime_ns:
+        logger.warning("Ignoring out of date index for {}.".format(filename))
+        return None
+
+    return header, offsets
+
+
+LIST_SIZES_SUFFIX = ".sizes"
+
+
+def list_sizes_path(filename):
+    """
+    :param filename : Name of a file list.
+    :returns: Path of the file holding the size of each file in the list.
+    """
+    return filename + LIST_SIZES_SUFFIX
+
+
+def write_list_sizes(sizes, filename):
+    """
+    Writes the size in bytes of each file in a file list, one per line in
+    the same order as the list. -1 is written for files which could not
+    be read.
+
+    :param sizes : Iterable of sizes.
+    :param filename : Name of the file list.
+    """
+    with open(list_sizes_path(filename), "w") as writer:
+        writer.writelines("{}\n".format(size) for size in sizes)
+
+
+def read_list_sizes(filename):
+    """
+    Reads the sizes written by write_list_sizes.
+
+    :param filename : Name of the file list.
+    :returns: Generator of sizes, or None if there is no sizes file or it
+              is older than the list.
+    """
+    sizes_file = list_sizes_path(filename)
+
+    try:
+        if os.path.getmtime(sizes_file) < os.path.getmtime(filename):
+            return None
+    except OSError:
+        return None
+
+    def sizes():
+        with open(sizes_file) as fd:
+            for line in fd:
+                yield int(line)
+
+    return sizes()
+
+
+def count_list_lines(filename):
+    """
+    Returns the number of lines in a file list from its index header,
+    writing the index first if it is missing or out of date.
+
+    :param filename : Name of the file list.
+    :returns: The number of lines in the file list.
+    """
+    index = read_list_index(filename)
+
+    if index is not None:
+        return index[0]["lines"]
+
+    try:
+        return write_list_index(filename)
+    except (IOError, OSError):
+        # The directory is not writable, count the lines instead.
+        return find_num_lines_in_file(filename)
+
+
+def read_list_slice(filename, start, num_lines):
+    """
+    Yields num_lines lines from a file list starting at line start, without
+    the trailing newline. When the list has an index the reader seeks to
+    the nearest recorded offset rather than reading from the beginning.
+
+    :param filename : Name of the file list.
+    :param start : Number of the first line to read (from 0).
+    :param num_lines : Number of lines to read.
+    """
+    index = read_list_index(filename)
+
+    with open(filename, "rb") as fd:
+        skip = start
+
+        if index is not None:
+            header, offsets = index
+            block = start // header["stride"]
+
+            if block < len(offsets):
+                fd.seek(offsets[block])
+                skip = start - block * header["stride"]
+
+        for line in itertools.islice(fd, skip, skip + num_lines):
+            yield line.decode("utf-8", "surrogateescape").rstrip("\n")
+
+
 def valid_attr_length(name, value):
     if len(value) < MAX_ATTR_LENGTH \
             and len(name) < MAX_ATTR_LENGTH:
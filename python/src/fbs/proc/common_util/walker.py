@@ -0,0 +1,254 @@
+"""
+'Walker' module - lists the files below a directory using several threads.
+
+Listing a directory on a parallel file system is dominated by the round
+trips to the metadata servers, so directories are listed with os.scandir
+by a pool of threads. Each thread keeps its own stack of directories to
+list and, when it runs out, steals the oldest directory from another
+thread's stack. The files found are streamed to the caller while the
+walk carries on.
+"""
+
+import collections
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Placed on the output queue when every directory has been listed.
+_END_OF_WALK = object()
+
+
+class DirectoryWalker(object):
+    """
+    Multi-threaded replacement for os.walk which yields the os.DirEntry of
+    each file found. The entries keep the information returned by scandir
+    so callers can take a FileStat snapshot without another lookup.
+
+    Hidden files are skipped. Symbolic links to files are returned. Symbolic
+    links to directories are only followed when follow_symlinks is set, in
+    which case each directory is listed once however many links lead to it.
+    """
+
+    def __init__(self, threads=8, follow_symlinks=False, queue_size=100, stat=False):
+        """
+        :param threads: Number of threads listing directories
+        :param follow_symlinks: Descend into symbolic links to directories
+        :param queue_size: Maximum number of listed directories waiting to be read by the caller
+        :param stat: Fetch the lstat of each file in the walker threads, where it is
+                     cached on the entry for the caller
+        """
+        self.threads = max(1, int(threads))
+        self.follow_symlinks = follow_symlinks
+        self.queue_size = queue_size
+        self.stat = stat
+
+    def walk(self, top):
+        """
+        Walk the directory tree.
+
+        :param top: Directory to start from
+        :return: Generator of os.DirEntry for each file
+        """
+        walk = _Walk(self, top)
+        walk.start()
+
+        try:
+            while True:
+                batch = walk.output.get()
+
+                if batch is _END_OF_WALK:
+                    break
+
+                for entry in batch:
+                    yield entry
+        finally:
+            walk.stop()
+
+    def files(self, top):
+        """
+        :param top: Directory to start from
+        :return: Generator of the path of each file
+        """
+        for entry in self.walk(top):
+            yield entry.path
+
+
+class _Walk(object):
+    """
+    The state of a single walk shared by the walker threads.
+    """
+
+    def __init__(self, walker, top):
+        self.follow_symlinks = walker.follow_symlinks
+        self.stat = walker.stat
+        self.output = queue.Queue(maxsize=walker.queue_size)
+
+        self.stacks = [collections.deque() for _ in range(walker.threads)]
+        self.stacks[0].append(top)
+
+        # Directories queued or being listed. The walk is over when it reaches 0.
+        self.pending = 1
+        self.lock = threading.Lock()
+        self.work = threading.Condition(self.lock)
+        self.stopped = threading.Event()
+
+        # (st_dev, st_ino) of the directories listed, used when following links
+        self.visited = set()
+
+        self.thread_list = [
+            threading.Thread(target=self._run, args=(i,), name='walker-{}'.format(i), daemon=True)
+            for i in range(walker.threads)
+        ]
+
+    def start(self):
+        for thread in self.thread_list:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop the threads, for example when the caller stops reading early.
+        """
+        self.stopped.set()
+
+        with self.work:
+            self.work.notify_all()
+
+        # Make room for any thread blocked on a full output queue
+        while any(thread.is_alive() for thread in self.thread_list):
+            try:
+                self.output.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _next_directory(self, index):
+        """
+        Take a directory from this thread's stack, or steal one from another
+        thread. Waits while other threads may still find more directories.
+
+        :return: Directory path or None when the walk is over
+        """
+        own = self.stacks[index]
+
+        with self.work:
+            while not self.stopped.is_set():
+                if own:
+                    return own.pop()
+
+                for stack in self.stacks:
+                    if stack:
+                        # Steal from the other end, the directories nearest the top
+                        return stack.popleft()
+
+                if self.pending == 0:
+                    return None
+
+                self.work.wait()
+
+        return None
+
+    def _put(self, batch):
+        """
+        Put a batch of entries on the output queue unless the walk has been stopped.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.output.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _list(self, directory):
+        """
+        List one directory.
+
+        :return: (file entries, sub-directory paths)
+        """
+        files = []
+        subdirs = []
+
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            subdirs.append(entry.path)
+
+                        elif entry.is_file() and not entry.name.startswith("."):
+                            if self.stat:
+                                entry.stat(follow_symlinks=False)
+                            files.append(entry)
+
+                    except OSError as ex:
+                        logger.warning("Could not read {}: {}".format(entry.path, ex))
+
+        except OSError as ex:
+            logger.warning("Could not list directory {}: {}".format(directory, ex))
+
+        return files, subdirs
+
+    def _first_visit(self, directory):
+        """
+        When following links, whether this is the first time the directory has been seen.
+        """
+        if not self.follow_symlinks:
+            return True
+
+        try:
+            st = os.stat(directory)
+        except OSError:
+            return False
+
+        key = (st.st_dev, st.st_ino)
+
+        with self.lock:
+            if key in self.visited:
+                return False
+            self.visited.add(key)
+
+        return True
+
+    def _run(self, index):
+        while True:
+            directory = self._next_directory(index)
+
+            if directory is None:
+                break
+
+            files, subdirs = ([], [])
+            if self._first_visit(directory):
+                files, subdirs = self._list(directory)
+
+            if files:
+                self._put(files)
+
+            with self.work:
+                self.stacks[index].extend(subdirs)
+                self.pending += len(subdirs) - 1
+
+                if subdirs or self.pending == 0:
+                    self.work.notify_all()
+
+                finished = self.pending == 0
+
+            if finished:
+                self._put(_END_OF_WALK)
+                break
+
+        # Wake the other threads so they see the walk is over.
+        with self.work:
+            self.work.notify_all()
+
+
+def walk_files(top, threads=8, follow_symlinks=False):
+    """
+    List the paths of the files below a directory.
+
+    :param top: Directory to start from
+    :param threads: Number of threads listing directories
+    :param follow_symlinks: Descend into symbolic links to directories
+    :return: Generator of file paths
+    """
+    return DirectoryWalker(threads=threads, follow_symlinks=follow_symlinks).files(top)
@@ -7,6 +7,7 @@ Script_status = Enum("Script_status",
                       READ_DATASET_FROM_FILE_AND_SCAN\
                       RUN_SCRIPT_IN_LOTUS \
                       RUN_SCRIPT_IN_LOCALHOST \
+                      RUN_SCRIPT_IN_QUEUE \
                       READ_AND_SCAN_DATASETS_SUB \
                       READ_AND_SCAN_DATASETS \
                       STAY_IDLE"
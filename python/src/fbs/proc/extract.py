@@ -2,22 +2,130 @@
 'Extract' module - handles file crawling and metadata extraction.
 """
 
+import array
 import datetime
 import logging
+import logging.handlers
 import os
 import hashlib
+import itertools
+import multiprocessing
 import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import fbs.proc.common_util.util as util
 import fbs.proc.file_handlers.handler_picker as handler_picker
-from elasticsearch.exceptions import TransportError
+from elasticsearch.exceptions import ElasticsearchException, TransportError
 from es_iface.factory import ElasticsearchClientFactory
 from es_iface import index
+from es_iface.bulk import BulkSender, ChunkSizer
+from fbs.proc.sandbox import SandboxPool, WorkerTimeout, WorkerCrashed, WorkerMemoryLimit, START_METHOD
+from fbs.proc.file_handlers.generic_file import GenericFile
+from fbs.proc.common_util.file_stat import FileStat
+from fbs.proc.common_util.file_header import FileHeader
+from fbs.proc.common_util.walker import DirectoryWalker
+from fbs.proc.common_util.lazy import LazyResource
+from fbs.proc.common_util.id_cache import IdNameCache
+from fbs.proc.throughput import ThroughputStats
+from fbs.proc.checkpoint import ScanCheckpoint, UNCHANGED, PROPERTIES_ERROR
+import fbs.proc.common_util.spot_mapping as spot_mapping
 from ceda_elasticsearch_tools.core.log_reader import SpotMapping
-from elasticsearch.helpers import bulk
 
 # Suppress requests logging messages
 logging.getLogger("requests").setLevel(logging.WARNING)
 
+logger = logging.getLogger(__name__)
+
+# Handler picker used by each worker process in the ExtractPar pool.
+_worker_handler_picker = None
+
+
+def extract_file_metadata(handler_factory, filename, level, calculate_md5=False, file_stat=None):
+    """
+    Returns metadata from the given file using the best handler
+    the handler factory can find.
+
+    :param handler_factory: HandlerPicker instance
+    :param filename: Path of the file to scan
+    :param level: Level of detail to retrieve
+    :param calculate_md5: Whether to calculate the md5 checksum
+    :param file_stat: FileStat snapshot for the file, taken here if not given
+    :return: Metadata tuple or None
+    """
+    file_stat = file_stat or FileStat(filename)
+
+    if not file_stat.is_file:
+        logger.error("{} Is not a file.".format(filename))
+        return None
+
+    try:
+        # Read at most once, by the picker or the handler
+        file_header = FileHeader(filename, file_stat=file_stat)
+        handler = handler_factory.pick_best_handler(filename, file_header)
+
+        if handler is not None:
+            handler_inst = handler(filename, level,
+                                   calculate_md5=calculate_md5,
+                                   file_stat=file_stat,
+                                   file_header=file_header)  # Can this done within the HandlerPicker class.
+            metadata = handler_inst.get_metadata()
+            logger.debug("{} was read using handler {}.".format(filename, handler_inst.handler_id))
+            return metadata
+
+        else:
+            logger.error("{} could not be read by any handler.".format(filename))
+            return None
+
+    except MemoryError:
+        # Reported by the sandbox as a memory limit rather than a handler error
+        raise
+
+    except Exception as ex:
+        logger.error("Could not process file: {}".format(ex))
+
+
+def _init_worker(log_queue=None, log_level=logging.NOTSET):
+    """
+    Set up the handler picker for a worker process in the extraction pool.
+    Workers are started from a fork server and do not inherit the logging
+    set up by the parent, so their records are sent to the parent's log
+    through the queue.
+
+    :param log_queue: multiprocessing Queue read by the parent, or None
+    :param log_level: Level of the parent's root logger
+    """
+    global _worker_handler_picker
+    _worker_handler_picker = handler_picker.HandlerPicker()
+
+    if log_queue is not None:
+        logging.root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        logging.root.setLevel(log_level)
+
+        for name in ("elasticsearch", "nappy", "urllib3"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+class _ParentLogHandler(logging.Handler):
+    """
+    Passes the records logged by the worker processes to the parent's
+    logger of the same name, so they go to the log file of the current scan.
+    """
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def _process_file_in_worker(filename, level, calculate_md5, file_stat=None):
+    """
+    Extract the metadata for a single file inside a worker process.
+    The metadata is returned to the parent which builds the bulk actions.
+
+    :return: (metadata, seconds taken)
+    """
+    start = time.monotonic()
+    metadata = extract_file_metadata(_worker_handler_picker, filename, level, calculate_md5, file_stat)
+    return metadata, time.monotonic() - start
+
 
 class ExtractSeq(object):
     """
@@ -26,23 +134,22 @@ class ExtractSeq(object):
     Files are scanned sequentially (one thread).
     """
 
+    SPOT_FILE = 'ceda_all_datasets.ini'
+
     def __init__(self, conf):
 
         self.configuration = conf
         self.logger = None
         self.handler_factory_inst = None
-        self.file_list = []
 
         self.es = None
         self.dataset_id = None
         self.dataset_dir = None
 
-        # Spot data
-        self.spots = SpotMapping(spot_file='ceda_all_datasets.ini')
-
-        # LDAP lookup
-        ldap_hosts = self.conf('ldap-configuration')['hosts'].split(',')
-        self.ldap_interface = util.LDAPIdentifier(server=ldap_hosts, auto_bind=True)
+        # Spot data, LDAP lookup and Elasticsearch client, set up on first use
+        self._spots = LazyResource("spot mapping", self._load_spots)
+        self._ldap = LazyResource("LDAP connection", self._connect_ldap)
+        self._es_client = LazyResource("Elasticsearch client", self._connect_es)
 
         # Define constants
         self.blocksize = 800
@@ -50,14 +157,165 @@ class ExtractSeq(object):
         self.FILE_INDEX_ERROR = "-1"
         self.FILE_INDEXED = "1"
 
+        # Database connection information.
+        self.es_index = self.conf("es-configuration")["es-index"]
+        self.log_file = None
+
+        # Incremental scans only extract files which have changed since
+        # they were last indexed.
+        self.incremental = util.cfg_bool(self.configuration.get("incremental", False))
+        self.mget_batch_size = int(self.conf_option("es-configuration", "mget-batch-size", 1000))
+
+        self._reset_scan_state()
+
+    def _reset_scan_state(self):
+        """
+        Set up the state kept for a single scan. The handlers, LDAP and
+        Elasticsearch connections are kept so one extractor can scan
+        several file list slices in turn.
+        """
+        self.file_list = []
+
         # Variables for storing statistical information.
         self.database_errors = 0
         self.files_properties_errors = 0
         self.files_indexed = 0
+        self.files_unchanged = 0
         self.total_number_of_files = 0
 
-        # Database connection information.
-        self.es_index = self.conf("es-configuration")["es-index"]
+        # Checkpoint for scans of a file list slice
+        self.checkpoint = None
+
+        # Spot of every file in the list being scanned, if they share one,
+        # and the spot snapshot found when the list was made
+        self.list_spot = None
+        self.list_spot_snapshot = None
+
+        # FileStat snapshots taken by the directory walker, by path
+        self.file_stats = {}
+
+        # Time taken to extract metadata, used to plan later scans
+        self.throughput = ThroughputStats()
+
+    @property
+    def spots(self):
+        return self._spots.get()
+
+    @property
+    def ldap_interface(self):
+        return self._ldap.get()
+
+    def _load_spots(self):
+        """
+        Load the spot mapping from the snapshot written by
+        create_datasets_ini_from_spot.py, downloading it if there is no
+        snapshot or it is out of date.
+        """
+        spots = self._spot_snapshot()
+
+        if spots is not None:
+            return spots
+
+        return spot_mapping.SpotLookup(SpotMapping(spot_file=self.SPOT_FILE).path2spotmapping)
+
+    def _spot_snapshot_path(self):
+        """
+        :return: Path of the spot snapshot set in the configuration, else the
+                 one next to the datasets ini being read, else the one recorded
+                 in the index of the file list being scanned, or None
+        """
+        snapshot = self.conf_option("core", "spot-snapshot")
+        if snapshot:
+            return snapshot
+
+        # The filename is the datasets ini when a dataset is given
+        if self.configuration.get("dataset") and self.configuration.get("filename"):
+            return spot_mapping.snapshot_path(os.path.abspath(self.configuration["filename"]))
+
+        return self.list_spot_snapshot
+
+    def _spot_snapshot(self):
+        """
+        :return: The spot mapping from the snapshot, or None if there is no
+                 snapshot or it is out of date
+        """
+        snapshot = self._spot_snapshot_path()
+        max_age = float(self.conf_option("core", "spot-snapshot-max-age", 86400))
+
+        if snapshot is None or not os.path.exists(snapshot):
+            return None
+
+        return spot_mapping.SpotMapping.from_snapshot(snapshot, max_age=max_age)
+
+    def _dataset_spot(self):
+        """
+        The spot is only taken from a snapshot, so making a list never
+        downloads the spot mapping. Without one the scan looks the spot up
+        for each file.
+
+        :return: The spot holding every file below the dataset directory, or
+                 None if there is no snapshot, no spot or the files may be in
+                 different spots.
+        """
+        spots = self._spot_snapshot()
+
+        if spots is None:
+            self.logger.debug("No spot snapshot, not storing the spot of the list.")
+            return None
+
+        if spots.has_spots_below(self.dataset_dir):
+            return None
+
+        return spots.get_spot(self.dataset_dir)
+
+    def _connect_ldap(self):
+        """
+        Set up the LDAP lookup with the uid and gid name cache shared by all
+        jobs, filling the cache from LDAP if it is out of date.
+        """
+        ldap_hosts = self.conf('ldap-configuration')['hosts'].split(',')
+        timeout = float(self.conf_option('ldap-configuration', 'connect-timeout', 10))
+
+        cache_file = self.conf_option('ldap-configuration', 'cache-file')
+        if cache_file is None and 'core' in self.configuration:
+            cache_file = os.path.join(self.conf('core')['log-path'], 'ldap_cache.sqlite')
+
+        cache = None
+        if cache_file is not None:
+            cache = IdNameCache(cache_file, ttl=float(self.conf_option('ldap-configuration', 'cache-ttl', 86400)))
+
+        identifier = util.LDAPIdentifier.connect(ldap_hosts, timeout, cache=cache, auto_bind=True)
+
+        try:
+            identifier.prefill(int(self.conf_option('ldap-configuration', 'page-size', 1000)))
+        except Exception as ex:
+            logger.warning("Could not fill the uid and gid name cache from LDAP: {}".format(ex))
+
+        return identifier
+
+    def _connect_es(self):
+        """
+        Create the Elasticsearch client and the index if necessary.
+        """
+        es = ElasticsearchClientFactory().get_client(self.configuration)
+
+        try:
+            index.create_index(self.configuration, es)
+        except TransportError as te:
+            if te.status_code == 400:
+                pass
+            else:
+                raise TransportError(te)
+
+        return es
+
+    def _prefetch_connections(self):
+        """
+        Start setting up the connections needed by a scan in the background,
+        while the file list is read and the first files are extracted.
+        """
+        for resource in (self._es_client, self._spots, self._ldap):
+            resource.prefetch()
 
     # General purpose methods
     def conf(self, conf_opt):
@@ -71,9 +329,25 @@ class ExtractSeq(object):
             raise AttributeError(
                 "Mandatory configuration option not found: %s" % conf_opt)
 
-    def read_dataset(self):
+    def conf_option(self, section, option, default=None):
+        """
+        Return an optional configuration option from a section of the
+        configuration file, or the default if it is not set.
+        :param str section: The configuration file section
+        :param str option: The name of the configuration option
+        :param default: Value to return if the option is not set
+        """
+        value = self.configuration.get(section, {}).get(option)
+        if value is None or value == "":
+            return default
+        return value
+
+    def read_dataset(self, keep_stats=False):
         """
         Returns the files contained within a dataset.
+
+        :param keep_stats: Keep a FileStat snapshot of each file for the handlers
+        :return: Generator of file paths or None if the dataset is not found
         """
 
         datasets_file = self.conf("filename")
@@ -86,35 +360,149 @@ class ExtractSeq(object):
 
         if self.dataset_dir is not None:
             self.logger.debug("Scannning files in directory {}.".format(self.dataset_dir))
-            return util.build_file_list(self.dataset_dir)
+            return self._walk(self.dataset_dir, keep_stats)
         else:
             return None
 
+    def _walk(self, directory, keep_stats):
+        """
+        Stream the paths of the files below the directory as they are found.
+
+        :param directory: Directory to walk
+        :param keep_stats: Keep a FileStat snapshot of each file from the directory listing
+        :return: Generator of file paths
+        """
+        walker = DirectoryWalker(
+            threads=int(self.conf_option("scanning", "walker-threads", 8)),
+            follow_symlinks=util.cfg_bool(self.configuration.get("followlinks", False)),
+            stat=keep_stats
+        )
+
+        for entry in walker.walk(directory):
+            if keep_stats:
+                self.file_stats[entry.path] = FileStat.from_dir_entry(entry)
+
+            self.total_number_of_files += 1
+            yield entry.path
+
     def process_file_seq(self, filename, level):
         """
         Returns metadata from the given file.
         """
         calculate_md5 = self.conf("calculate_md5")
-        if not os.path.isfile(filename):
-            self.logger.error("{} Is not a file.".format(filename))
-            return None
 
         try:
-            handler = self.handler_factory_inst.pick_best_handler(filename)
+            return extract_file_metadata(self.handler_factory_inst, filename, level, calculate_md5,
+                                         self.file_stats.pop(filename, None))
+        except MemoryError as ex:
+            self.logger.error("Could not process file: {} MemoryError: {}".format(filename, ex))
+            return None
 
-            if handler is not None:
-                handler_inst = handler(filename, level,
-                                       calculate_md5=calculate_md5)  # Can this done within the HandlerPicker class.
-                metadata = handler_inst.get_metadata()
-                self.logger.debug("{} was read using handler {}.".format(filename, handler_inst.handler_id))
-                return metadata
+    def _extract_metadata(self, file_list, level):
+        """
+        Extract the metadata for each file in the list.
+        Files are processed sequentially in this process.
 
-            else:
-                self.logger.error("{} could not be read by any handler.".format(filename))
-                return None
+        :param file_list: File list to operate on
+        :param level: Level of detail to retrieve
+        :return: Generator of (file, metadata) tuples
+        """
+        for file in file_list:
+            start = time.monotonic()
+            metadata = self.process_file_seq(file, level)
+            self._record_throughput(file, level, metadata, time.monotonic() - start)
 
-        except Exception as ex:
-            self.logger.error("Could not process file: {}".format(ex))
+            yield file, metadata
+
+    def _record_throughput(self, file, level, metadata, seconds):
+        """
+        Record the time taken to extract the metadata for the scan planner.
+        """
+        if metadata is not None:
+            self.throughput.record(file, level, metadata[0]["info"].get("size", 0), seconds)
+
+    def throughput_path(self):
+        """
+        Path of the JSON file holding the throughput measured by this scan.
+        Sits in the throughput directory alongside the log file.
+        """
+        if self.log_file is None:
+            return None
+
+        log_dir, log_fname = os.path.split(self.log_file)
+        return os.path.join(log_dir, "throughput", os.path.splitext(log_fname)[0] + ".json")
+
+    @staticmethod
+    def _file_state(file_stat):
+        """
+        The values stored in the index which show whether a file has changed.
+
+        :param file_stat: FileStat snapshot of the file
+        :return: (last_modified, size) or None if the file can't be read
+        """
+        file_stats = file_stat.stat
+        if file_stats is None:
+            return None
+
+        return datetime.datetime.fromtimestamp(file_stats.st_mtime).isoformat(), file_stats.st_size
+
+    def _is_unchanged(self, doc, state, level):
+        """
+        Whether the indexed document is up to date for the file.
+
+        :param doc: Document returned by mget
+        :param state: (last_modified, size) of the file on disk
+        :param level: Level of detail requested for this scan
+        """
+        if state is None or not doc.get("found"):
+            return False
+
+        info = doc.get("_source", {}).get("info", {})
+
+        return (info.get("last_modified"), info.get("size")) == state \
+            and int(info.get("scan_level", 0)) >= int(level)
+
+    def _changed_files(self, file_list, level):
+        """
+        Look up the indexed documents for the files in batches and yield
+        only the files which are new, have changed, or were indexed at a
+        lower level than requested.
+
+        :param file_list: File list to operate on
+        :param level: Level of detail to retrieve
+        :return: Generator of file paths
+        """
+        files = iter(file_list)
+
+        while True:
+            batch = list(itertools.islice(files, self.mget_batch_size))
+            if not batch:
+                break
+
+            ids = [hashlib.sha1(str(file).encode('utf-8')).hexdigest() for file in batch]
+
+            try:
+                result = self.es.mget(
+                    index=self.es_index,
+                    body={"ids": ids},
+                    _source_includes="info.last_modified,info.size,info.scan_level"
+                )
+                docs = result["docs"]
+            except ElasticsearchException as ex:
+                self.logger.warning("Could not look up indexed files, scanning all {} in batch: {}".format(
+                    len(batch), ex))
+                docs = [{}] * len(batch)
+
+            for file, doc in zip(batch, docs):
+                # Keep the snapshot for the handler if the file is scanned
+                file_stat = self.file_stats.setdefault(file, FileStat(file))
+
+                if self._is_unchanged(doc, self._file_state(file_stat), level):
+                    del self.file_stats[file]
+                    self.files_unchanged += 1
+                    self._file_done(file, UNCHANGED)
+                else:
+                    yield file
 
     def is_valid_result(self, result):
 
@@ -160,14 +548,12 @@ class ExtractSeq(object):
         self.logger.debug("Bulk indexing results")
         start = datetime.datetime.now()
 
-        for file in file_list:
-
-            metadata = self.process_file_seq(file, level)
+        for file, metadata in self._extract_metadata(file_list, level):
 
             if metadata is not None:
 
                 # Get spot info
-                spot = self.spots.get_spot(file)
+                spot = self.list_spot or self.spots.get_spot(file)
 
                 es_id = hashlib.sha1(str(file).encode('utf-8')).hexdigest()
 
@@ -177,17 +563,19 @@ class ExtractSeq(object):
                 if spot is not None:
                     body['info']['spot_name'] = spot
 
-                uid = body['info']['user']
-                gid = body['info']['group']
+                body['info']['scan_level'] = int(level)
 
-                body['info']['user'] = self.ldap_interface.get_user(uid)
-                body['info']['group'] = self.ldap_interface.get_group(gid)
+                # The uid and gid are replaced by names in _resolve_owners
 
                 doc = {
                     '_index': self.es_index,
                     '_id': es_id,
                     '_source': body
                 }
+
+                if self.checkpoint is not None:
+                    self.checkpoint.sent(es_id, file)
+
                 yield doc
 
             else:
@@ -195,6 +583,44 @@ class ExtractSeq(object):
                 self.logger.error("%s|%s|%s|%s ms" % (
                 os.path.basename(file), os.path.dirname(file), self.FILE_PROPERTIES_ERROR, str(end - start)))
                 self.files_properties_errors = self.files_properties_errors + 1
+                self._file_done(file, PROPERTIES_ERROR)
+
+    def _resolve_owners(self, actions):
+        """
+        Replace the uid and gid in each action with the user and group names.
+        Run by the bulk sender for each chunk, so the names missing from the
+        caches are looked up with one LDAP search per chunk rather than one
+        per file, away from the extraction loop. If LDAP cannot be reached,
+        or an id has no name, the id is left in place.
+
+        :param actions: List of bulk actions
+        """
+        infos = [action['_source']['info'] for action in actions]
+
+        try:
+            users = self.ldap_interface.get_users(info['user'] for info in infos)
+            groups = self.ldap_interface.get_groups(info['group'] for info in infos)
+        except Exception as ex:
+            self.logger.error("Could not look up user and group names: {}".format(ex))
+            return
+
+        for info in infos:
+            info['user'] = self._owner_name(users, info['user'])
+            info['group'] = self._owner_name(groups, info['group'])
+
+    @staticmethod
+    def _owner_name(names, owner_id):
+        """
+        :param names: Dict of id to name returned by the LDAP lookup
+        :param owner_id: uid or gid from the file
+        :return: The name for the id, or the id if it has none
+        """
+        try:
+            name = names.get(int(owner_id))
+        except (TypeError, ValueError):
+            return owner_id
+
+        return owner_id if name is None else name
 
     def bulk_index(self, file_list, level):
         """
@@ -204,7 +630,88 @@ class ExtractSeq(object):
         :return:
         """
 
-        bulk(self.es, self._generate_action_list(file_list, level))
+        sizer = ChunkSizer(
+            initial_bytes=int(self.conf_option("es-configuration", "bulk-chunk-bytes", 5 * 1024 * 1024)),
+            min_bytes=int(self.conf_option("es-configuration", "bulk-min-chunk-bytes", 256 * 1024)),
+            max_bytes=int(self.conf_option("es-configuration", "bulk-max-chunk-bytes", 50 * 1024 * 1024)),
+            target_latency=float(self.conf_option("es-configuration", "bulk-target-latency", 5))
+        )
+
+        sender = BulkSender(
+            self.es,
+            chunk_size=self.blocksize,
+            sizer=sizer,
+            queue_size=int(self.conf_option("es-configuration", "bulk-queue-size", 1000)),
+            senders=int(self.conf_option("es-configuration", "bulk-senders", 1)),
+            max_retries=int(self.conf_option("es-configuration", "bulk-max-retries", 5)),
+            initial_backoff=float(self.conf_option("es-configuration", "bulk-initial-backoff", 2)),
+            max_backoff=float(self.conf_option("es-configuration", "bulk-max-backoff", 600)),
+            dead_letter_file=self.dead_letter_path(),
+            on_error=self._log_index_error,
+            on_chunk_done=self.checkpoint.chunk_done if self.checkpoint is not None else None,
+            prepare_chunk=self._resolve_owners
+        )
+
+        if self.incremental:
+            file_list = self._changed_files(file_list, level)
+
+        with sender:
+            sender.send_all(self._generate_action_list(file_list, level))
+
+        self.files_indexed += sender.succeeded
+        self.database_errors += sender.failed
+
+        if sender.failed:
+            self.logger.error("%s documents could not be indexed and were written to %s"
+                              % (sender.failed, sender.dead_letters.path))
+
+        self.logger.info("Bulk timings for Dataset id : %s, %s" % (self.dataset_id, sender.summary()))
+
+        if self.throughput_path() is not None:
+            self.throughput.save(self.throughput_path())
+
+        if self.incremental:
+            self.logger.info("Incremental scan for Dataset id : %s, files unchanged : %s"
+                             % (self.dataset_id, self.files_unchanged))
+
+    def dead_letter_path(self):
+        """
+        Path of the NDJSON file which holds documents that could not be indexed.
+        Sits in the dead_letters directory alongside the log file.
+        """
+        if self.log_file is None:
+            return None
+
+        log_dir, log_fname = os.path.split(self.log_file)
+        return os.path.join(log_dir, "dead_letters", os.path.splitext(log_fname)[0] + ".ndjson")
+
+    def checkpoint_path(self):
+        """
+        Path of the checkpoint for a scan of a file list slice. Sits in the
+        checkpoints directory alongside the log file. The host name is left
+        out so a job restarted on another node finds it.
+        """
+        return os.path.join(
+            self.conf("core")["log-path"],
+            "checkpoints",
+            "%s__%s_%s_%s.json" % (self.es_index, os.path.basename(self.conf("filename")),
+                                  self.conf("start"), self.conf("num-files"))
+        )
+
+    def _file_done(self, file, outcome):
+        """
+        Record a file which will not be sent to Elasticsearch in the checkpoint.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.done(file, outcome)
+
+    def _log_index_error(self, action, error):
+        """
+        Log a document which could not be indexed.
+        """
+        info = action['_source']['info']
+        self.logger.error("%s|%s|%s|%s" % (
+            info['name'], info['directory'], self.FILE_INDEX_ERROR, error.get('status')))
 
     def scan_files(self):
         """
@@ -216,24 +723,23 @@ class ExtractSeq(object):
             return
 
         # Create index if necessary
-        self.logger.debug("Setting elastic search index.")
-        es_factory = ElasticsearchClientFactory()
-        self.es = es_factory.get_client(self.configuration)
-
-        try:
-            index.create_index(self.configuration, self.es)
-        except TransportError as te:
-            if te.status_code == 400:
-                pass
-            else:
-                raise TransportError(te)
+        if self.es is None:
+            self.logger.debug("Setting elastic search index.")
+            self.es = self._es_client.get()
 
         level = self.conf("level")
 
-        self.logger.debug("File list contains {} files.".format(len(self.file_list)))
-        if len(self.file_list) > 0:
-            self.bulk_index(self.file_list, level)
+        # A list read from a file can be checked before the scan. Files
+        # found by the directory walker are streamed into the scan.
+        if isinstance(self.file_list, list):
+            self.logger.debug("File list contains {} files.".format(len(self.file_list)))
+
+            if not self.file_list:
+                return
 
+        self.bulk_index(self.file_list, level)
+
+        if self.total_number_of_files > 0:
             # At the end print some statistical info.
             logging.getLogger().setLevel(logging.INFO)
             self.logger.info("Summary information for Dataset id : %s, files indexed : %s, database errors : %s,"
@@ -241,6 +747,17 @@ class ExtractSeq(object):
                              % (self.dataset_id, str(self.files_indexed), str(self.database_errors),
                                 str(self.files_properties_errors), str(self.total_number_of_files)))
 
+            self._log_format_cache_stats()
+
+    def _log_format_cache_stats(self):
+        """
+        Log how the files identified by their content were found.
+        """
+        if self.handler_factory_inst is not None:
+            self.logger.info("Files identified by their content, format cache hits : {hits}, misses : {misses},"
+                             " spot checks : {checks}, format changes : {changes}"
+                             .format(**self.handler_factory_inst.format_cache.stats()))
+
     def prepare_logging_sdf(self):
         """
         Initializes  logging.
@@ -280,6 +797,7 @@ class ExtractSeq(object):
         urllib3_log.setLevel(logging.ERROR)
 
         self.logger = logging.getLogger(__name__)
+        self.log_file = fpath
 
     def store_dataset_to_file(self):
         """
@@ -287,13 +805,28 @@ class ExtractSeq(object):
         """
         self.prepare_logging_sdf()
         self.logger.debug("***Scanning started.***")
-        self.file_list = self.read_dataset()
+        self.file_list = self.read_dataset(keep_stats=True)
 
         if self.file_list is not None:
             file_to_store_paths = self.conf("make-list")
 
+            # The size of each file is kept for the scan planner
+            sizes = array.array('q')
+
+            def paths_and_sizes():
+                for path in self.file_list:
+                    file_stat = self.file_stats.pop(path)
+                    sizes.append(file_stat.stat.st_size if file_stat.stat is not None else -1)
+                    yield path
+
             try:
-                files_written = util.write_list_to_file(self.file_list, file_to_store_paths)
+                files_written = util.write_list_to_file(paths_and_sizes(), file_to_store_paths)
+                util.write_list_sizes(sizes, file_to_store_paths)
+                extra = {"spot-snapshot": self._spot_snapshot_path()}
+                spot = self._dataset_spot()
+                if spot:
+                    extra["spot"] = spot
+                util.write_list_index(file_to_store_paths, extra=extra)
             except Exception as ex:
                 self.logger.error("Could not save the python list of files to file...{}".format(ex))
             else:
@@ -339,6 +872,7 @@ class ExtractSeq(object):
         # urllib3_log.addHandler(logging.FileHandler(fpath_es))
 
         self.logger = logging.getLogger(__name__)
+        self.log_file = fpath
 
     def read_dataset_from_file_and_scan(self):
         """
@@ -348,9 +882,21 @@ class ExtractSeq(object):
         # Set up logger and handler class.
         self.prepare_logging_rdf()
         self.logger.debug("***Scanning started.***")
-        self.handler_factory_inst = handler_picker.HandlerPicker()
 
         file_containing_paths = self.conf("filename")
+
+        # The spot found when the list was made, if all its files share one.
+        # Read before the spot mapping is loaded, which uses the snapshot
+        # recorded with it.
+        index = util.read_list_index(file_containing_paths)
+        self.list_spot = index[0].get("spot") if index is not None else None
+        self.list_spot_snapshot = index[0].get("spot-snapshot") if index is not None else None
+
+        self._prefetch_connections()
+
+        if self.handler_factory_inst is None:
+            self.handler_factory_inst = handler_picker.HandlerPicker()
+
         start_file = self.conf("start")
         num_of_files = self.conf("num-files")
 
@@ -361,10 +907,8 @@ class ExtractSeq(object):
         self.dataset_id = os.path.splitext(filename)[0]
         self.logger.debug("Dataset id is  {}.".format(self.dataset_id))
 
-        content = util.read_file_into_list(file_containing_paths)
-
-        self.total_number_of_files = len(content)
-        self.logger.debug("{} lines read from file {}.".format((len(content)), file_containing_paths))
+        self.total_number_of_files = util.count_list_lines(file_containing_paths)
+        self.logger.debug("{} lines in file {}.".format(self.total_number_of_files, file_containing_paths))
 
         if int(start_file) < 0 or int(start_file) > self.total_number_of_files:
             self.logger.error("Please correct start parameter value.")
@@ -375,17 +919,49 @@ class ExtractSeq(object):
             self.logger.error("Please correct num-files parameter value because it is out of range.")
             return
 
-        file_list = content[int(start_file):end_file]
-        content = None
+        # Carry on from the checkpoint left by an earlier run of this job.
+        self.checkpoint = ScanCheckpoint(self.checkpoint_path(), file_containing_paths,
+                                         start_file, num_of_files, self.conf("level"))
+        resume_from = self.checkpoint.resume()
 
-        self.logger.debug("{} files copied in local file list.".format(len(file_list)))
+        if resume_from > int(start_file):
+            self.logger.info("Resuming from line {} using checkpoint {}.".format(resume_from, self.checkpoint.path))
 
-        for path in file_list:
+            for counter, value in self.checkpoint.counters.items():
+                setattr(self, counter, value)
+
+        for path in util.read_list_slice(file_containing_paths, resume_from, end_file - resume_from):
             self.file_list.append(path.rstrip())
 
+        self.checkpoint.expect(self.file_list, resume_from)
+
+        self.logger.debug("{} files copied in local file list.".format(len(self.file_list)))
+
         # at the end extract metadata.
         self.scan_files()
 
+        self.checkpoint.remove()
+
+    def scan_chunk(self, filename, start, num_files, level):
+        """
+        Scan a slice of a file list, reusing the handlers and connections
+        set up by earlier scans with this extractor.
+
+        :param filename: File list
+        :param start: First line of the slice
+        :param num_files: Number of lines in the slice
+        :param level: Level of the scan
+        """
+        self.configuration.update({
+            "filename": filename,
+            "start": start,
+            "num-files": num_files,
+            "level": level
+        })
+
+        self._reset_scan_state()
+        self.read_dataset_from_file_and_scan()
+
     # Functionality for traversing dataset and then immediately extract metadata.
     def prepare_logging_seq_rs(self):
         """
@@ -445,15 +1021,263 @@ class ExtractSeq(object):
         urllib3_log.setLevel(logging.ERROR)
 
         self.logger = logging.getLogger(__name__)
+        self.log_file = fpath
 
     def read_and_scan_dataset(self):
 
         self.prepare_logging_seq_rs()
         self.logger.debug("***Scanning started.***.")
+        self._prefetch_connections()
         self.handler_factory_inst = handler_picker.HandlerPicker()
 
-        self.file_list = self.read_dataset()
-        self.total_number_of_files = len(self.file_list)
+        self.file_list = self.read_dataset(keep_stats=True)
 
-        # Extract metadata.
+        # Extract metadata. The total number of files is counted as they are found.
         self.scan_files()
+
+    def close(self):
+        """
+        Release the resources held by the extractor once it has no more
+        files to scan.
+        """
+        pass
+
+
+class ExtractPar(ExtractSeq):
+    """
+    File crawler and metadata extractor class.
+    Files are scanned in a bounded pool of worker processes. Processes are
+    used rather than threads as the netCDF4 and pyhdf C libraries are not
+    thread-safe. The workers return the metadata to the parent process which
+    builds the actions for the bulk index.
+    """
+
+    def __init__(self, conf):
+        super().__init__(conf)
+
+        # Size of the worker pool and the maximum number of files
+        # submitted to the pool but not yet returned.
+        self.processes = int(self.conf("processes"))
+        self.max_in_flight = int(self.conf("max-in-flight"))
+
+        # Started on first use and kept for every scan by this extractor
+        self._pool = None
+
+        # Records logged by the workers, written by the listener thread
+        self._log_queue = None
+        self._log_listener = None
+
+    def _worker_initargs(self):
+        """
+        :return: Arguments for _init_worker in each worker process
+        """
+        return self._log_queue, logging.getLogger().level
+
+    def _executor(self):
+        """
+        :return: The pool of worker processes used to extract the metadata
+        """
+        return ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                   initargs=self._worker_initargs(),
+                                   mp_context=multiprocessing.get_context(START_METHOD))
+
+    @property
+    def pool(self):
+        """
+        :return: The worker pool, started the first time it is needed
+        """
+        if self._pool is None:
+            self._log_queue = multiprocessing.get_context(START_METHOD).Queue()
+            self._log_listener = logging.handlers.QueueListener(self._log_queue, _ParentLogHandler())
+            self._log_listener.start()
+
+            self._pool = self._executor()
+
+        return self._pool
+
+    def _log_format_cache_stats(self):
+        """
+        Not logged, each worker process has its own format cache.
+        """
+        pass
+
+    def close(self):
+        """
+        Stop the worker pool, then the listener once the workers' last
+        records have been logged.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self._log_listener = None
+            self._log_queue = None
+
+    def _worker_error(self, file, level, ex):
+        """
+        Handle an error raised by the worker pool for a file.
+
+        :return: Metadata to index for the file, or None
+        """
+        self.logger.error("Could not process file: {} {}".format(file, ex))
+        return None
+
+    def _extract_metadata(self, file_list, level):
+        """
+        Extract the metadata for each file in the list using the worker pool.
+        Results are yielded in the order the workers complete them.
+
+        :param file_list: File list to operate on
+        :param level: Level of detail to retrieve
+        :return: Generator of (file, metadata) tuples
+        """
+        calculate_md5 = self.conf("calculate_md5")
+        files = iter(file_list)
+        in_flight = {}
+
+        self.logger.debug("Extracting metadata with {} processes, at most {} files in flight.".format(
+            self.processes, self.max_in_flight))
+
+        executor = self.pool
+
+        try:
+
+            # Fill the pool
+            for file in files:
+                future = executor.submit(_process_file_in_worker, file, level, calculate_md5,
+                                         self.file_stats.pop(file, None))
+                in_flight[future] = file
+
+                if len(in_flight) >= self.max_in_flight:
+                    break
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    file = in_flight.pop(future)
+
+                    try:
+                        metadata, seconds = future.result()
+                        self._record_throughput(file, level, metadata, seconds)
+                    except Exception as ex:
+                        metadata = self._worker_error(file, level, ex)
+
+                    yield file, metadata
+
+                # Top up the pool
+                for file in files:
+                    future = executor.submit(_process_file_in_worker, file, level, calculate_md5,
+                                             self.file_stats.pop(file, None))
+                    in_flight[future] = file
+
+                    if len(in_flight) >= self.max_in_flight:
+                        break
+
+        finally:
+            # The pool is kept for the next scan, so drop the files it has not started
+            for future in in_flight:
+                future.cancel()
+
+
+class ExtractSandboxed(ExtractPar):
+    """
+    File crawler and metadata extractor class.
+    Each file is scanned in a recyclable worker process with a wall clock
+    timeout and a memory limit. A file which crashes, hangs or runs the
+    handler out of memory is indexed with level 1 metadata and a
+    read_status showing what happened, and the scan carries on with a new
+    worker.
+    """
+
+    READ_STATUS_TIMEOUT = "Read Timeout"
+    READ_STATUS_CRASHED = "Handler Crashed"
+    READ_STATUS_MEMORY = "Memory Limit"
+
+    def __init__(self, conf):
+        super().__init__(conf)
+
+        self.file_timeout = float(self.conf("file-timeout")) or None
+        self.memory_limit = int(self.conf("memory-limit")) * 1024 * 1024 or None
+        self.worker_max_files = int(self.conf("worker-max-files")) or None
+
+    def _executor(self):
+        """
+        :return: Pool of sandbox workers used to extract the metadata
+        """
+        return SandboxPool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=self._worker_initargs(),
+            timeout=self.file_timeout,
+            memory_limit=self.memory_limit,
+            max_tasks=self.worker_max_files
+        )
+
+    def _worker_error(self, file, level, ex):
+        """
+        Index level 1 metadata for a file which crashed, hung or ran out of
+        memory in its worker.
+        """
+        if isinstance(ex, WorkerTimeout):
+            read_status = self.READ_STATUS_TIMEOUT
+        elif isinstance(ex, WorkerCrashed):
+            read_status = self.READ_STATUS_CRASHED
+        elif isinstance(ex, WorkerMemoryLimit):
+            read_status = self.READ_STATUS_MEMORY
+        else:
+            return super()._worker_error(file, level, ex)
+
+        self.logger.error("Handler for file {} failed: {}. Falling back to level 1.".format(file, ex))
+
+        metadata = GenericFile(file, "1", calculate_md5=self.conf("calculate_md5")).get_metadata()
+
+        if metadata is not None:
+            metadata[0]["info"]["read_status"] = read_status
+
+        return metadata
+
+
+def get_extractor(conf):
+    """
+    Returns the sandboxed extractor if it has been requested, otherwise
+    the sequential extractor or, if more than one process has been
+    requested, the parallel extractor.
+    """
+    if util.cfg_bool(conf["sandbox"]):
+        return ExtractSandboxed(conf)
+
+    if int(conf["processes"]) > 1:
+        return ExtractPar(conf)
+
+    return ExtractSeq(conf)
+
+
+def set_scan_defaults(config):
+    """
+    Fill in the scan options not supplied by the user from the
+    [scanning] section of the configuration file.
+    """
+    if "start" not in config or not config["start"]:
+        config["start"] = config["scanning"]["start"]
+
+    if "num-files" not in config or not config["num-files"]:
+        config["num-files"] = config["scanning"]["num-files"]
+
+    if "processes" not in config or not config["processes"]:
+        config["processes"] = config["scanning"].get("processes", 1)
+
+    if "max-in-flight" not in config or not config["max-in-flight"]:
+        config["max-in-flight"] = config["scanning"].get("max-in-flight") or int(config["processes"]) * 4
+
+    if "sandbox" not in config or not config["sandbox"]:
+        config["sandbox"] = config["scanning"].get("sandbox", "false")
+
+    if "incremental" not in config or not config["incremental"]:
+        config["incremental"] = config["scanning"].get("incremental", "false")
+
+    for option in ("file-timeout", "memory-limit", "worker-max-files"):
+        if option not in config or not config[option]:
+            config[option] = config["scanning"].get(option, 0)
@@ -16,11 +16,10 @@ class BadcCsvFile(GenericFile):
         self.FILE_FORMAT = self.get_file_format()
 
     def get_file_format(self):
-        with open(self.file_path, encoding='utf-8', errors='ignore') as fp:
-            if 'BADC-CSV' in fp.readline():
-                return 'BADC CSV'
-            else:
-                return 'CSV'
+        if 'BADC-CSV' in (self.file_header.first_line() or ''):
+            return 'BADC CSV'
+        else:
+            return 'CSV'
 
     def csv_parse(self, fp):
 
@@ -65,10 +64,14 @@ class BadcCsvFile(GenericFile):
 
     def get_phenomena(self, fp):
 
-        phen_list = []
-
         phenomena, _, _ = self.csv_parse(fp)
 
+        return self.build_phenomena(phenomena)
+
+    def build_phenomena(self, phenomena):
+
+        phen_list = []
+
         for key in phenomena.keys():
             phen_list.append(phenomena[key])
 
@@ -83,7 +86,7 @@ class BadcCsvFile(GenericFile):
 
         if file_info is not None:
             try:
-                with open(self.file_path, encoding='utf-8', errors='ignore') as fp:
+                with self.file_header.text() as fp:
                     phen = self.get_phenomena(fp)
 
             except Exception:
@@ -109,10 +112,10 @@ class BadcCsvFile(GenericFile):
 
         if file_info is not None:
             try:
-                with open(self.file_path, encoding='utf-8', errors='ignore') as fp:
+                with self.file_header.text() as fp:
                     meta = self.csv_parse(fp)
-                    fp.seek(0)
-                    phenomena = self.get_phenomena(fp)
+
+                phenomena = self.build_phenomena(meta[0])
 
             except Exception:
                 # Problem reading file or extracting metadata
@@ -1,5 +1,7 @@
 import os
 import fbs.proc.common_util.util as util
+from fbs.proc.common_util.file_stat import FileStat
+from fbs.proc.common_util.file_header import FileHeader
 import datetime
 
 
@@ -14,16 +16,22 @@ class GenericFile(object):
         "3": 'get_metadata_level3',
     }
 
-    def __init__(self, file_path, level, calculate_md5=False):
+    def __init__(self, file_path, level, calculate_md5=False, file_stat=None, file_header=None):
         self.file_path = file_path
         self.level = str(level)
         self.handler_id = None
         self.calculate_md5 = calculate_md5
 
+        # Snapshot of the file's stat, shared by everything which needs it.
+        self.file_stat = file_stat or FileStat(file_path)
+
+        # Start of the file, read once and shared with the handler picker.
+        self.file_header = file_header or FileHeader(file_path, file_stat=self.file_stat)
+
     def _get_file_ownership(self):
 
-        uid = os.stat(self.file_path).st_uid
-        gid = os.stat(self.file_path).st_gid
+        uid = self.file_stat.stat.st_uid
+        gid = self.file_stat.stat.st_gid
 
         return uid, gid
 
@@ -39,15 +47,15 @@ class GenericFile(object):
         #Do the basic checking, if file exists 
         #and that it is not a symbolic link.
         if ( self.file_path is None
-             or not os.path.isfile(self.file_path)
-             # or os.path.islink(self.file_path)
+             or not self.file_stat.is_file
+             # or self.file_stat.is_link
            ):
             return None
 
         file_info = {}
         info = {}
 
-        file_stats = os.stat(self.file_path)
+        file_stats = self.file_stat.stat
 
         #Basic information. 
         info["name"] = os.path.basename(self.file_path) #ntpath.basename(file_path)
@@ -59,11 +67,11 @@ class GenericFile(object):
         info["user"] = uid
         info["group"] = gid
 
-        info["is_link"] = os.path.islink(self.file_path)
+        info["is_link"] = self.file_stat.is_link
 
         info["last_modified"] = datetime.datetime.fromtimestamp(file_stats.st_mtime).isoformat()
 
-        info["size"] = os.path.getsize(self.file_path)
+        info["size"] = file_stats.st_size
 
         file_type = os.path.splitext(info["name"])[1]
         if len(file_type) == 0:
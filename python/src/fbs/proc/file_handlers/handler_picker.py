@@ -1,21 +1,184 @@
+"""
+Picks the file handler for each file. Handlers are registered by dotted
+path and their modules are only imported the first time a file of that
+type is seen, so a scan which never meets a netCDF, PP, GRIB or HDF file
+never loads netCDF4, cf, xarray or pyhdf.
+
+Files without an extension are identified by their content, from a table
+of magic numbers and, for anything the table does not know, libmagic if it
+is installed. The format found is remembered for each directory and naming
+pattern, so a directory of many thousands of such files is only sniffed a
+few times.
+"""
+
+import collections
+import importlib
+import logging
 import os
 import re
+import threading
+
+from fbs.proc.file_handlers.generic_file import GenericFile
+import fbs.proc.file_handlers.signatures as signatures
+from fbs.proc.common_util.file_header import FileHeader
+
+logger = logging.getLogger(__name__)
+
+# Handler classes imported so far, by dotted path
+_loaded_handlers = {}
+_load_lock = threading.Lock()
+
+# Runs of digits in a file name, replaced to give its naming pattern
+_DIGITS = re.compile(r"[0-9]+")
+
+# The python-magic module, imported when a file first needs to be sniffed
+_NOT_LOADED = object()
+_magic = _NOT_LOADED
+
+
+def load_handler(path):
+    """
+    Import a handler class the first time it is needed.
 
-from fbs.proc.common_util.util import FileFormatError
-from fbs.proc.file_handlers import generic_file
-from fbs.proc.file_handlers import netcdf_file
-from fbs.proc.file_handlers import nasaames_file
-from fbs.proc.file_handlers import pp_file
-from fbs.proc.file_handlers import grib_file
-from fbs.proc.file_handlers import esasafe_file
-from fbs.proc.file_handlers import kmz_file
-from fbs.proc.file_handlers import hdf_file
-from fbs.proc.file_handlers import badc_csv_file
-from fbs.proc.file_handlers import metadata_tags_json_file
+    If the handler module cannot be imported, for example because the
+    library it needs is not installed, the error is logged once and files
+    of that type are read with the GenericFile handler.
 
-import magic as magic_number_reader
-import fbs.proc.common_util.util as util
-import six
+    :param path: Dotted path of the handler class
+    :return: Handler class
+    """
+    handler = _loaded_handlers.get(path)
+
+    if handler is None:
+        with _load_lock:
+            handler = _loaded_handlers.get(path)
+
+            if handler is None:
+                module_name, class_name = path.rsplit(".", 1)
+
+                try:
+                    handler = getattr(importlib.import_module(module_name), class_name)
+                except (ImportError, AttributeError) as ex:
+                    logger.error("Could not load handler {}, using the generic handler: {}".format(path, ex))
+                    handler = GenericFile
+
+                _loaded_handlers[path] = handler
+
+    return handler
+
+
+def _load_magic():
+    """
+    :return: The python-magic module, or None if it is not installed.
+             The import is only tried once.
+    """
+    global _magic
+
+    if _magic is _NOT_LOADED:
+        try:
+            import magic
+        except ImportError as ex:
+            logger.warning("Files the signature table does not recognise will use the generic handler: {}".format(ex))
+            magic = None
+
+        _magic = magic
+
+    return _magic
+
+
+class FormatCache(object):
+    """
+    Remembers the handler found by reading the content of files, for each
+    directory and file naming pattern. Once confirm_after files with the
+    same pattern in a directory have been read as the same format, later
+    files use that handler without being read. Every check_every-th of
+    those files is read anyway, in case the directory holds a mix of
+    formats.
+    """
+
+    def __init__(self, confirm_after=3, check_every=100, max_entries=10000):
+        """
+        :param confirm_after: Number of files read as the same format before the format is reused
+        :param check_every: Read one in this many of the files given the remembered handler
+        :param max_entries: Number of directory and pattern pairs to remember
+        """
+        self.confirm_after = confirm_after
+        self.check_every = check_every
+        self.max_entries = max_entries
+
+        self.lock = threading.Lock()
+
+        # (directory, pattern): [handler, files confirmed, hits since the last check]
+        self.entries = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.checks = 0
+        self.changes = 0
+
+    @staticmethod
+    def key(filename):
+        """
+        :return: The directory of the file and its name with each run of digits replaced by #
+        """
+        directory, basename = os.path.split(filename)
+        return directory, _DIGITS.sub("#", basename)
+
+    def get(self, key):
+        """
+        :param key: Key made by FormatCache.key
+        :return: The remembered handler, or None if the file should be read
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or entry[1] < self.confirm_after:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            entry[2] += 1
+
+            if entry[2] >= self.check_every:
+                entry[2] = 0
+                self.checks += 1
+                return None
+
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, handler):
+        """
+        Record the handler found by reading a file.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] is handler:
+                entry[1] += 1
+                return
+
+            if entry is not None:
+                logger.debug("Files matching {} are no longer read by {}, found {}.".format(
+                    os.path.join(*key), entry[0].__name__, handler.__name__))
+                self.changes += 1
+
+            self.entries[key] = [handler, 1, 0]
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        :return: Dict of the number of hits, misses, spot checks and changes of format
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "checks": self.checks,
+            "changes": self.changes
+        }
 
 
 class HandlerPicker(object):
@@ -24,106 +187,142 @@ class HandlerPicker(object):
     """
 
     HANDLER_MAP = {
-        '.nc': netcdf_file.NetCdfFile,
-        '.na': nasaames_file.NasaAmesFile,
-        '.pp': pp_file.PpFile,
-        '.grb':  grib_file.GribFile,
-        '.grib': grib_file.GribFile,
-        '.manifest': esasafe_file.EsaSafeFile,
-        '.kmz': kmz_file.KmzFile,
-        '.hdf': hdf_file.HdfFile
+        '.nc': 'fbs.proc.file_handlers.netcdf_file.NetCdfFile',
+        '.na': 'fbs.proc.file_handlers.nasaames_file.NasaAmesFile',
+        '.pp': 'fbs.proc.file_handlers.pp_file.PpFile',
+        '.grb': 'fbs.proc.file_handlers.grib_file.GribFile',
+        '.grib': 'fbs.proc.file_handlers.grib_file.GribFile',
+        '.manifest': 'fbs.proc.file_handlers.esasafe_file.EsaSafeFile',
+        '.kmz': 'fbs.proc.file_handlers.kmz_file.KmzFile',
+        '.hdf': 'fbs.proc.file_handlers.hdf_file.HdfFile'
+    }
+
+    NETCDF_HANDLER = 'fbs.proc.file_handlers.netcdf_file.NetCdfFile'
+    NASAAMES_HANDLER = 'fbs.proc.file_handlers.nasaames_file.NasaAmesFile'
+    GRIB_HANDLER = 'fbs.proc.file_handlers.grib_file.GribFile'
+    BADC_CSV_HANDLER = 'fbs.proc.file_handlers.badc_csv_file.BadcCsvFile'
+    METADATA_TAGS_HANDLER = 'fbs.proc.file_handlers.metadata_tags_json_file.MetadataTagsJsonFile'
+    HDF_HANDLER = 'fbs.proc.file_handlers.hdf_file.HdfFile'
+    KMZ_HANDLER = 'fbs.proc.file_handlers.kmz_file.KmzFile'
+    PP_HANDLER = 'fbs.proc.file_handlers.pp_file.PpFile'
+
+    # Handlers for the formats found from the content of a file. netCDF4
+    # files are HDF5 files.
+    FORMAT_HANDLERS = {
+        signatures.NETCDF: NETCDF_HANDLER,
+        signatures.HDF5: NETCDF_HANDLER,
+        signatures.HDF4: HDF_HANDLER,
+        signatures.GRIB: GRIB_HANDLER,
+        signatures.KMZ: KMZ_HANDLER,
+        signatures.PP: PP_HANDLER,
+        signatures.NASAAMES: NASAAMES_HANDLER,
+        signatures.BADC_CSV: BADC_CSV_HANDLER
     }
 
-    def __init__(self):
-        self.handlers_and_dirs = {}
-        self.NETCDF_PYTHON_MAGIC_NUM_RES = "NetCDF Data Format data"
-        self.ASCII_PYTHON_MAGIC_NUM_RES = "ASCII text"
-        self.DATA_PYTHON_MAGIC_NUM_RES = "data"
+    # Parts of libmagic descriptions, for formats which are not at the start
+    # of the file, such as HDF5 files with a user block.
+    MAGIC_DESCRIPTIONS = (
+        ("NetCDF", signatures.NETCDF),
+        ("Hierarchical Data Format (version 5)", signatures.HDF5),
+        ("Hierarchical Data Format (version 4)", signatures.HDF4),
+        ("GRIB", signatures.GRIB)
+    )
 
-    def pick_best_handler(self, filename):
+    def __init__(self, format_cache=None):
+        """
+        :param format_cache: FormatCache for files identified by their content
+        """
+        self.format_cache = format_cache if format_cache is not None else FormatCache()
+
+    def pick_best_handler(self, filename, file_header=None):
         """
         :param filename : the file to be scanned.
+        :param file_header : FileHeader of the file, to share with the handler.
         :returns handler: Returns an appropriate handler
         for the given file.
         """
+        file_header = file_header or FileHeader(filename)
 
-        file_dir = os.path.dirname(filename)
         file_basename = os.path.basename(filename)
 
         if file_basename == "metadata_tags.json":
-            handler = metadata_tags_json_file.MetadataTagsJsonFile
+            return load_handler(self.METADATA_TAGS_HANDLER)
 
-        else:
-            # Try returning a handler based on file extension.
-            extension = os.path.splitext(filename)[1]
-            extension = extension.lower()
+        # Try returning a handler based on file extension.
+        extension = os.path.splitext(filename)[1]
+        extension = extension.lower()
 
-            if extension == '.csv':
-                try:
-                    header = util.get_bytes_from_file(filename, 500)
-                    pattern_to_search = "Conventions,G,BADC-CSV"
-                    res = header.find(pattern_to_search)
+        if extension == '.csv':
+            pattern_to_search = b"Conventions,G,BADC-CSV"
+
+            if file_header.data is not None and pattern_to_search in file_header.data:
+                return load_handler(self.BADC_CSV_HANDLER)
 
-                    if res != -1:
-                        handler = badc_csv_file.BadcCsvFile
-                    else:
-                        handler = generic_file.GenericFile
+            return GenericFile
 
-                except Exception:  # catch everything... if there is an error just return the generic handler.
-                    handler = generic_file.GenericFile
+        if extension:
+            path = self.HANDLER_MAP.get(extension)
+            return load_handler(path) if path is not None else GenericFile
 
-            else:
-                handler = self.HANDLER_MAP.get(extension, generic_file.GenericFile)
+        # No extension, use the format found for similar files in the
+        # same directory or read the file.
+        key = self.format_cache.key(filename)
+        handler = self.format_cache.get(key)
 
         if handler is not None:
-            self.handlers_and_dirs[file_dir] = handler
             return handler
 
-        # Try returning a handler based on file's magic number.
-        try:
-            res = magic_number_reader.from_file(filename)
+        handler = self.sniff_handler(file_header)
 
-            if res == self.NETCDF_PYTHON_MAGIC_NUM_RES:
-                handler = netcdf_file.NetCdfFile
+        if handler is None:
+            return GenericFile
 
-            elif res == self.ASCII_PYTHON_MAGIC_NUM_RES:
-                # ok lets see if it is a na file.
-                first_line = util.get_file_header(filename)
-                tokens = first_line.split(" ")
+        self.format_cache.put(key, handler)
+        return handler
 
-                if len(tokens) >= 2:
-                    if tokens[0].isdigit() and tokens[1].isdigit():
-                        handler = nasaames_file.NasaAmesFile
-                else:
-                    handler = generic_file.GenericFile
+    def sniff_handler(self, file_header):
+        """
+        :param file_header : FileHeader of the file to be scanned.
+        :returns handler: The handler for the format found from the file's
+        magic number, GenericFile if it is not recognised, or None if the
+        file could not be read.
+        """
+        if file_header.data is None:
+            return None
 
-            # This can be a grb file.
-            elif res == self.DATA_PYTHON_MAGIC_NUM_RES:
-                res = util.get_bytes_from_file(filename, 4)
+        file_format = signatures.identify(file_header.data)
 
-                if res == "GRIB":
-                    handler = grib_file.GribFile
-                else:
-                    handler = generic_file.GenericFile
+        if file_format is None:
+            file_format = self.magic_format(file_header.data)
 
-        except Exception:  # catch everything... if there is an error just return the generic handler.
-            handler = generic_file.GenericFile
+        if file_format is None:
+            return GenericFile
 
-        if handler is not None:
-            self.handlers_and_dirs[file_dir] = handler
-            return handler
+        return load_handler(self.FORMAT_HANDLERS[file_format])
 
-        # Try to return last handler used in this directory.
-        if file_dir in self.handlers_and_dirs.keys():
-            handler = self.handlers_and_dirs[file_dir]
+    def magic_format(self, data):
+        """
+        Last resort for files the signature table does not recognise.
 
-        if handler is not None:
-            return handler
+        :param data : Bytes from the start of the file.
+        :returns: Name of the format libmagic found, or None if it is not
+        one with a handler or python-magic is not installed.
+        """
+        magic_number_reader = _load_magic()
 
-        # Nothing worked, return the generic handler.
-        handler = generic_file.GenericFile
+        if magic_number_reader is None:
+            return None
 
-        return handler
+        try:
+            description = magic_number_reader.from_buffer(data)
+        except Exception:  # catch everything... if there is an error just use the generic handler.
+            return None
+
+        for part, file_format in self.MAGIC_DESCRIPTIONS:
+            if part in description:
+                return file_format
+
+        return None
 
     def __enter__(self):
         return self
@@ -79,7 +79,7 @@ class MetadataTagsJsonFile(GenericFile):
 
             self.handler_id = "Metadata tags json handler level 2."
             try:
-                with open(self.file_path) as reader:
+                with self.file_header.text() as reader:
                     metadata = json.load(reader)
 
                 file_info[0]["info"]["read_status"] = "Successful"
@@ -103,7 +103,7 @@ class MetadataTagsJsonFile(GenericFile):
             self.handler_id = "Metadata tags json handler level 3."
 
             try:
-                with open(self.file_path) as reader:
+                with self.file_header.text() as reader:
                     metadata = json.load(reader)
 
             except Exception:
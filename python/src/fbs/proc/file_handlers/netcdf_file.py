@@ -1,7 +1,9 @@
 import netCDF4
+import numpy.ma as ma
 from fbs.proc.file_handlers.generic_file import GenericFile
 import fbs.proc.common_util.util as util
 import fbs.proc.common_util.geojson as geojson
+import fbs.proc.common_util.coordinate_summary as coordinate_summary
 import six
 from dateutil.parser import parse
 import re
@@ -93,12 +95,13 @@ class NetCdfFile(GenericFile):
                 "lon": [sanitise_float(lon_min), sanitise_float(lon_max)]
             }
 
-        lats = ncdf.variables[lat_name][:].ravel()
-        lons = ncdf.variables[lon_name][:].ravel()
+        # Only the values bounding the coordinates are kept
+        lats = coordinate_summary.summarise(ncdf.variables[lat_name], coordinate_summary.LatitudeSummary())
+        lons = coordinate_summary.summarise(ncdf.variables[lon_name], coordinate_summary.LongitudeSummary())
         return {
             "type": "track",
-            "lat": lats,
-            "lon": lons
+            "lat": lats.values(),
+            "lon": lons.values()
         }
 
     def find_var_by_standard_name(self, ncdf, standard_name):
@@ -122,6 +125,46 @@ class NetCdfFile(GenericFile):
         if lat_name and lon_name:
             return self.geospatial(ncdf, lat_name, lon_name)
 
+    @staticmethod
+    def time_extent(ncdf, time_name):
+        """
+        Return the first and last times of a time coordinate, including its
+        cell bounds if it has any. A 1D coordinate variable is monotonic so
+        only its ends are read, otherwise the variable is read as one array.
+        Only the two values found are converted to dates.
+
+        :param Dataset ncdf: Reference to an opened netCDF4.Dataset object
+        :param time_name: Name of the time variable
+        :returns: (start_time, end_time) or None if there are no times
+        """
+        variable = ncdf.variables[time_name]
+        calendar = getattr(variable, 'calendar', 'standard')
+
+        if variable.size == 0:
+            return None
+
+        values = None
+
+        if variable.dimensions == (time_name,):
+            values = ma.concatenate([variable[:1], variable[-1:]])
+
+        if values is None or ma.count_masked(values):
+            values = variable[:]
+
+        bounds = ncdf.variables.get(getattr(variable, 'bounds', None))
+
+        if bounds is not None and bounds.size > 0:
+            values = ma.concatenate([ma.ravel(values), ma.ravel(bounds[0]), ma.ravel(bounds[-1])])
+
+        values = ma.compressed(values)
+
+        if values.size == 0:
+            return None
+
+        start_time, end_time = netCDF4.num2date([values.min(), values.max()], variable.units, calendar)
+
+        return start_time, end_time
+
     def get_temporal(self, ncdf):
 
         temporal = {}
@@ -137,9 +180,8 @@ class NetCdfFile(GenericFile):
         # coordinate, if we have a coordinate name
         if not all([start_time, end_time]) and time_name:
             try:
-                times = list(netCDF4.num2date(list(ncdf.variables[time_name]),
-                                              ncdf.variables[time_name].units))
-            except AttributeError:
+                times = self.time_extent(ncdf, time_name)
+            except (AttributeError, ValueError):
                 pass
 
         # retrieve the start and end times
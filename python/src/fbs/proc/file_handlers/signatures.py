@@ -0,0 +1,104 @@
+"""
+Identifies the format of a file from its first bytes.
+
+Binary formats are matched against a table of magic numbers, looked up by
+the first four bytes of the file so one dict probe finds the candidates.
+Text formats (NASA Ames and BADC-CSV) are recognised from the first line.
+Nothing here reads the file, the caller passes the bytes it has read.
+"""
+
+import struct
+
+NETCDF = "netcdf"
+HDF5 = "hdf5"
+HDF4 = "hdf4"
+GRIB = "grib"
+KMZ = "kmz"
+PP = "pp"
+NASAAMES = "nasaames"
+BADC_CSV = "badc-csv"
+
+# File format indices of the NASA Ames formats
+NASAAMES_FFI = {1001, 1010, 1020, 2010, 2110, 2160, 2310, 3010, 4010}
+
+ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+def _is_kmz(data):
+    """
+    :return: True if the first member of the zip archive is a KML file
+    """
+    if len(data) < ZIP_LOCAL_HEADER.size:
+        return False
+
+    _, name_length, _ = ZIP_LOCAL_HEADER.unpack_from(data)
+    name = data[ZIP_LOCAL_HEADER.size:ZIP_LOCAL_HEADER.size + name_length]
+
+    return name.lower().endswith(b".kml")
+
+
+# (magic number, format, further check of the data or None)
+SIGNATURES = (
+    (b"CDF\x01", NETCDF, None),
+    (b"CDF\x02", NETCDF, None),
+    (b"CDF\x05", NETCDF, None),
+    (b"\x89HDF\r\n\x1a\n", HDF5, None),
+    (b"\x0e\x03\x13\x01", HDF4, None),
+    (b"GRIB", GRIB, None),
+    (b"PK\x03\x04", KMZ, _is_kmz),
+    # The Fortran record marker before the 64 word PP header, big and
+    # little endian, with 4 and 8 byte words.
+    (b"\x00\x00\x01\x00", PP, None),
+    (b"\x00\x01\x00\x00", PP, None),
+    (b"\x00\x00\x00\x00\x00\x00\x02\x00", PP, None),
+    (b"\x00\x02\x00\x00\x00\x00\x00\x00", PP, None),
+)
+
+
+def _compile(signatures):
+    """
+    :return: Dict of the first four bytes of each magic number to the
+             signatures starting with them
+    """
+    table = {}
+
+    for signature in signatures:
+        table.setdefault(signature[0][:4], []).append(signature)
+
+    return table
+
+
+_TABLE = _compile(SIGNATURES)
+
+
+def _text_format(data):
+    """
+    :return: The text format recognised from the first line, or None
+    """
+    first_line = data.split(b"\n", 1)[0]
+
+    if first_line.startswith(b"Conventions,G,BADC-CSV"):
+        return BADC_CSV
+
+    tokens = first_line.split()
+
+    if len(tokens) == 2 and tokens[0].isdigit() and tokens[1].isdigit() \
+            and int(tokens[1]) in NASAAMES_FFI:
+        return NASAAMES
+
+    return None
+
+
+def identify(data):
+    """
+    :param data: Bytes from the start of a file
+    :return: Name of the format, or None if it is not recognised
+    """
+    if not data:
+        return None
+
+    for magic, file_format, check in _TABLE.get(data[:4], ()):
+        if data.startswith(magic) and (check is None or check(data)):
+            return file_format
+
+    return _text_format(data)
@@ -0,0 +1,52 @@
+"""
+'Planner' module - splits file lists into scan jobs of similar cost.
+
+The cost of each file is estimated from its extension and size using
+the throughput measured by earlier scans. Consecutive files are grouped
+until the estimated cost reaches the target time for a job, so a job of
+small text files holds many more lines than a job of large netCDF files.
+"""
+
+import itertools
+
+import fbs.proc.common_util.util as util
+
+
+def plan_slices(filename, level, target_seconds, max_files, model=None):
+    """
+    Split a file list into slices whose estimated cost is close to the target.
+
+    :param filename: File list
+    :param level: Level of the scan
+    :param target_seconds: Estimated time each slice should take
+    :param max_files: Largest number of files in a slice
+    :param model: CostModel from ThroughputStats, or None to cut slices of max_files
+    :return: Generator of (start, number of files, estimated seconds)
+    """
+    num_lines = util.count_list_lines(filename)
+    sizes = util.read_list_sizes(filename) if model is not None else None
+
+    # Files without a recorded size are costed at the mean size for their extension
+    sizes = itertools.chain(sizes or [], itertools.repeat(None))
+
+    start = 0
+    count = 0
+    cost = 0.0
+
+    lines = util.read_list_slice(filename, 0, num_lines) if model is not None else itertools.repeat(None, num_lines)
+
+    for path, size in zip(lines, sizes):
+        file_cost = model.estimate(path, size) if model is not None else 0.0
+
+        # Close the slice if this file would take it past the target
+        if count and (count >= max_files or cost + file_cost > target_seconds):
+            yield start, count, cost
+            start += count
+            count = 0
+            cost = 0.0
+
+        count += 1
+        cost += file_cost
+
+    if count:
+        yield start, count, cost
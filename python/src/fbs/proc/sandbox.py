@@ -0,0 +1,261 @@
+"""
+'Sandbox' module - runs work in recyclable worker processes.
+
+A segfault or hang inside one of the C libraries used by the file
+handlers only takes down the worker process. The parent sees a
+WorkerCrashed, WorkerTimeout or WorkerMemoryLimit exception for that
+call, and a new worker is started for the next one.
+
+Workers are started from a fork server rather than forked from the
+parent, which runs other threads (bulk senders, the directory walker)
+whose locks could be copied into the worker while held.
+"""
+
+import logging
+import multiprocessing
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Start method of the worker processes
+START_METHOD = "forkserver"
+
+# Status of each result sent by a worker
+_OK = "ok"
+_ERROR = "error"
+_MEMORY = "memory"
+
+
+class WorkerTimeout(Exception):
+    """
+    Raised when a worker does not return within the time limit.
+    """
+    pass
+
+
+class WorkerCrashed(Exception):
+    """
+    Raised when a worker process dies before returning a result.
+    """
+    pass
+
+
+class WorkerMemoryLimit(Exception):
+    """
+    Raised when a call runs out of memory under the worker's address
+    space limit.
+    """
+    pass
+
+
+def _worker_main(conn, initializer, initargs, memory_limit, max_tasks):
+    """
+    Entry point of the worker process. Runs each (function, arguments)
+    received until max_tasks have been run or the parent closes the
+    connection.
+
+    :param conn: Connection to the parent process
+    :param initializer: Optional function to run when the worker starts
+    :param initargs: Arguments for the initializer
+    :param memory_limit: Address space limit in bytes, or None
+    :param max_tasks: Number of tasks to run before exiting, or None
+    """
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    if initializer is not None:
+        initializer(*initargs)
+
+    tasks = 0
+    while max_tasks is None or tasks < max_tasks:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+
+        if task is None:
+            break
+
+        func, args = task
+
+        try:
+            conn.send((_OK, func(*args)))
+        except MemoryError as ex:
+            conn.send((_MEMORY, "MemoryError: {}".format(ex)))
+        except Exception as ex:
+            conn.send((_ERROR, "{}: {}".format(type(ex).__name__, ex)))
+
+        tasks += 1
+
+    conn.close()
+
+
+class SandboxWorker(object):
+    """
+    A single worker process. The process is started on first use and
+    restarted after it has run max_tasks, crashed or timed out.
+    """
+
+    def __init__(self, initializer=None, initargs=(), timeout=None, memory_limit=None, max_tasks=None,
+                 context=None):
+        """
+        :param initializer: Function to run when the worker process starts
+        :param initargs: Arguments for the initializer
+        :param timeout: Wall clock seconds allowed for each call, or None
+        :param memory_limit: Address space limit of the worker in bytes, or None
+        :param max_tasks: Number of calls before the worker is replaced, or None
+        :param context: multiprocessing context used to start the worker
+        """
+        self.context = context or multiprocessing.get_context(START_METHOD)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_tasks = max_tasks
+
+        self.process = None
+        self.conn = None
+        self.tasks = 0
+
+    def _start(self):
+        parent_conn, child_conn = self.context.Pipe()
+
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.initializer, self.initargs, self.memory_limit, self.max_tasks),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+        self.conn = parent_conn
+        self.tasks = 0
+
+    def _kill(self):
+        """
+        Stop the worker process, by force if needed.
+        """
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join()
+            self.conn.close()
+
+        self.process = None
+        self.conn = None
+
+    def run(self, func, *args):
+        """
+        Run the function in the worker process.
+
+        :param func: Module level function to run
+        :param args: Arguments for the function. Must be picklable.
+        :return: Result of the function
+        :raises WorkerTimeout: The call took longer than the timeout
+        :raises WorkerCrashed: The worker process died
+        :raises WorkerMemoryLimit: The call ran out of memory
+        """
+        if self.process is None or (self.max_tasks and self.tasks >= self.max_tasks):
+            self._kill()
+            self._start()
+
+        self.tasks += 1
+
+        try:
+            self.conn.send((func, args))
+
+            if not self.conn.poll(self.timeout):
+                self._kill()
+                raise WorkerTimeout("No result after {} seconds".format(self.timeout))
+
+            status, result = self.conn.recv()
+
+        except (EOFError, OSError):
+            self.process.join()
+            exitcode = self.process.exitcode
+            self._kill()
+            raise WorkerCrashed("Worker exited with code {}".format(exitcode))
+
+        if status == _MEMORY:
+            # Memory may not have been freed, start a new worker for the next call
+            self._kill()
+            raise WorkerMemoryLimit(result)
+
+        if status != _OK:
+            raise RuntimeError(result)
+
+        return result
+
+    def close(self):
+        """
+        Ask the worker process to exit.
+        """
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+
+        self._kill()
+
+
+class SandboxPool(object):
+    """
+    A pool of sandbox workers. Each thread in the pool owns one worker
+    process so the threads only wait on the workers while they do the work.
+    Calls are submitted with ``submit`` which returns a Future, as with the
+    executors in concurrent.futures.
+    """
+
+    def __init__(self, size, **worker_kwargs):
+        """
+        :param size: Number of worker processes
+        :param worker_kwargs: Keyword arguments for each SandboxWorker
+        """
+        self.context = multiprocessing.get_context(START_METHOD)
+        self.worker_kwargs = dict(worker_kwargs, context=self.context)
+
+        self.local = threading.local()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=size)
+
+    def _run(self, func, *args):
+        worker = getattr(self.local, 'worker', None)
+
+        if worker is None:
+            worker = SandboxWorker(**self.worker_kwargs)
+            self.local.worker = worker
+
+            with self.lock:
+                self.workers.append(worker)
+
+        return worker.run(func, *args)
+
+    def submit(self, func, *args):
+        """
+        Run the function with the given arguments in one of the workers.
+
+        :param func: Module level function to run
+        :param args: Arguments for the function. Must be picklable.
+        :return: concurrent.futures.Future
+        """
+        return self.executor.submit(self._run, func, *args)
+
+    def shutdown(self):
+        """
+        Wait for the submitted calls and stop the worker processes.
+        """
+        self.executor.shutdown(wait=True)
+
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
@@ -0,0 +1,176 @@
+"""
+'Throughput' module - records how long files take to scan.
+
+Each scan records, for every file extension and level, the size of the
+files scanned and the time taken to extract their metadata. The records
+of earlier runs are used to estimate the cost of scanning a file as a
+fixed time per file plus a time per byte, fitted by least squares.
+"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class ThroughputStats(object):
+    """
+    Sums of file sizes and extraction times by level and extension. The
+    sums can be merged across runs and are enough to fit
+    seconds = per_file + size * per_byte for each extension.
+    """
+
+    FIELDS = ("files", "bytes", "seconds", "bytes_squared", "bytes_seconds")
+
+    def __init__(self):
+        # level -> extension -> {field: sum}
+        self.stats = {}
+
+    @staticmethod
+    def extension(filename):
+        """
+        :return: The lower case extension used to group files
+        """
+        return os.path.splitext(filename)[1].lower()
+
+    def record(self, filename, level, size, seconds):
+        """
+        Record the time taken to scan a file.
+
+        :param filename: Path of the file
+        :param level: Level of the scan
+        :param size: Size of the file in bytes
+        :param seconds: Time taken to extract the metadata
+        """
+        sums = self.stats.setdefault(str(level), {}).setdefault(
+            self.extension(filename), dict.fromkeys(self.FIELDS, 0))
+
+        sums["files"] += 1
+        sums["bytes"] += size
+        sums["seconds"] += seconds
+        sums["bytes_squared"] += size * size
+        sums["bytes_seconds"] += size * seconds
+
+    def merge(self, other):
+        """
+        Add the sums from another set of stats.
+
+        :param other: Dict in the form of ThroughputStats.stats
+        """
+        for level, extensions in other.items():
+            for extension, other_sums in extensions.items():
+                sums = self.stats.setdefault(level, {}).setdefault(extension, dict.fromkeys(self.FIELDS, 0))
+
+                for field in self.FIELDS:
+                    sums[field] += other_sums.get(field, 0)
+
+    def save(self, path):
+        """
+        Write the stats to a JSON file.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path, "w") as writer:
+            json.dump(self.stats, writer)
+
+    @classmethod
+    def load_dir(cls, directory):
+        """
+        Merge the stats saved by earlier runs.
+
+        :param directory: Directory holding the JSON files written by save
+        :return: ThroughputStats
+        """
+        stats = cls()
+
+        if not os.path.isdir(directory):
+            return stats
+
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+
+            try:
+                with open(os.path.join(directory, name)) as reader:
+                    stats.merge(json.load(reader))
+            except (IOError, OSError, ValueError) as ex:
+                logger.warning("Could not read throughput stats {}: {}".format(name, ex))
+
+        return stats
+
+    @staticmethod
+    def _fit(sums):
+        """
+        Least squares fit of seconds = per_file + size * per_byte.
+
+        :return: (per_file, per_byte)
+        """
+        n = sums["files"]
+        denominator = n * sums["bytes_squared"] - sums["bytes"] ** 2
+
+        if denominator > 0:
+            per_byte = (n * sums["bytes_seconds"] - sums["bytes"] * sums["seconds"]) / denominator
+            per_byte = max(0.0, per_byte)
+        else:
+            per_byte = 0.0
+
+        per_file = max(0.0, (sums["seconds"] - per_byte * sums["bytes"]) / n)
+
+        return per_file, per_byte
+
+    def model(self, level):
+        """
+        Cost model for a level.
+
+        :param level: Level of the scan
+        :return: CostModel or None if nothing has been recorded for the level
+        """
+        extensions = self.stats.get(str(level))
+        if not extensions:
+            return None
+
+        fits = {}
+        total = dict.fromkeys(self.FIELDS, 0)
+
+        for extension, sums in extensions.items():
+            if sums["files"]:
+                fits[extension] = (self._fit(sums), sums["bytes"] / sums["files"])
+
+                for field in self.FIELDS:
+                    total[field] += sums[field]
+
+        if not total["files"]:
+            return None
+
+        return CostModel(fits, (self._fit(total), total["bytes"] / total["files"]))
+
+
+class CostModel(object):
+    """
+    Estimates the seconds needed to scan a file from its extension and size.
+    Extensions which have not been seen use the fit over all extensions.
+    """
+
+    def __init__(self, fits, default):
+        """
+        :param fits: extension -> ((per_file, per_byte), mean size)
+        :param default: ((per_file, per_byte), mean size) over all extensions
+        """
+        self.fits = fits
+        self.default = default
+
+    def estimate(self, filename, size=None):
+        """
+        :param filename: Path of the file
+        :param size: Size in bytes, or None to use the mean size for the extension
+        :return: Estimated seconds
+        """
+        (per_file, per_byte), mean_size = self.fits.get(ThroughputStats.extension(filename), self.default)
+
+        if size is None or size < 0:
+            size = mean_size
+
+        return per_file + size * per_byte
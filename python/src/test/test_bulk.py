@@ -0,0 +1,351 @@
+# encoding: utf-8
+"""
+Tests for the background bulk sender.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from elasticsearch.exceptions import ConnectionError
+from elasticsearch.serializer import JSONSerializer
+
+from fbs.es_iface.bulk import BulkSender, ChunkSizer, DeadLetterFile
+from cmdline.replay_dead_letters import prepare_replay_file
+
+
+class FakeTransport(object):
+    serializer = JSONSerializer()
+
+
+class FakeElasticsearch(object):
+    """
+    Stand-in for the Elasticsearch client which records the bulk requests.
+    """
+
+    def __init__(self, status=None):
+        """
+        :param status: Optional function returning the response status for a document
+        """
+        self.transport = FakeTransport()
+        self.requests = []
+        self.lock = threading.Lock()
+        self.status = status or (lambda doc: 201)
+
+    def bulk(self, *args, body=None, **kwargs):
+        if isinstance(body, (str, bytes)):
+            body = body.splitlines()
+
+        lines = [json.loads(line) for line in body]
+        actions = lines[::2]
+        docs = lines[1::2]
+
+        with self.lock:
+            self.requests.append(docs)
+
+        items = []
+        for action, doc in zip(actions, docs):
+            item = {'_id': action['index']['_id'], 'status': self.status(doc)}
+            if item['status'] >= 300:
+                item['error'] = {'type': 'es_rejected_execution_exception'}
+            items.append({'index': item})
+
+        return {
+            'errors': any(item['index']['status'] >= 300 for item in items),
+            'items': items
+        }
+
+
+def make_actions(n):
+    return [{'_index': 'test', '_id': str(i), '_source': {'value': i}} for i in range(n)]
+
+
+class TestBulkSender(unittest.TestCase):
+
+    def test_all_actions_sent(self):
+        es = FakeElasticsearch()
+
+        with BulkSender(es, queue_size=10, senders=3, chunk_size=7) as sender:
+            sender.send_all(make_actions(100))
+
+        sent = sorted(doc['value'] for request in es.requests for doc in request)
+        self.assertEqual(sent, list(range(100)))
+        self.assertEqual(sender.succeeded, 100)
+        self.assertEqual(sender.failed, 0)
+
+    def test_chunk_size(self):
+        es = FakeElasticsearch()
+
+        with BulkSender(es, senders=1, chunk_size=10) as sender:
+            sender.send_all(make_actions(25))
+
+        self.assertEqual([len(request) for request in es.requests], [10, 10, 5])
+
+    def test_chunks_cut_by_bytes(self):
+        es = FakeElasticsearch()
+        sizer = ChunkSizer(initial_bytes=1000, min_bytes=1000, max_bytes=1000)
+        actions = [{'_index': 'test', '_id': str(i), '_source': {'value': i, 'pad': 'x' * 400}}
+                   for i in range(10)]
+
+        with BulkSender(es, chunk_size=500, sizer=sizer) as sender:
+            sender.send_all(actions)
+
+        # Each action is roughly 450 bytes so a chunk is complete after 3 actions
+        self.assertEqual([len(request) for request in es.requests], [3, 3, 3, 1])
+        self.assertEqual(sizer.chunks, 4)
+        self.assertIn('chunks : 4', sender.summary())
+
+    def test_timings_recorded(self):
+        es = FakeElasticsearch()
+
+        with BulkSender(es) as sender:
+            sender.send_all(make_actions(5))
+
+        self.assertEqual(
+            set(sender.timings),
+            {'extract', 'queue_full_wait', 'queue_empty_wait', 'prepare', 'serialise', 'send'}
+        )
+        self.assertIn('succeeded : 5', sender.summary())
+
+    def test_chunk_prepared_before_sending(self):
+        es = FakeElasticsearch()
+        batches = []
+
+        def prepare(actions):
+            batches.append(len(actions))
+            for action in actions:
+                action['_source']['value'] *= 10
+
+        with BulkSender(es, senders=1, chunk_size=10, prepare_chunk=prepare) as sender:
+            sender.send_all(make_actions(25))
+
+        self.assertEqual(batches, [10, 10, 5])
+        self.assertEqual(sorted(doc['value'] for request in es.requests for doc in request),
+                         [i * 10 for i in range(25)])
+
+    def test_rejected_documents_retried(self):
+        attempts = {}
+
+        def reject_first_attempt(doc):
+            attempts[doc['value']] = attempts.get(doc['value'], 0) + 1
+            return 429 if attempts[doc['value']] == 1 else 201
+
+        es = FakeElasticsearch(status=reject_first_attempt)
+
+        with BulkSender(es, chunk_size=10, initial_backoff=0) as sender:
+            sender.send_all(make_actions(10))
+
+        self.assertEqual(sender.succeeded, 10)
+        self.assertEqual(sender.failed, 0)
+        self.assertEqual(len(es.requests), 2)
+
+    def test_failed_documents_dead_lettered(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        dead_letter_file = os.path.join(tmp_dir, 'dead_letters', 'scan.ndjson')
+        errors = []
+
+        es = FakeElasticsearch(status=lambda doc: 429 if doc['value'] % 2 else 201)
+
+        sender = BulkSender(es, max_retries=2, initial_backoff=0,
+                            dead_letter_file=dead_letter_file,
+                            on_error=lambda action, error: errors.append(action['_id']))
+        with sender:
+            sender.send_all(make_actions(10))
+
+        self.assertEqual(sender.succeeded, 5)
+        self.assertEqual(sender.failed, 5)
+        self.assertEqual(sorted(errors), ['1', '3', '5', '7', '9'])
+
+        # Initial attempt plus two retries
+        self.assertEqual(len(es.requests), 3)
+
+        replayed = list(DeadLetterFile.read(dead_letter_file))
+        self.assertEqual(sorted(action['_id'] for action in replayed), ['1', '3', '5', '7', '9'])
+
+    def test_chunk_done_after_retries(self):
+        attempts = {}
+        chunks = []
+
+        def reject_first_attempt(doc):
+            attempts[doc['value']] = attempts.get(doc['value'], 0) + 1
+            return 429 if attempts[doc['value']] == 1 and doc['value'] % 2 else 201
+
+        es = FakeElasticsearch(status=reject_first_attempt)
+
+        with BulkSender(es, chunk_size=4, initial_backoff=0,
+                        on_chunk_done=lambda results: chunks.append(results)) as sender:
+            sender.send_all(make_actions(8))
+
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(sorted(action['_id'] for action, ok in chunks[0]), ['0', '1', '2', '3'])
+        self.assertTrue(all(ok for chunk in chunks for _, ok in chunk))
+
+    def test_chunk_done_when_retry_raises(self):
+        es = FakeElasticsearch(status=lambda doc: 429 if doc['value'] % 2 else 201)
+        bulk = es.bulk
+
+        def fail_on_retry(*args, **kwargs):
+            if es.requests:
+                raise ValueError('bulk failed')
+            return bulk(*args, **kwargs)
+
+        es.bulk = fail_on_retry
+        chunks = []
+
+        sender = BulkSender(es, chunk_size=4, initial_backoff=0,
+                            on_chunk_done=lambda results: chunks.extend(results))
+        sender.start()
+        sender.send_all(make_actions(4))
+
+        with self.assertRaises(ValueError):
+            sender.close()
+
+        # Indexed on the first attempt, then failed because the sender stopped
+        self.assertEqual(sorted((action['_id'], ok) for action, ok in chunks),
+                         [('0', True), ('1', False), ('2', True), ('3', False)])
+        self.assertEqual(sender.succeeded, 2)
+        self.assertEqual(sender.failed, 2)
+
+    def test_sender_error_does_not_block_producer(self):
+        es = FakeElasticsearch()
+
+        def fail(*args, **kwargs):
+            raise ValueError('bulk failed')
+
+        es.bulk = fail
+        sender = BulkSender(es, queue_size=2, chunk_size=1)
+        sender.start()
+        sender.send_all(make_actions(20))
+
+        with self.assertRaises(ValueError):
+            sender.close()
+
+    def test_sender_error_fails_unsent_documents(self):
+        es = FakeElasticsearch()
+
+        def fail(*args, **kwargs):
+            raise ValueError('bulk failed')
+
+        es.bulk = fail
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        dead_letters = os.path.join(tmp_dir, 'dead.ndjson')
+        extracted = []
+
+        def actions():
+            for action in make_actions(1000):
+                extracted.append(action)
+                yield action
+
+        errors = []
+        sender = BulkSender(es, queue_size=2, chunk_size=1, dead_letter_file=dead_letters,
+                            on_error=lambda action, error: errors.append(action['_id']))
+        sender.start()
+        sender.send_all(actions())
+
+        with self.assertRaises(ValueError):
+            sender.close()
+
+        # Extraction stops soon after the failure and nothing is lost
+        self.assertLess(len(extracted), 1000)
+        self.assertEqual(sender.failed, len(extracted))
+        self.assertEqual(sorted(errors), sorted(action['_id'] for action in extracted))
+        self.assertEqual(len(list(DeadLetterFile.read(dead_letters))), len(extracted))
+
+    def test_request_error_counts_documents_failed(self):
+        es = FakeElasticsearch()
+
+        def unavailable(*args, **kwargs):
+            raise ConnectionError('N/A', 'cluster unavailable', None)
+
+        es.bulk = unavailable
+
+        with BulkSender(es, chunk_size=5) as sender:
+            sender.send_all(make_actions(5))
+
+        self.assertEqual(sender.failed, 5)
+
+
+class TestReplayFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dead_letters = os.path.join(self.tmp_dir, 'dead.ndjson')
+        self.replay_file = self.dead_letters + '.replaying'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, path, ids):
+        letters = DeadLetterFile(path)
+        for action in make_actions(ids):
+            letters.write(action, {'status': 500})
+
+    def replayed_ids(self):
+        return [action['_id'] for action in DeadLetterFile.read(self.replay_file)]
+
+    def test_nothing_to_replay(self):
+        self.assertFalse(prepare_replay_file(self.dead_letters, self.replay_file))
+
+    def test_dead_letters_moved(self):
+        self.write(self.dead_letters, 3)
+
+        self.assertTrue(prepare_replay_file(self.dead_letters, self.replay_file))
+        self.assertFalse(os.path.exists(self.dead_letters))
+        self.assertEqual(self.replayed_ids(), ['0', '1', '2'])
+
+    def test_unfinished_replay_kept(self):
+        self.write(self.replay_file, 2)
+        self.assertTrue(prepare_replay_file(self.dead_letters, self.replay_file))
+        self.assertEqual(self.replayed_ids(), ['0', '1'])
+
+        self.write(self.dead_letters, 3)
+        self.assertTrue(prepare_replay_file(self.dead_letters, self.replay_file))
+        self.assertFalse(os.path.exists(self.dead_letters))
+        self.assertEqual(self.replayed_ids(), ['0', '1', '0', '1', '2'])
+
+
+class TestChunkSizer(unittest.TestCase):
+
+    def setUp(self):
+        self.sizer = ChunkSizer(initial_bytes=1000, min_bytes=100, max_bytes=2000, target_latency=1.0)
+
+    def test_shrinks_on_rejection(self):
+        self.sizer.record(10, 1000, 0.1, rejected=2)
+        self.assertEqual(self.sizer.target_bytes, 500)
+
+    def test_shrinks_when_slow(self):
+        self.sizer.record(10, 1000, 2.0, rejected=0)
+        self.assertEqual(self.sizer.target_bytes, 750)
+
+    def test_grows_when_fast(self):
+        self.sizer.record(10, 1000, 0.1, rejected=0)
+        self.assertEqual(self.sizer.target_bytes, 1250)
+
+    def test_does_not_grow_on_small_chunks(self):
+        self.sizer.record(1, 10, 0.1, rejected=0)
+        self.assertEqual(self.sizer.target_bytes, 1000)
+
+    def test_bounds(self):
+        for _ in range(10):
+            self.sizer.record(10, self.sizer.target_bytes, 0.1, rejected=1)
+        self.assertEqual(self.sizer.target_bytes, 100)
+
+        for _ in range(20):
+            self.sizer.record(10, self.sizer.target_bytes, 0.1, rejected=0)
+        self.assertEqual(self.sizer.target_bytes, 2000)
+
+    def test_summary(self):
+        self.sizer.record(10, 1000, 0.6, rejected=0)
+        self.sizer.record(20, 3000, 0.6, rejected=0)
+
+        self.assertIn('chunk bytes min/mean/max : 1000/2000/3000', self.sizer.summary())
+        self.assertIn('mean actions per chunk : 15.0', self.sizer.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
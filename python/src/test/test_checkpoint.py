@@ -0,0 +1,110 @@
+# encoding: utf-8
+"""
+Tests for the scan checkpoint.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fbs.proc.checkpoint import ScanCheckpoint, INDEXED, INDEX_ERROR, PROPERTIES_ERROR
+
+
+def action(es_id):
+    return {'_index': 'test', '_id': es_id, '_source': {}}
+
+
+class TestScanCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "checkpoints", "scan.json")
+        self.files = ["/badc/file_{}.nc".format(i) for i in range(10)]
+
+        self.list_file = os.path.join(self.tmp_dir, "dataset.txt")
+        with open(self.list_file, "w") as writer:
+            writer.write("\n".join(self.files) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def new_checkpoint(self, level=2):
+        return ScanCheckpoint(self.path, self.list_file, 100, 10, level)
+
+    def saved(self):
+        with open(self.path) as reader:
+            return json.load(reader)
+
+    def test_offset_only_moves_past_contiguous_files(self):
+        checkpoint = self.new_checkpoint()
+        checkpoint.expect(self.files, 100)
+
+        for i, file in enumerate(self.files):
+            checkpoint.sent(str(i), file)
+
+        # Out of order acknowledgement
+        checkpoint.chunk_done([(action('2'), True), (action('3'), False)])
+        self.assertEqual(self.saved()["offset"], 100)
+
+        checkpoint.done(self.files[1], PROPERTIES_ERROR)
+        checkpoint.chunk_done([(action('0'), True)])
+
+        saved = self.saved()
+        self.assertEqual(saved["offset"], 104)
+        self.assertEqual(saved["counters"][INDEXED], 2)
+        self.assertEqual(saved["counters"][INDEX_ERROR], 1)
+        self.assertEqual(saved["counters"][PROPERTIES_ERROR], 1)
+
+    def test_resume(self):
+        checkpoint = self.new_checkpoint()
+        checkpoint.expect(self.files, 100)
+        checkpoint.sent('0', self.files[0])
+        checkpoint.chunk_done([(action('0'), True)])
+
+        resumed = self.new_checkpoint()
+        self.assertEqual(resumed.resume(), 101)
+        self.assertEqual(resumed.counters[INDEXED], 1)
+
+    def test_different_job_is_not_resumed(self):
+        checkpoint = self.new_checkpoint()
+        checkpoint.expect(self.files, 100)
+        checkpoint.sent('0', self.files[0])
+        checkpoint.chunk_done([(action('0'), True)])
+
+        self.assertEqual(self.new_checkpoint(level=3).resume(), 100)
+
+    def test_rewritten_list_is_not_resumed(self):
+        checkpoint = self.new_checkpoint()
+        checkpoint.expect(self.files, 100)
+        checkpoint.sent('0', self.files[0])
+        checkpoint.chunk_done([(action('0'), True)])
+
+        with open(self.list_file, "a") as writer:
+            writer.write("/badc/file_10.nc\n")
+
+        self.assertEqual(self.new_checkpoint().resume(), 100)
+
+    def test_no_checkpoint(self):
+        self.assertEqual(self.new_checkpoint().resume(), 100)
+
+    def test_duplicate_paths(self):
+        checkpoint = self.new_checkpoint()
+        checkpoint.expect([self.files[0], self.files[0]], 100)
+        checkpoint.sent('0', self.files[0])
+        checkpoint.sent('0', self.files[0])
+
+        checkpoint.chunk_done([(action('0'), True), (action('0'), True)])
+        self.assertEqual(self.saved()["offset"], 102)
+
+    def test_remove(self):
+        checkpoint = self.new_checkpoint()
+        checkpoint.chunk_done([])
+        checkpoint.remove()
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
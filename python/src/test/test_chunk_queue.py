@@ -0,0 +1,118 @@
+# encoding: utf-8
+"""
+Tests for the queue of list slices read by scan workers.
+"""
+
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import unittest
+
+from fbs.proc.chunk_queue import ChunkQueue, run_worker, RUNNING, DONE, FAILED
+
+
+class RecordingExtractor(object):
+    """
+    Records the slices it is asked to scan, failing for the list given.
+    """
+
+    def __init__(self, fail_for=None):
+        self.scanned = []
+        self.fail_for = fail_for
+
+    def scan_chunk(self, filename, start, num_files, level):
+        if filename == self.fail_for:
+            raise IOError("Could not read {}".format(filename))
+
+        self.scanned.append((os.path.basename(filename), start, num_files, level))
+
+
+class TestChunkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = ChunkQueue(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def listing(self, state):
+        return sorted(os.listdir(os.path.join(self.tmp_dir, state)))
+
+    def test_slices_claimed_once_in_order(self):
+        self.queue.put("/lists/b.txt", 0, 100, 2)
+        self.queue.put("/lists/a.txt", 100, 50, 2)
+        self.queue.put("/lists/a.txt", 0, 100, 2)
+
+        # A second worker sharing the queue
+        other = ChunkQueue(self.tmp_dir)
+
+        claimed = [self.queue.claim(), other.claim(), self.queue.claim(), other.claim()]
+
+        self.assertIsNone(claimed[-1])
+        self.assertEqual([(os.path.basename(c.spec["filename"]), c.spec["start"]) for c in claimed[:3]],
+                         [("a.txt", 0), ("a.txt", 100), ("b.txt", 0)])
+        self.assertEqual(claimed[0].spec["level"], "2")
+        self.assertEqual(len(self.listing(RUNNING)), 3)
+
+    def test_lists_with_same_name_kept_apart(self):
+        first = self.queue.put("/lists/2020/a.txt", 0, 100, 2)
+        second = self.queue.put("/lists/2021/a.txt", 0, 100, 2)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(self.queue.pending()), 2)
+
+    def test_worker_scans_until_queue_empty(self):
+        self.queue.put("/lists/a.txt", 0, 100, 3)
+        self.queue.put("/lists/bad.txt", 0, 10, 3)
+        self.queue.put("/lists/c.txt", 0, 5, 3)
+
+        extract = RecordingExtractor(fail_for="/lists/bad.txt")
+
+        self.assertEqual(run_worker(self.queue, extract), 3)
+        self.assertEqual(extract.scanned, [("a.txt", 0, 100, "3"), ("c.txt", 0, 5, "3")])
+        self.assertEqual(len(self.listing(DONE)), 2)
+        self.assertEqual(len(self.listing(FAILED)), 1)
+        self.assertTrue(self.listing(FAILED)[0].startswith("bad.txt_"))
+        self.assertEqual(self.listing(RUNNING), [])
+
+    def test_max_chunks(self):
+        for start in range(0, 50, 10):
+            self.queue.put("/lists/a.txt", start, 10, 1)
+
+        self.assertEqual(run_worker(self.queue, RecordingExtractor(), max_chunks=2), 2)
+        self.assertEqual(len(self.queue.pending()), 3)
+
+    def test_abandoned_slices_requeued(self):
+        self.queue.put("/lists/a.txt", 0, 10, 1)
+        self.queue.put("/lists/a.txt", 10, 10, 1)
+
+        # A claim by a worker which has since exited and one by this process
+        finished = subprocess.Popen(["true"])
+        finished.wait()
+
+        name = self.queue.pending()[0]
+        os.rename(os.path.join(self.tmp_dir, "pending", name),
+                  os.path.join(self.tmp_dir, RUNNING, "{}.{}.{}".format(name, socket.gethostname(), finished.pid)))
+        self.queue.claim()
+
+        self.assertEqual(self.queue.requeue_abandoned(), 1)
+        self.assertEqual(self.queue.pending(), [name])
+        self.assertEqual(len(self.listing(RUNNING)), 1)
+
+
+class TestScanWorkerScript(unittest.TestCase):
+
+    def test_import_leaves_signal_handlers(self):
+        # The scan_dataset handlers delete the user's files in /tmp
+        import cmdline.scan_worker
+
+        self.assertIs(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+        self.assertIs(signal.getsignal(signal.SIGHUP), signal.SIG_DFL)
+
+
+if __name__ == '__main__':
+    unittest.main()
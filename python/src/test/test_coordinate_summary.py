@@ -0,0 +1,108 @@
+# encoding: utf-8
+"""
+Tests for finding the extent of coordinate variables without reading them
+into memory at once.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import netCDF4
+    import numpy as np
+except ImportError:
+    netCDF4 = None
+
+if netCDF4 is not None:
+    from fbs.proc.common_util import coordinate_summary
+    from fbs.proc.common_util.geojson import GeoJSONGenerator
+
+
+def envelope(lats, lons):
+    return GeoJSONGenerator(lats, lons).get_elasticsearch_geojson()["geometries"]["search"]
+
+
+@unittest.skipIf(netCDF4 is None, "netCDF4 is not installed")
+class TestCoordinateSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "swath.nc")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_swath(self, lats, lons, chunksizes=None):
+        with netCDF4.Dataset(self.path, "w") as ncdf:
+            ncdf.createDimension("y", lats.shape[0])
+            ncdf.createDimension("x", lats.shape[1])
+
+            for name, values in (("lat", lats), ("lon", lons)):
+                variable = ncdf.createVariable(name, "f4", ("y", "x"), chunksizes=chunksizes, fill_value=-999.0)
+                variable[:] = values
+
+    def summarise(self, name, summary, memory_budget=coordinate_summary.MEMORY_BUDGET):
+        with netCDF4.Dataset(self.path) as ncdf:
+            return coordinate_summary.summarise(ncdf.variables[name], summary, memory_budget).values()
+
+    def full_envelope(self):
+        with netCDF4.Dataset(self.path) as ncdf:
+            return envelope(ncdf.variables["lat"][:].ravel(), ncdf.variables["lon"][:].ravel())
+
+    def test_same_envelope_as_reading_everything(self):
+        y, x = np.mgrid[0:200, 0:50]
+        lats = (-60 + y * 0.5 + x * 0.1).astype("f4")
+        lons = ((150 + x * 0.8 + y * 0.2 + 180) % 360 - 180).astype("f4")
+        self.write_swath(lats, lons, chunksizes=(16, 50))
+
+        # A small budget reads the variable in many slabs
+        budget = 50 * 4 * 40
+        lat_values = self.summarise("lat", coordinate_summary.LatitudeSummary(), budget)
+        lon_values = self.summarise("lon", coordinate_summary.LongitudeSummary(), budget)
+
+        self.assertEqual(envelope(lat_values, lon_values), self.full_envelope())
+
+    def test_masked_and_out_of_range_values_ignored(self):
+        lats = np.array([[10, 20], [-999, 95]], dtype="f4")
+        lons = np.array([[-5, 5], [-999, 200]], dtype="f4")
+        self.write_swath(lats, lons)
+
+        self.assertEqual(list(self.summarise("lat", coordinate_summary.LatitudeSummary())), [10, 20])
+        self.assertEqual(list(self.summarise("lon", coordinate_summary.LongitudeSummary())), [-5, 5])
+
+    def test_single_point(self):
+        self.write_swath(np.array([[51.5]], dtype="f4"), np.array([[-1.25]], dtype="f4"))
+
+        self.assertEqual(list(self.summarise("lat", coordinate_summary.LatitudeSummary())), [51.5])
+        self.assertEqual(list(self.summarise("lon", coordinate_summary.LongitudeSummary())), [-1.25])
+
+    def write_axis(self, name, values):
+        with netCDF4.Dataset(self.path, "w") as ncdf:
+            ncdf.createDimension(name, len(values))
+            ncdf.createVariable(name, "f8", (name,))[:] = values
+
+    def test_1d_latitude_reads_ends(self):
+        self.write_axis("lat", np.arange(-89.5, 90))
+
+        with netCDF4.Dataset(self.path) as ncdf:
+            summary = coordinate_summary.LatitudeSummary()
+            slabs = []
+            summary.add = slabs.append
+            coordinate_summary.summarise(ncdf.variables["lat"], summary)
+
+        self.assertEqual([list(slab) for slab in slabs], [[-89.5, 89.5]])
+
+    def test_1d_global_longitude(self):
+        lons = np.arange(-180, 180, 1.0)
+        self.write_axis("lon", lons)
+
+        values = self.summarise("lon", coordinate_summary.LongitudeSummary())
+
+        self.assertEqual(tuple(values), tuple(GeoJSONGenerator._get_bounds(np.sort(lons), wrapped_coords=True)))
+        self.assertEqual(list(values), [-180, 179])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# encoding: utf-8
+"""
+Tests for the file header shared by the handler picker and the handlers.
+"""
+
+import builtins
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fbs.proc.common_util.file_header import FileHeader
+from fbs.proc.extract import extract_file_metadata
+from fbs.proc.file_handlers.handler_picker import HandlerPicker
+
+BADC_CSV = """Conventions,G,BADC-CSV,1
+date_valid,G,2013-09-22
+location,G,global
+long_name,ch4,methane mole fraction,ppb
+data
+time,ch4
+0,1900
+end data
+"""
+
+
+class TestFileHeader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "readings.csv")
+
+        with open(self.path, "w") as writer:
+            writer.write(BADC_CSV)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def count_opens(self):
+        return mock.patch("builtins.open", side_effect=builtins.open)
+
+    def test_read_once(self):
+        header = FileHeader(self.path)
+
+        with self.count_opens() as opened:
+            self.assertTrue(header.startswith(b"Conventions"))
+            self.assertEqual(header.first_line(), "Conventions,G,BADC-CSV,1")
+            self.assertTrue(header.complete)
+
+            with header.text() as reader:
+                self.assertEqual(reader.read(), BADC_CSV)
+
+        self.assertEqual(opened.call_count, 1)
+
+    def test_large_file_opened_for_text(self):
+        header = FileHeader(self.path, size=10)
+
+        self.assertFalse(header.complete)
+
+        with header.text() as reader:
+            self.assertEqual(reader.read(), BADC_CSV)
+
+    def test_newlines_translated(self):
+        with open(self.path, "wb") as writer:
+            writer.write(BADC_CSV.replace("\n", "\r\n").encode("utf-8"))
+
+        for size in (8192, 10):
+            with FileHeader(self.path, size=size).text() as reader:
+                self.assertEqual(reader.read(), BADC_CSV)
+
+    def test_missing_file(self):
+        header = FileHeader(os.path.join(self.tmp_dir, "missing.csv"))
+
+        self.assertIsNone(header.data)
+        self.assertIsNone(header.first_line())
+        self.assertFalse(header.startswith(b"GRIB"))
+
+    def test_small_csv_opened_once(self):
+        with self.count_opens() as opened:
+            metadata = extract_file_metadata(HandlerPicker(), self.path, "3")
+
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(metadata[0]["info"]["format"], "BADC CSV")
+        self.assertEqual(metadata[0]["info"]["read_status"], "Successful")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# encoding: utf-8
+"""
+Tests for reading slices of file lists through their offset index.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fbs.proc.common_util.util as util
+
+
+class TestFileListIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "dataset.txt")
+        self.paths = ["/badc/dataset/data/file_{}.nc".format(i) for i in range(2503)]
+        util.write_list_to_file(self.paths, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_count(self):
+        self.assertEqual(util.write_list_index(self.filename, stride=100), len(self.paths))
+        self.assertEqual(util.count_list_lines(self.filename), len(self.paths))
+
+    def test_count_writes_missing_index(self):
+        self.assertEqual(util.count_list_lines(self.filename), len(self.paths))
+        self.assertTrue(os.path.exists(util.list_index_path(self.filename)))
+
+    def test_slices(self):
+        util.write_list_index(self.filename, stride=100)
+
+        for start, num in [(0, 10), (99, 3), (100, 100), (1234, 1000), (2500, 10)]:
+            self.assertEqual(list(util.read_list_slice(self.filename, start, num)),
+                             self.paths[start:start + num])
+
+    def test_slice_without_index(self):
+        self.assertEqual(list(util.read_list_slice(self.filename, 1500, 5)), self.paths[1500:1505])
+
+    def test_stale_index_is_ignored(self):
+        util.write_list_index(self.filename, stride=100)
+
+        paths = ["/neodc/other/file_{}.nc".format(i) for i in range(10)]
+        util.write_list_to_file(paths, self.filename)
+
+        self.assertIsNone(util.read_list_index(self.filename))
+        self.assertEqual(list(util.read_list_slice(self.filename, 5, 10)), paths[5:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# encoding: utf-8
+"""
+Tests for the file stat snapshot used by the file handlers.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fbs.proc.common_util.file_stat import FileStat
+from fbs.proc.file_handlers.generic_file import GenericFile
+
+
+class TestFileStat(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "data.nc")
+        with open(self.path, "w") as fd:
+            fd.write("x" * 42)
+
+        self.link = os.path.join(self.tmp_dir, "link.nc")
+        os.symlink(self.path, self.link)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_file(self):
+        file_stat = FileStat(self.path)
+
+        self.assertTrue(file_stat.is_file)
+        self.assertFalse(file_stat.is_link)
+        self.assertIs(file_stat.stat, file_stat.lstat)
+
+    def test_link(self):
+        file_stat = FileStat(self.link)
+
+        self.assertTrue(file_stat.is_file)
+        self.assertTrue(file_stat.is_link)
+        self.assertEqual(file_stat.stat.st_size, 42)
+
+    def test_missing(self):
+        file_stat = FileStat(os.path.join(self.tmp_dir, "missing.nc"))
+
+        self.assertFalse(file_stat.is_file)
+        self.assertIsNone(file_stat.stat)
+
+    def test_from_dir_entry(self):
+        entries = {entry.name: entry for entry in os.scandir(self.tmp_dir)}
+        file_stat = FileStat.from_dir_entry(entries["link.nc"])
+
+        self.assertEqual(file_stat.path, self.link)
+        self.assertTrue(file_stat.is_link)
+        self.assertTrue(file_stat.is_file)
+
+    def test_level1_uses_one_stat_call(self):
+        with mock.patch("os.lstat", wraps=os.lstat) as lstat, mock.patch("os.stat", wraps=os.stat) as stat:
+            metadata = GenericFile(self.path, 1).get_metadata()
+
+        self.assertEqual(lstat.call_count + stat.call_count, 1)
+
+        info = metadata[0]["info"]
+        self.assertEqual(info["size"], 42)
+        self.assertFalse(info["is_link"])
+        self.assertEqual(info["user"], os.getuid())
+
+    def test_level1_link(self):
+        info = GenericFile(self.link, 1, file_stat=FileStat(self.link)).get_metadata()[0]["info"]
+
+        self.assertTrue(info["is_link"])
+        self.assertEqual(info["size"], 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
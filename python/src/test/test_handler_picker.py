@@ -8,8 +8,10 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
+import struct
 import unittest
-from fbs.proc.file_handlers.handler_picker import HandlerPicker
+from fbs.proc.file_handlers.handler_picker import HandlerPicker, FormatCache
+from fbs.proc.file_handlers import signatures
 from fbs.proc.file_handlers import generic_file
 from fbs.proc.file_handlers import netcdf_file
 from fbs.proc.file_handlers import nasaames_file
@@ -103,5 +105,93 @@ class TestHandlerPicker(unittest.TestCase):
         filename = '/badc/ukcip02/data/50km_resolution/metadata_tags.json'
         self.run_test([filename], 'metadata')
 
+
+class SniffCountingPicker(HandlerPicker):
+
+    def __init__(self, handler, **kwargs):
+        super(SniffCountingPicker, self).__init__(FormatCache(**kwargs))
+        self.handler = handler
+        self.sniffed = []
+
+    def sniff_handler(self, file_header):
+        self.sniffed.append(file_header.path)
+        return self.handler
+
+
+class TestFormatCache(unittest.TestCase):
+
+    def test_naming_pattern(self):
+        self.assertEqual(FormatCache.key('/badc/x/ncas_20130922_r0'), ('/badc/x', 'ncas_#_r#'))
+
+    def test_reused_once_confirmed(self):
+        picker = SniffCountingPicker(grib_file.GribFile, confirm_after=3, check_every=100)
+        files = ['/badc/x/data_{}'.format(i) for i in range(50)]
+
+        for file in files:
+            self.assertEqual(picker.pick_best_handler(file), grib_file.GribFile)
+
+        self.assertEqual(picker.sniffed, files[:3])
+        self.assertEqual(picker.format_cache.stats(), {'hits': 47, 'misses': 3, 'checks': 0, 'changes': 0})
+
+    def test_spot_check(self):
+        picker = SniffCountingPicker(grib_file.GribFile, confirm_after=1, check_every=10)
+
+        for i in range(21):
+            picker.pick_best_handler('/badc/x/data_{}'.format(i))
+
+        self.assertEqual(len(picker.sniffed), 3)
+        self.assertEqual(picker.format_cache.stats()['checks'], 2)
+
+    def test_change_of_format(self):
+        picker = SniffCountingPicker(grib_file.GribFile, confirm_after=2, check_every=2)
+
+        for i in range(3):
+            picker.pick_best_handler('/badc/x/data_{}'.format(i))
+
+        picker.handler = generic_file.GenericFile
+        self.assertEqual(picker.pick_best_handler('/badc/x/data_3'), generic_file.GenericFile)
+        self.assertEqual(picker.format_cache.stats()['changes'], 1)
+
+        # The new format is read again until it has been confirmed
+        picker.pick_best_handler('/badc/x/data_4')
+        self.assertEqual(len(picker.sniffed), 4)
+
+    def test_extensions_not_sniffed(self):
+        picker = SniffCountingPicker(grib_file.GribFile)
+        picker.pick_best_handler('/badc/x/data.txt')
+
+        self.assertEqual(picker.sniffed, [])
+
+
+class TestSignatures(unittest.TestCase):
+
+    def zip_member(self, name):
+        return struct.pack("<4s22xHH", b"PK\x03\x04", len(name), 0) + name
+
+    def test_binary_formats(self):
+        headers = {
+            b"CDF\x01\x00\x00\x00\x00": signatures.NETCDF,
+            b"CDF\x02\x00\x00\x00\x00": signatures.NETCDF,
+            b"\x89HDF\r\n\x1a\n\x00": signatures.HDF5,
+            b"\x0e\x03\x13\x01\x00": signatures.HDF4,
+            b"GRIB\x00\x01\x02": signatures.GRIB,
+            b"\x00\x00\x01\x00\x00\x00\x07\xd0": signatures.PP,
+            b"\x00\x00\x00\x00\x00\x00\x02\x00": signatures.PP,
+            self.zip_member(b"doc.kml"): signatures.KMZ,
+        }
+
+        for header, file_format in headers.items():
+            self.assertEqual(signatures.identify(header), file_format, header)
+
+    def test_text_formats(self):
+        self.assertEqual(signatures.identify(b"32 1001\nSmith, J.\n"), signatures.NASAAMES)
+        self.assertEqual(signatures.identify(b"Conventions,G,BADC-CSV,1\n"), signatures.BADC_CSV)
+
+    def test_unknown(self):
+        for header in (b"", b"CDF", b"\x89HDF\r\n", b"12 34\n", b"plain text\n",
+                       self.zip_member(b"report.pdf")):
+            self.assertIsNone(signatures.identify(header), header)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+# encoding: utf-8
+"""
+Checks that starting a scan does not load the scientific libraries used
+by the handlers, and stays within a budget for import time and memory.
+Each check runs in a fresh interpreter so earlier imports do not count.
+"""
+
+import json
+import subprocess
+import sys
+import unittest
+
+# Modules which should only be loaded once a file needing them is picked
+SCIENTIFIC_MODULES = ("netCDF4", "cf", "xarray", "cfgrib", "pyhdf", "nappy", "numpy", "magic")
+
+# Budget for importing the extractor
+IMPORT_SECONDS = 3.0
+IMPORT_RSS_MB = 150
+
+PROBE = """
+import json, resource, sys, time
+
+start = time.perf_counter()
+import fbs.proc.extract
+from fbs.proc.file_handlers.handler_picker import HandlerPicker
+seconds = time.perf_counter() - start
+
+picker = HandlerPicker()
+handlers = [picker.pick_best_handler(path).__name__ for path in {paths!r}]
+
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    "handlers": handlers,
+    "modules": sorted(set(name.split(".")[0] for name in sys.modules) & set({modules!r}))
+}}))
+"""
+
+
+def probe(paths=()):
+    output = subprocess.check_output(
+        [sys.executable, "-c", PROBE.format(paths=list(paths), modules=SCIENTIFIC_MODULES)])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+class TestImportBudget(unittest.TestCase):
+
+    def test_startup_budget(self):
+        result = probe()
+
+        self.assertEqual(result["modules"], [])
+        self.assertLess(result["seconds"], IMPORT_SECONDS)
+        self.assertLess(result["rss_mb"], IMPORT_RSS_MB)
+
+    def test_level_1_files_do_not_load_scientific_stack(self):
+        result = probe(["/badc/data/README", "/badc/data/readings.csv", "/badc/data/metadata_tags.json"])
+
+        self.assertEqual(result["handlers"], ["GenericFile", "GenericFile", "MetadataTagsJsonFile"])
+        self.assertEqual(result["modules"], [])
+
+    def test_handler_loaded_when_picked(self):
+        try:
+            import netCDF4
+        except ImportError:
+            self.skipTest("netCDF4 is not installed")
+
+        result = probe(["/badc/data/file.nc"])
+
+        self.assertEqual(result["handlers"], ["NetCdfFile"])
+        self.assertIn("netCDF4", result["modules"])
+
+
+if __name__ == '__main__':
+    unittest.main()
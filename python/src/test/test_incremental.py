@@ -0,0 +1,108 @@
+# encoding: utf-8
+"""
+Tests for skipping unchanged files in incremental scans.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from elasticsearch.exceptions import ConnectionError
+
+from fbs.proc.common_util.file_stat import FileStat
+from fbs.proc.extract import ExtractSeq
+
+
+class FakeElasticsearch(object):
+    """
+    Stand-in for the Elasticsearch client holding documents by id.
+    """
+
+    def __init__(self, docs=None, error=None):
+        self.docs = docs or {}
+        self.error = error
+        self.requests = []
+
+    def mget(self, index=None, body=None, **kwargs):
+        if self.error:
+            raise self.error
+
+        self.requests.append(body["ids"])
+
+        return {"docs": [
+            {"_id": id, "found": True, "_source": self.docs[id]} if id in self.docs
+            else {"_id": id, "found": False}
+            for id in body["ids"]
+        ]}
+
+
+def doc_id(path):
+    return hashlib.sha1(path.encode('utf-8')).hexdigest()
+
+
+class TestIncrementalScan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+
+        for i in range(5):
+            path = os.path.join(self.tmp_dir, "file_{}.nc".format(i))
+            with open(path, "w") as fd:
+                fd.write("x" * i)
+            self.files.append(path)
+
+        self.extract = ExtractSeq.__new__(ExtractSeq)
+        self.extract.es_index = "test"
+        self.extract.mget_batch_size = 2
+        self.extract.files_unchanged = 0
+        self.extract.checkpoint = None
+        self.extract.file_stats = {}
+        self.extract.logger = logging.getLogger(__name__)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def indexed(self, path, level=3):
+        last_modified, size = ExtractSeq._file_state(FileStat(path))
+        return {"info": {"last_modified": last_modified, "size": size, "scan_level": level}}
+
+    def test_new_files_are_scanned(self):
+        self.extract.es = FakeElasticsearch()
+
+        self.assertEqual(list(self.extract._changed_files(self.files, 2)), self.files)
+        self.assertEqual([len(ids) for ids in self.extract.es.requests], [2, 2, 1])
+
+    def test_unchanged_files_are_skipped(self):
+        docs = {doc_id(path): self.indexed(path) for path in self.files}
+        self.extract.es = FakeElasticsearch(docs)
+
+        self.assertEqual(list(self.extract._changed_files(self.files, 3)), [])
+        self.assertEqual(self.extract.files_unchanged, 5)
+
+    def test_changed_files_are_scanned(self):
+        docs = {doc_id(path): self.indexed(path) for path in self.files}
+        docs[doc_id(self.files[1])]["info"]["size"] = 100
+        docs[doc_id(self.files[3])]["info"]["last_modified"] = "2000-01-01T00:00:00"
+        self.extract.es = FakeElasticsearch(docs)
+
+        self.assertEqual(list(self.extract._changed_files(self.files, 1)), [self.files[1], self.files[3]])
+
+    def test_lower_level_is_rescanned(self):
+        docs = {doc_id(path): self.indexed(path, level=1) for path in self.files}
+        docs[doc_id(self.files[0])] = self.indexed(self.files[0], level=3)
+        self.extract.es = FakeElasticsearch(docs)
+
+        self.assertEqual(list(self.extract._changed_files(self.files, 2)), self.files[1:])
+
+    def test_lookup_error_scans_everything(self):
+        self.extract.es = FakeElasticsearch(error=ConnectionError("N/A", "down", None))
+
+        self.assertEqual(list(self.extract._changed_files(self.files, 2)), self.files)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# encoding: utf-8
+"""
+Tests for resources built on first use.
+"""
+
+import logging
+import threading
+import time
+import unittest
+
+from fbs.proc.common_util.lazy import LazyResource
+from fbs.proc.extract import ExtractSeq, ExtractPar
+
+
+class CountingFactory(object):
+
+    def __init__(self, delay=0, fail=0):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+
+        if self.calls <= self.fail:
+            raise IOError("unreachable")
+
+        return object()
+
+
+class TestLazyResource(unittest.TestCase):
+
+    def test_built_once_on_first_use(self):
+        factory = CountingFactory(delay=0.1)
+        resource = LazyResource("test", factory)
+
+        self.assertFalse(resource.ready)
+        self.assertEqual(factory.calls, 0)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(resource.get())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(factory.calls, 1)
+        self.assertEqual(len(set(map(id, results))), 1)
+        self.assertTrue(resource.ready)
+
+    def test_prefetch(self):
+        factory = CountingFactory(delay=0.1)
+        resource = LazyResource("test", factory)
+
+        resource.prefetch()
+        resource.get()
+
+        self.assertEqual(factory.calls, 1)
+
+    def test_failure_kept_until_retry(self):
+        factory = CountingFactory(fail=1)
+        resource = LazyResource("test", factory, retry_after=0.2)
+
+        self.assertRaises(IOError, resource.get)
+        self.assertRaises(IOError, resource.get)
+        self.assertEqual(factory.calls, 1)
+
+        time.sleep(0.2)
+        resource.get()
+        self.assertEqual(factory.calls, 2)
+
+
+class TestExtractConnections(unittest.TestCase):
+
+    def test_no_connections_at_construction(self):
+        conf = {
+            "ldap-configuration": {"hosts": "ldap.invalid"},
+            "es-configuration": {"es-index": "test"}
+        }
+
+        start = time.monotonic()
+        extract = ExtractSeq(conf)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(extract._ldap.ready)
+        self.assertFalse(extract._spots.ready)
+        self.assertFalse(extract._es_client.ready)
+
+    def test_worker_pool_kept_until_closed(self):
+        conf = {
+            "es-configuration": {"es-index": "test"},
+            "processes": 2,
+            "max-in-flight": 4
+        }
+
+        extract = ExtractPar(conf)
+        pool = extract.pool
+
+        self.assertIs(extract.pool, pool)
+
+        extract.close()
+        self.assertIsNone(extract._pool)
+        self.assertIsNot(extract.pool, pool)
+        extract.close()
+
+    def test_worker_records_logged_by_parent(self):
+        conf = {
+            "es-configuration": {"es-index": "test"},
+            "processes": 1,
+            "max-in-flight": 1,
+            "calculate_md5": False
+        }
+
+        extract = ExtractPar(conf)
+        extract.logger = logging.getLogger(__name__)
+
+        with self.assertLogs("fbs.proc.extract", level="ERROR") as logs:
+            results = list(extract._extract_metadata(["/nonexistent/file.nc"], 1))
+            extract.close()
+
+        self.assertEqual(results, [("/nonexistent/file.nc", None)])
+        self.assertIn("/nonexistent/file.nc Is not a file.", "\n".join(logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
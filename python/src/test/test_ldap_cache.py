@@ -0,0 +1,181 @@
+# encoding: utf-8
+"""
+Tests for the uid and gid name lookups and their shared cache, using the
+in-process LDAP server provided by ldap3.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import ldap3
+
+import fbs.proc.common_util.util as util
+from fbs.proc.common_util.id_cache import IdNameCache, MISSING, USER, GROUP
+from fbs.proc.common_util.lazy import LazyResource
+from fbs.proc.extract import ExtractSeq
+
+# Ids well above those in the local passwd and group databases
+UIDS = {990001 + i: "user{}".format(i) for i in range(25)}
+GIDS = {880001 + i: "group{}".format(i) for i in range(5)}
+
+
+def mock_identifier(cache=None):
+    """
+    LDAPIdentifier using a mock LDAP server holding UIDS and GIDS.
+    """
+    identifier = util.LDAPIdentifier(cache=cache, server=ldap3.Server("fake_ldap"),
+                                     client_strategy=ldap3.MOCK_SYNC)
+    identifier.conn.bind()
+
+    for uid, name in UIDS.items():
+        identifier.conn.strategy.add_entry("uid={},{}".format(name, util.LDAPIdentifier.USER_BASE),
+                                           {"objectClass": "posixAccount", "uidNumber": uid, "uid": name})
+    for gid, name in GIDS.items():
+        identifier.conn.strategy.add_entry("cn={},{}".format(name, util.LDAPIdentifier.GROUP_BASE),
+                                           {"objectClass": "posixGroup", "gidNumber": gid, "cn": name})
+
+    return identifier
+
+
+class TestLDAPIdentifier(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, "ldap_cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def count_searches(self, identifier):
+        return mock.patch.object(identifier.conn, "search", wraps=identifier.conn.search)
+
+    def test_groups_served_from_memory(self):
+        identifier = mock_identifier()
+
+        with self.count_searches(identifier) as search:
+            self.assertEqual(identifier.get_group(880002), "group1")
+            self.assertEqual(identifier.get_group(880002), "group1")
+            self.assertEqual(identifier.get_user(990003), "user2")
+            self.assertEqual(identifier.get_user(990003), "user2")
+
+        self.assertEqual(search.call_count, 2)
+
+    def test_one_search_for_many_ids(self):
+        identifier = mock_identifier(IdNameCache(self.cache_path))
+        uids = list(UIDS) + [995000, 995001]
+
+        with self.count_searches(identifier) as search:
+            names = identifier.get_users(uids + uids[:3])
+            self.assertEqual(identifier.get_users(uids), names)
+
+        self.assertEqual(search.call_count, 1)
+        self.assertEqual(names, {**UIDS, 995000: None, 995001: None})
+
+    def test_missing_ids_not_searched_again(self):
+        identifier = mock_identifier(IdNameCache(self.cache_path))
+
+        with self.count_searches(identifier) as search:
+            self.assertEqual(identifier.get_user(995000), 995000)
+            self.assertEqual(identifier.get_user(995000), 995000)
+
+        self.assertEqual(search.call_count, 1)
+
+        # A new job reads the negative entry from the shared cache
+        identifier = mock_identifier(IdNameCache(self.cache_path))
+
+        with self.count_searches(identifier) as search:
+            self.assertEqual(identifier.get_user(995000), 995000)
+
+        self.assertEqual(search.call_count, 0)
+
+    def test_prefill_then_no_searches(self):
+        identifier = mock_identifier(IdNameCache(self.cache_path))
+
+        self.assertEqual(identifier.prefill(page_size=10), len(UIDS) + len(GIDS))
+
+        # The cache is only filled once per ttl
+        self.assertEqual(mock_identifier(IdNameCache(self.cache_path)).prefill(), 0)
+
+        identifier = mock_identifier(IdNameCache(self.cache_path))
+
+        with self.count_searches(identifier) as search:
+            for uid, name in UIDS.items():
+                self.assertEqual(identifier.get_user(uid), name)
+            for gid, name in GIDS.items():
+                self.assertEqual(identifier.get_group(gid), name)
+
+        self.assertEqual(search.call_count, 0)
+
+    def test_unknown_ids_kept_in_actions(self):
+        extract = ExtractSeq({"es-configuration": {"es-index": "test"}})
+        extract._ldap = LazyResource("LDAP connection", mock_identifier)
+
+        actions = [
+            {"_source": {"info": {"user": "990001", "group": "880001"}}},
+            {"_source": {"info": {"user": "995000", "group": "885000"}}}
+        ]
+        extract._resolve_owners(actions)
+
+        self.assertEqual([action["_source"]["info"] for action in actions], [
+            {"user": "user0", "group": "group0"},
+            {"user": "995000", "group": "885000"}
+        ])
+
+
+class TestIdNameCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "cache", "names.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_entries_expire(self):
+        cache = IdNameCache(self.path, ttl=100)
+        cache.put(USER, 1000, "alice")
+        cache.put(GROUP, 1000, None)
+
+        self.assertEqual(cache.get(USER, 1000), "alice")
+        self.assertIsNone(cache.get(GROUP, 1000))
+        self.assertIs(cache.get(USER, 1001), MISSING)
+
+        with mock.patch("time.time", return_value=cache.db.execute("SELECT MAX(updated) FROM names").fetchone()[0] + 101):
+            self.assertIs(cache.get(USER, 1000), MISSING)
+
+    def test_one_prefill_at_a_time(self):
+        cache = IdNameCache(self.path)
+        other = IdNameCache(self.path)
+
+        self.assertTrue(cache.claim_prefill(USER))
+        self.assertFalse(other.claim_prefill(USER))
+        self.assertTrue(other.claim_prefill(GROUP))
+
+        cache.finish_prefill(USER)
+        self.assertFalse(other.claim_prefill(USER))
+
+    def test_prefill_claimed_once_by_jobs_starting_together(self):
+        IdNameCache(self.path).close()
+        caches = [IdNameCache(self.path) for _ in range(8)]
+        start = threading.Barrier(len(caches))
+        claims = []
+
+        def claim(cache):
+            start.wait()
+            claims.append(cache.claim_prefill(USER))
+
+        threads = [threading.Thread(target=claim, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(claims), [False] * 7 + [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# encoding: utf-8
+"""
+Tests for running tasks on this host with the LocalRunner.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import fbs.proc.common_util.util as util
+
+
+class TestLocalRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_exit_statuses(self):
+        runner = util.LocalRunner(max_concurrent=2)
+        statuses = runner.run_tasks(["true", "exit 3", "true"])
+
+        self.assertEqual(statuses, [0, 3, 0])
+        self.assertEqual((runner.finished, runner.failed), (3, 1))
+
+    def test_failed_tasks_retried(self):
+        counter = os.path.join(self.tmp_dir, "attempts")
+
+        # Fails until it has been run three times
+        task = "echo x >> {0}; test $(wc -l < {0}) -ge 3".format(counter)
+
+        self.assertEqual(util.LocalRunner(retries=1).run_tasks([task]), [1])
+        self.assertEqual(util.LocalRunner(retries=1).run_tasks([task]), [0])
+
+        with open(counter) as reader:
+            self.assertEqual(len(reader.readlines()), 3)
+
+    def test_tasks_run_concurrently(self):
+        start = time.time()
+        util.LocalRunner(max_concurrent=4).run_tasks(["sleep 0.5"] * 4)
+
+        self.assertLess(time.time() - start, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# encoding: utf-8
+"""
+Tests for submitting tasks to LOTUS as Slurm array jobs, using a fake sbatch.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import fbs
+import fbs.proc.common_util.util as util
+
+FAKE_SBATCH = """#!/bin/sh
+echo "$@" >> {log}
+exit {status}
+"""
+
+# Accepts the first array job then fails
+FAIL_SECOND_SBATCH = """#!/bin/sh
+echo "$@" >> {log}
+test $(wc -l < {log}) -lt 2
+"""
+
+
+class TestLotusRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.sbatch_log = os.path.join(self.tmp_dir, "sbatch.log")
+
+        self.bin_dir = os.path.join(self.tmp_dir, "bin")
+        os.makedirs(self.bin_dir)
+        self.write_sbatch(0)
+
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = self.bin_dir + os.pathsep + self.path
+
+    def write_sbatch(self, status, template=FAKE_SBATCH):
+        sbatch = os.path.join(self.bin_dir, "sbatch")
+        with open(sbatch, "w") as writer:
+            writer.write(template.format(log=self.sbatch_log, status=status))
+        os.chmod(sbatch, 0o755)
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        shutil.rmtree(self.tmp_dir)
+
+    def submissions(self):
+        with open(self.sbatch_log) as reader:
+            return [line.split() for line in reader]
+
+    def test_tasks_submitted_as_arrays(self):
+        output = os.path.join(self.tmp_dir, "output.txt")
+        tasks = ["echo task_{} >> {}".format(i, output) for i in range(25)]
+
+        runner = util.LotusRunner(queue='short-serial', max_concurrent=4, max_array_size=10,
+                                  manifest_dir=os.path.join(self.tmp_dir, "manifests"))
+        runner.run_tasks_in_lotus(tasks)
+
+        submissions = self.submissions()
+        self.assertEqual(len(submissions), 3)
+        self.assertEqual([args[4] for args in submissions],
+                         ["--array=0-9%4", "--array=0-9%4", "--array=0-4%4"])
+        self.assertEqual([args[-1] for args in submissions], ["0", "10", "20"])
+
+        # Run the last task of the second array as Slurm would
+        script, manifest, offset = submissions[1][-3:]
+
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID="9",
+                   PYTHONPATH=os.path.dirname(fbs.__file__) + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        subprocess.check_call([sys.executable, script, manifest, offset], env=env,
+                              stdout=subprocess.DEVNULL)
+
+        with open(output) as reader:
+            self.assertEqual(reader.read().split(), ["task_19"])
+
+    def test_no_throttle(self):
+        runner = util.LotusRunner(max_concurrent=0, manifest_dir=os.path.join(self.tmp_dir, "manifests"))
+        runner.run_tasks_in_lotus(["true"] * 3)
+
+        self.assertEqual(self.submissions()[0][4], "--array=0-2")
+
+    def test_failed_submission_keeps_task_file(self):
+        self.write_sbatch(1)
+
+        task_file = os.path.join(self.tmp_dir, "tasks.txt")
+        with open(task_file, "w") as writer:
+            writer.write("true\ntrue\n")
+
+        runner = util.LotusRunner(manifest_dir=os.path.join(self.tmp_dir, "manifests"))
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            runner.run_tasks_file_in_lotus(task_file)
+
+        self.assertTrue(os.path.exists(task_file))
+
+    def test_rerun_skips_submitted_arrays(self):
+        self.write_sbatch(0, FAIL_SECOND_SBATCH)
+
+        task_file = os.path.join(self.tmp_dir, "tasks.txt")
+        with open(task_file, "w") as writer:
+            writer.writelines("echo task_{}\n".format(i) for i in range(25))
+
+        runner = util.LotusRunner(max_array_size=10, manifest_dir=os.path.join(self.tmp_dir, "manifests"))
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            runner.run_tasks_file_in_lotus(task_file)
+
+        # Only the tasks of the first array were submitted
+        with open(task_file) as reader:
+            self.assertEqual(reader.read().split("\n")[0], "echo task_10")
+
+        runner.read_task_file(task_file)
+        self.assertEqual(len(runner.task_list), 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
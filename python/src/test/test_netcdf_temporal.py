@@ -0,0 +1,84 @@
+# encoding: utf-8
+"""
+Tests for reading the time extent of netCDF files.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import netCDF4
+    import numpy as np
+except ImportError:
+    netCDF4 = None
+
+if netCDF4 is not None:
+    from fbs.proc.file_handlers.netcdf_file import NetCdfFile
+
+
+@unittest.skipIf(netCDF4 is None, "netCDF4 is not installed")
+class TestTimeExtent(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "times.nc")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_times(self, values, calendar=None, bounds=None, name="time"):
+        with netCDF4.Dataset(self.path, "w") as ncdf:
+            ncdf.createDimension("time", len(values))
+            variable = ncdf.createVariable(name, "f8", ("time",), fill_value=-1.0)
+            variable.standard_name = "time"
+            variable.units = "days since 2000-01-01"
+            variable[:] = values
+
+            if calendar:
+                variable.calendar = calendar
+
+            if bounds is not None:
+                ncdf.createDimension("nv", 2)
+                ncdf.createVariable("time_bnds", "f8", ("time", "nv"))[:] = bounds
+                variable.bounds = "time_bnds"
+
+    def temporal(self):
+        with netCDF4.Dataset(self.path) as ncdf:
+            return NetCdfFile(self.path, 3).get_temporal(ncdf)
+
+    def test_ends_of_coordinate(self):
+        self.write_times(np.arange(0, 100000, 0.5))
+
+        temporal = self.temporal()
+
+        self.assertEqual(temporal["start_time"], "2000-01-01T00:00:00")
+        self.assertEqual(temporal["end_time"], "2273-10-15T12:00:00")
+
+    def test_calendar(self):
+        self.write_times([0, 59], calendar="360_day")
+
+        self.assertEqual(self.temporal()["end_time"], "2000-02-30T00:00:00")
+
+    def test_bounds(self):
+        self.write_times([15.5, 45], bounds=[[0, 31], [31, 60]])
+
+        temporal = self.temporal()
+
+        self.assertEqual(temporal["start_time"], "2000-01-01T00:00:00")
+        self.assertEqual(temporal["end_time"], "2000-03-01T00:00:00")
+
+    def test_not_a_coordinate_variable(self):
+        # An auxiliary time, e.g. along a trajectory, need not be in order.
+        # -1 is the fill value.
+        self.write_times([5, -1, 2, 9, 1], name="obs_time")
+
+        temporal = self.temporal()
+
+        self.assertEqual(temporal["start_time"], "2000-01-02T00:00:00")
+        self.assertEqual(temporal["end_time"], "2000-01-10T00:00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# encoding: utf-8
+"""
+Tests for the throughput stats and the scan planner.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fbs.proc.common_util.util as util
+from fbs.proc.planner import plan_slices
+from fbs.proc.throughput import ThroughputStats
+
+
+class TestThroughputStats(unittest.TestCase):
+
+    def test_fit(self):
+        stats = ThroughputStats()
+
+        # 0.5s per file plus 1s per MB
+        for size in (1e6, 2e6, 4e6):
+            stats.record("/badc/a.nc", 3, size, 0.5 + size / 1e6)
+
+        model = stats.model(3)
+        self.assertAlmostEqual(model.estimate("/badc/b.nc", 10e6), 10.5)
+        self.assertAlmostEqual(model.estimate("/badc/b.NC", 10e6), 10.5)
+
+        # Unknown extension and size use the fit over everything
+        self.assertAlmostEqual(model.estimate("/badc/b.pp"), 0.5 + 7 / 3.0)
+
+        self.assertIsNone(stats.model(1))
+
+    def test_save_and_load(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        for i in range(2):
+            stats = ThroughputStats()
+            stats.record("/badc/a.csv", 2, 100, 0.1)
+            stats.save(os.path.join(tmp_dir, "scan_{}.json".format(i)))
+
+        loaded = ThroughputStats.load_dir(tmp_dir)
+        self.assertEqual(loaded.stats["2"][".csv"]["files"], 2)
+        self.assertAlmostEqual(loaded.model(2).estimate("/badc/b.csv", 100), 0.1)
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "dataset.txt")
+
+        # 100 small csv files followed by 10 large netCDF files
+        paths = ["/badc/small_{}.csv".format(i) for i in range(100)] + \
+                ["/badc/large_{}.nc".format(i) for i in range(10)]
+        sizes = [1000] * 100 + [10 ** 9] * 10
+
+        util.write_list_to_file(paths, self.filename)
+        util.write_list_sizes(sizes, self.filename)
+
+        stats = ThroughputStats()
+        stats.record("/badc/x.csv", 3, 1000, 0.1)
+        stats.record("/badc/y.nc", 3, 1e9, 100)
+        stats.record("/badc/z.nc", 3, 2e9, 200)
+        self.model = stats.model(3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_slices_balanced_by_cost(self):
+        slices = list(plan_slices(self.filename, 3, 250, 1000, self.model))
+
+        # Each netCDF file is expected to take 100s and each csv file 0.1s
+        self.assertEqual([(start, count) for start, count, _ in slices],
+                         [(0, 102), (102, 2), (104, 2), (106, 2), (108, 2)])
+        self.assertTrue(all(cost <= 250 for _, _, cost in slices))
+
+    def test_max_files(self):
+        slices = list(plan_slices(self.filename, 3, 250, 30, self.model))
+
+        self.assertEqual([count for _, count, _ in slices[:4]], [30, 30, 30, 12])
+        self.assertEqual(sum(count for _, count, _ in slices), 110)
+
+    def test_without_model(self):
+        slices = list(plan_slices(self.filename, 3, 200, 25, None))
+
+        self.assertEqual([(start, count) for start, count, _ in slices],
+                         [(0, 25), (25, 25), (50, 25), (75, 25), (100, 10)])
+
+    def test_without_sizes(self):
+        os.remove(util.list_sizes_path(self.filename))
+
+        slices = list(plan_slices(self.filename, 3, 200, 1000, self.model))
+        self.assertEqual(sum(count for _, count, _ in slices), 110)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# encoding: utf-8
+"""
+Tests for the sandboxed worker processes.
+"""
+
+import os
+import signal
+import time
+import unittest
+
+from fbs.proc.sandbox import SandboxPool, SandboxWorker, WorkerCrashed, WorkerMemoryLimit, WorkerTimeout
+
+
+def add(a, b):
+    return a + b
+
+
+def get_pid():
+    return os.getpid()
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+
+def segfault():
+    os.kill(os.getpid(), signal.SIGSEGV)
+
+
+def fail():
+    raise ValueError("bad file")
+
+
+def initialise(value):
+    global initialised
+    initialised = value
+
+
+def get_initialised():
+    return initialised
+
+
+def allocate(size):
+    return len(bytearray(size))
+
+
+class TestSandboxWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = SandboxWorker(timeout=5)
+
+    def tearDown(self):
+        self.worker.close()
+
+    def test_returns_result(self):
+        self.assertEqual(self.worker.run(add, 1, 2), 3)
+
+    def test_timeout(self):
+        self.worker.timeout = 0.5
+
+        with self.assertRaises(WorkerTimeout):
+            self.worker.run(sleep, 10)
+
+        # A new worker is started for the next call
+        self.assertEqual(self.worker.run(add, 2, 2), 4)
+
+    def test_crash(self):
+        with self.assertRaises(WorkerCrashed):
+            self.worker.run(segfault)
+
+        self.assertEqual(self.worker.run(add, 3, 2), 5)
+
+    def test_error_in_function(self):
+        with self.assertRaises(RuntimeError) as cm:
+            self.worker.run(fail)
+
+        self.assertIn("ValueError: bad file", str(cm.exception))
+
+        # The worker survives errors raised by the function
+        pid = self.worker.run(get_pid)
+        self.worker.run(add, 1, 1)
+        self.assertEqual(self.worker.run(get_pid), pid)
+
+    def test_initializer(self):
+        worker = SandboxWorker(initializer=initialise, initargs=("ready",), timeout=5)
+        self.addCleanup(worker.close)
+
+        self.assertEqual(worker.run(get_initialised), "ready")
+
+    def test_memory_limit(self):
+        self.worker.memory_limit = 512 * 1024 * 1024
+
+        with self.assertRaises(WorkerMemoryLimit):
+            self.worker.run(allocate, 1024 * 1024 * 1024)
+
+        self.assertEqual(self.worker.run(add, 1, 3), 4)
+
+    def test_recycled_after_max_tasks(self):
+        self.worker.max_tasks = 2
+
+        pids = [self.worker.run(get_pid) for _ in range(4)]
+
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertNotEqual(pids[0], os.getpid())
+
+
+class TestSandboxPool(unittest.TestCase):
+
+    def test_submit(self):
+        with SandboxPool(2, timeout=5) as pool:
+            futures = [pool.submit(add, i, i) for i in range(10)]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, [i * 2 for i in range(10)])
+
+    def test_failure_is_set_on_future(self):
+        with SandboxPool(2, timeout=5) as pool:
+            crashed = pool.submit(segfault)
+            ok = pool.submit(add, 1, 1)
+
+            self.assertRaises(WorkerCrashed, crashed.result)
+            self.assertEqual(ok.result(), 2)
+
+    def test_workers_share_context(self):
+        with SandboxPool(2, timeout=5) as pool:
+            self.assertEqual(pool.context.get_start_method(), "forkserver")
+            self.assertIs(pool.worker_kwargs["context"], pool.context)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+# encoding: utf-8
+"""
+Tests for finding the spot of a file from the spot paths.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import fbs.proc.common_util.util as util
+from fbs.proc.common_util.spot_mapping import SpotLookup, SpotMapping
+from fbs.proc.extract import ExtractSeq
+
+PATH2SPOT = {
+    "/badc/cmip5/data": "spot-cmip5",
+    "/badc/cmip5/data/output1": "spot-cmip5-output1",
+    "/neodc/sentinel1a": "spot-s1a",
+}
+
+
+class TestSpotLookup(unittest.TestCase):
+
+    def setUp(self):
+        self.lookup = SpotLookup(PATH2SPOT)
+
+    def test_longest_prefix(self):
+        self.assertEqual(self.lookup.get_spot("/badc/cmip5/data/output1/a/b.nc"), "spot-cmip5-output1")
+        self.assertEqual(self.lookup.get_spot("/badc/cmip5/data/output2/b.nc"), "spot-cmip5")
+        self.assertEqual(self.lookup.get_spot("/neodc/sentinel1a/x.zip"), "spot-s1a")
+
+    def test_spot_directory(self):
+        self.assertEqual(self.lookup.get_spot("/badc/cmip5/data/output1"), "spot-cmip5-output1")
+        self.assertEqual(self.lookup.get_spot("/badc/cmip5/data/output1/"), "spot-cmip5-output1")
+
+    def test_no_spot(self):
+        self.assertIsNone(self.lookup.get_spot("/badc/other/file.nc"))
+        self.assertIsNone(self.lookup.get_spot("/badc/cmip5/dat/file.nc"))
+        self.assertIsNone(self.lookup.get_spot("/file.nc"))
+
+    def test_directories_remembered(self):
+        for name in ("a.nc", "b.nc", "c.nc"):
+            self.lookup.get_spot("/badc/cmip5/data/output2/" + name)
+
+        info = self.lookup._directory.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 2)
+
+    def test_spots_below(self):
+        self.assertTrue(self.lookup.has_spots_below("/badc/cmip5"))
+        self.assertTrue(self.lookup.has_spots_below("/badc/cmip5/data"))
+        self.assertFalse(self.lookup.has_spots_below("/badc/cmip5/data/output1"))
+        self.assertFalse(self.lookup.has_spots_below("/badc/other"))
+
+
+class TestSpotSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.directory, "ceda_all_datasets.ini.snapshot")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        SpotMapping(path2spot=PATH2SPOT).write_snapshot(self.snapshot)
+        spots = SpotMapping.from_snapshot(self.snapshot, max_age=60)
+
+        self.assertEqual(spots.path2spotmapping, PATH2SPOT)
+        self.assertEqual(spots.get_archive_root("spot-s1a"), "/neodc/sentinel1a")
+        self.assertEqual(spots.get_spot("/badc/cmip5/data/output1/a/b.nc"), "spot-cmip5-output1")
+        self.assertTrue(spots.has_spots_below("/badc/cmip5"))
+
+    def test_out_of_date(self):
+        SpotMapping(path2spot=PATH2SPOT).write_snapshot(self.snapshot)
+        time.sleep(0.05)
+
+        self.assertIsNone(SpotMapping.from_snapshot(self.snapshot, max_age=0.01))
+
+    def test_missing_or_broken(self):
+        self.assertIsNone(SpotMapping.from_snapshot(self.snapshot))
+
+        with open(self.snapshot, "wb") as writer:
+            writer.write(b"not a snapshot")
+
+        self.assertIsNone(SpotMapping.from_snapshot(self.snapshot))
+
+    def test_state_per_instance(self):
+        first = SpotMapping(path2spot={"/badc/a": "spot-a"})
+        second = SpotMapping(path2spot={"/badc/b": "spot-b"})
+
+        self.assertEqual(list(first), ["spot-a"])
+        self.assertIsNone(second.get_spot("/badc/a/file.nc"))
+
+
+class TestListSpot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "dataset.txt")
+
+        with open(self.filename, "w") as writer:
+            writer.writelines("/neodc/sentinel1a/{}.zip\n".format(i) for i in range(10))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spot_kept_in_index(self):
+        util.write_list_index(self.filename, extra={"spot": "spot-s1a"})
+        header, _ = util.read_list_index(self.filename)
+
+        self.assertEqual(header["spot"], "spot-s1a")
+        self.assertEqual(header["lines"], 10)
+
+    def extractor(self, dataset_dir):
+        snapshot = os.path.join(self.directory, "ceda_all_datasets.ini.snapshot")
+        extract = ExtractSeq({
+            "es-configuration": {"es-index": "test"},
+            "core": {"spot-snapshot": snapshot}
+        })
+        extract.logger = logging.getLogger(__name__)
+        extract.dataset_dir = dataset_dir
+
+        return extract, snapshot
+
+    def test_list_spot_from_snapshot(self):
+        extract, snapshot = self.extractor("/neodc/sentinel1a/data")
+        SpotMapping(path2spot=PATH2SPOT).write_snapshot(snapshot)
+
+        self.assertEqual(extract._dataset_spot(), "spot-s1a")
+
+    def test_no_list_spot_without_snapshot(self):
+        extract, _ = self.extractor("/neodc/sentinel1a/data")
+
+        self.assertIsNone(extract._dataset_spot())
+        self.assertFalse(extract._spots.ready)
+
+    def test_snapshot_next_to_datasets_ini(self):
+        datasets_ini = os.path.join(self.directory, "ceda_all_datasets.ini")
+        SpotMapping(path2spot=PATH2SPOT).write_snapshot(datasets_ini + ".snapshot")
+
+        extract = ExtractSeq({
+            "es-configuration": {"es-index": "test"},
+            "filename": datasets_ini,
+            "dataset": "neodc__sentinel1a"
+        })
+        extract.logger = logging.getLogger(__name__)
+        extract.dataset_dir = "/neodc/sentinel1a"
+
+        self.assertEqual(extract._dataset_spot(), "spot-s1a")
+
+    def test_snapshot_recorded_with_list(self):
+        snapshot = os.path.join(self.directory, "ceda_all_datasets.ini.snapshot")
+        util.write_list_index(self.filename, extra={"spot-snapshot": snapshot})
+
+        extract = ExtractSeq({"es-configuration": {"es-index": "test"}, "filename": self.filename})
+        extract.list_spot_snapshot = util.read_list_index(self.filename)[0]["spot-snapshot"]
+
+        self.assertEqual(extract._spot_snapshot_path(), snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# encoding: utf-8
+"""
+Tests for the multi-threaded directory walker.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fbs.proc.common_util.walker import DirectoryWalker, walk_files
+import fbs.proc.common_util.util as util
+
+
+class TestDirectoryWalker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.expected = []
+
+        for i in range(5):
+            for j in range(4):
+                directory = os.path.join(self.tmp_dir, "dir_{}".format(i), "sub_{}".format(j))
+                os.makedirs(directory)
+
+                for k in range(3):
+                    path = os.path.join(directory, "file_{}.nc".format(k))
+                    open(path, "w").close()
+                    self.expected.append(path)
+
+        open(os.path.join(self.tmp_dir, ".hidden"), "w").close()
+        top_file = os.path.join(self.tmp_dir, "top.txt")
+        open(top_file, "w").close()
+        self.expected.append(top_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_all_files_found(self):
+        for threads in (1, 4):
+            self.assertEqual(sorted(walk_files(self.tmp_dir, threads=threads)), sorted(self.expected))
+
+    def test_build_file_list(self):
+        self.assertEqual(sorted(util.build_file_list(self.tmp_dir)), sorted(self.expected))
+
+    def test_entries_returned(self):
+        entries = list(DirectoryWalker(threads=2).walk(self.tmp_dir))
+
+        self.assertTrue(all(isinstance(entry, os.DirEntry) for entry in entries))
+        self.assertEqual(len(entries), len(self.expected))
+
+    def test_symlinks(self):
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        open(os.path.join(outside, "linked.nc"), "w").close()
+
+        os.symlink(outside, os.path.join(self.tmp_dir, "link_dir"))
+        # A loop back to the top of the tree
+        os.symlink(self.tmp_dir, os.path.join(self.tmp_dir, "dir_0", "loop"))
+        os.symlink(self.expected[0], os.path.join(self.tmp_dir, "link_file.nc"))
+
+        not_followed = list(walk_files(self.tmp_dir, threads=3))
+        self.assertEqual(len(not_followed), len(self.expected) + 1)
+        self.assertIn(os.path.join(self.tmp_dir, "link_file.nc"), not_followed)
+
+        followed = list(walk_files(self.tmp_dir, threads=3, follow_symlinks=True))
+        self.assertEqual(len(followed), len(self.expected) + 2)
+        self.assertIn(os.path.join(self.tmp_dir, "link_dir", "linked.nc"), followed)
+
+    def test_stop_early(self):
+        files = walk_files(self.tmp_dir, threads=4)
+        first = [next(files) for _ in range(3)]
+        files.close()
+
+        self.assertEqual(len(first), 3)
+
+    def test_missing_directory(self):
+        self.assertEqual(list(walk_files(os.path.join(self.tmp_dir, "missing"))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()